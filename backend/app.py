@@ -1,42 +1,77 @@
 # backend/app.py
+import datetime
 import sqlite3
-import bcrypt
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
 import os 
 import requests
+from concurrent.futures import TimeoutError as FuturesTimeout
+
+import archivo
+import auditoria
+import autenticacion
+import db
+import eventos
+import idempotencia
+import importacion
+import metricas
+import planificador
+import replicas
+import respaldos
+import resumenes
+import tipos_cambio
+import totales
+import transiciones
+from autenticacion import autenticado
+from db import DATABASE_PATH, init_db, get_db_connection
+from idempotencia import idempotente
+from busqueda import fts_query
+from cache_catalogos import cache as catalogos_cache, respuesta_condicional
+from contrasenas import PoolSaturado, hash_ficticio, hasher as hasher_contrasenas, necesita_rehash
+from paginacion import CursorInvalido, decode_cursor, encode_cursor, parse_limite, stream_response
+from respuestas import CamposInvalidos, Proyeccion, campos_pedidos, consultar, respuesta_json
 
 
 app = Flask(__name__)
-CORS(app)
-
-DATABASE_PATH = '../database/pagos.db'
-
-# --- CONFIGURACIÓN DE LA BASE DE DATOS PARA RENDER ---
-# Render nos da un disco persistente en /var/data
-# Usamos una variable de entorno para la ruta, con un valor local por defecto.
-DATABASE_PATH = os.path.join(os.environ.get('RENDER_DISK_PATH', '..'), 'database', 'pagos.db')
-SCHEMA_PATH = os.path.join(os.path.dirname(__file__), '..', 'database', 'schema.sql')
-
-def init_db():
-    """Inicializa la base de datos si no existe."""
-    db_dir = os.path.dirname(DATABASE_PATH)
-    if not os.path.exists(db_dir):
-        os.makedirs(db_dir)
-
-    if not os.path.exists(DATABASE_PATH):
-        print("Creando la base de datos...")
-        conn = sqlite3.connect(DATABASE_PATH)
-        with open(SCHEMA_PATH, 'r') as f:
-            conn.executescript(f.read())
-        conn.commit()
-        conn.close()
-        print("Base de datos creada exitosamente.")
-
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+CORS(app, expose_headers=[*replicas.ENCABEZADOS, idempotencia.ENCABEZADO_REPETIDA])
+db.init_app(app)
+replicas.init_app(app)
+app.cli.add_command(resumenes.cli)
+app.cli.add_command(archivo.cli)
+app.cli.add_command(replicas.cli)
+app.cli.add_command(respaldos.cli)
+if os.environ.get('METRICAS', '1') == '1':
+    metricas.init_app(app)
+
+# Tamaño de página cuando se envía un cursor sin límite
+LIMITE_POR_DEFECTO = 100
+
+# Consultas de los catálogos que se guardan en la caché (también las usa el
+# calentamiento de arranque.py)
+CONSULTAS_CATALOGOS = {
+    'monedas': "SELECT id_moneda, codigo_moneda, nombre_moneda, tipo_cambio, ultima_actualizacion FROM monedas ORDER BY nombre_moneda",
+    'tipos_pago': "SELECT id_tipo_pago, nombre_tipo, siglas FROM tipos_pago ORDER BY nombre_tipo",
+    'tipos_devolucion': "SELECT * FROM tipos_devolucion ORDER BY nombre_devolucion",
+}
+
+# Segundos que /api/exchange/update espera a la actualización antes de responder 202
+ESPERA_TIPOS_CAMBIO = 15
+
+# Máximo de ?dias= en /api/ordenes/enviadas/por_vencer (cien años)
+MAXIMO_DIAS = 36500
+
+actualizador_tasas = tipos_cambio.ActualizadorTasas(al_actualizar=lambda: catalogos_cache.invalidar('monedas'))
+
+
+@app.before_request
+def iniciar_tareas_de_fondo():
+    # Se llama en cada request pero solo arranca el hilo si no está corriendo
+    # (por ejemplo, en cada worker nuevo de Gunicorn después del fork).
+    actualizador_tasas.iniciar_programador()
+    eventos.difusor.iniciar()
+    replicas.refrescador.iniciar()
+    planificador.planificador.iniciar()
+    idempotencia.barredor.iniciar()
 
 # --- RUTAS DE AUTENTICACIÓN (SIMPLIFICADAS) ---
 @app.route('/api/auth/register', methods=['POST'])
@@ -45,7 +80,10 @@ def register():
     nombre, apellido, email, password, id_rol = data.get('nombre'), data.get('apellido'), data.get('email'), data.get('password'), data.get('id_rol')
     if not all([nombre, apellido, email, password, id_rol]):
         return jsonify({"error": "Faltan datos"}), 400
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    try:
+        hashed_password = hasher_contrasenas.hash(password)
+    except PoolSaturado:
+        return jsonify({"error": "El servidor está ocupado, intente de nuevo"}), 503
     conn = get_db_connection()
     try:
         conn.execute("INSERT INTO usuarios (nombre, apellido, email, password_hash, id_rol) VALUES (?, ?, ?, ?, ?)", (nombre, apellido, email, hashed_password, id_rol))
@@ -62,27 +100,75 @@ def login():
     email, password = data.get('email'), data.get('password')
     if not email or not password:
         return jsonify({"error": "Faltan correo o contraseña"}), 400
+    user = autenticacion.buscar_por_email(email)
+    # Sin usuario se verifica igual contra un hash ficticio, para que un
+    # correo inexistente no responda más rápido que uno registrado
+    password_hash = user['password_hash'] if user else hash_ficticio()
+    try:
+        password_valida = hasher_contrasenas.verificar(password, password_hash) and user is not None
+    except PoolSaturado:
+        return jsonify({"error": "El servidor está ocupado, intente de nuevo"}), 503
+    if password_valida and necesita_rehash(user['password_hash']):
+        # Cambió BCRYPT_ROUNDS: aprovechamos que tenemos la contraseña en
+        # claro para guardar el hash con el costo nuevo.
+        try:
+            autenticacion.guardar_hash(user['id_usuario'], hasher_contrasenas.hash(password))
+        except PoolSaturado:
+            pass  # se intentará en el próximo inicio de sesión
+    cuerpo, estado = autenticacion.resultado_login(user, password_valida)
+    return jsonify(cuerpo), estado
+
+@app.route('/api/auth/yo', methods=['GET'])
+@autenticado(obligatoria=True)
+def get_usuario_actual():
+    """Datos del usuario del token (desde la caché de usuarios del worker)."""
+    usuario = g.usuario
+    return jsonify({campo: usuario[campo] for campo in ('id_usuario', 'nombre', 'apellido', 'email', 'id_rol', 'nombre_rol')}), 200
+
+@app.route('/api/auth/renovar', methods=['POST'])
+@autenticado(obligatoria=True)
+def renovar_token():
+    """Token nuevo para un token todavía vigente, sin volver a pedir la contraseña."""
+    token, expira_en = autenticacion.emitir_token(g.usuario)
+    return jsonify({"token": token, "expira_en": expira_en}), 200
+
+@app.route('/api/usuarios/<int:id_usuario>', methods=['PUT'])
+@autenticado('Administrador', obligatoria=True)
+def update_usuario(id_usuario):
+    """Cambia el rol o activa/desactiva un usuario. Los tokens que ya tenga
+    dejan de valer en cuanto las cachés de usuarios ven la versión nueva."""
+    data = request.get_json() or {}
+    cambios = {campo: data[campo] for campo in ('id_rol', 'activo') if campo in data}
+    if not cambios:
+        return jsonify({"error": "Nada que actualizar (id_rol o activo)"}), 400
+    if 'id_rol' in cambios and cambios['id_rol'] not in autenticacion.ROLES:
+        return jsonify({"error": "Rol inexistente"}), 400
+    if 'activo' in cambios:
+        cambios['activo'] = 1 if cambios['activo'] else 0
     conn = get_db_connection()
-    user = conn.execute("SELECT * FROM usuarios WHERE email = ?", (email,)).fetchone()
-    conn.close()
-    if not user:
-        return jsonify({"error": "Credenciales inválidas"}), 401
-    if bcrypt.checkpw(password.encode('utf-8'), user['password_hash']):
-        user_data = {"id_usuario": user['id_usuario'], "nombre": user['nombre'], "apellido": user['apellido'], "email": user['email'], "id_rol": user['id_rol']}
-        return jsonify({"message": "Inicio de sesión exitoso", "user": user_data}), 200
-    else:
-        return jsonify({"error": "Credenciales inválidas"}), 401
+    try:
+        asignaciones = ", ".join(f"{campo} = ?" for campo in cambios)
+        cursor = conn.execute(f"UPDATE usuarios SET {asignaciones} WHERE id_usuario = ?", (*cambios.values(), id_usuario))
+        if cursor.rowcount == 0:
+            return jsonify({"error": "Usuario no encontrado"}), 404
+        auditoria.registrar(conn, g.usuario['id_usuario'], 'EDITAR_USUARIO', None,
+                            ", ".join(f"{campo}={valor}" for campo, valor in cambios.items()) + f" (usuario {id_usuario})")
+        conn.commit()
+    finally:
+        conn.close()
+    autenticacion.cache.invalidar(id_usuario)
+    return jsonify({"message": "Usuario actualizado exitosamente"}), 200
 
 # --- RUTAS CRUD PARA CATÁLOGO DE MONEDAS ---
 @app.route('/api/catalogos/monedas', methods=['GET'])
 def get_monedas():
     conn = get_db_connection()
-    monedas_cursor = conn.execute("SELECT id_moneda, codigo_moneda, nombre_moneda, tipo_cambio, ultima_actualizacion FROM monedas ORDER BY nombre_moneda").fetchall()
+    entrada = catalogos_cache.obtener(conn, 'monedas', CONSULTAS_CATALOGOS['monedas'])
     conn.close()
-    monedas = [dict(row) for row in monedas_cursor]
-    return jsonify(monedas), 200
+    return respuesta_condicional('monedas', entrada)
 
 @app.route('/api/catalogos/monedas', methods=['POST'])
+@autenticado('Administrador')
 def add_moneda():
     data = request.get_json()
     nombre_moneda, codigo_moneda, tipo_cambio = data.get('nombre_moneda'), data.get('codigo_moneda'), data.get('tipo_cambio')
@@ -93,6 +179,7 @@ def add_moneda():
         cursor = conn.cursor()
         cursor.execute("INSERT INTO monedas (nombre_moneda, codigo_moneda, tipo_cambio) VALUES (?, ?, ?)", (nombre_moneda, codigo_moneda, tipo_cambio))
         conn.commit()
+        catalogos_cache.invalidar('monedas')
         new_moneda_id = cursor.lastrowid
         new_moneda = conn.execute("SELECT * FROM monedas WHERE id_moneda = ?", (new_moneda_id,)).fetchone()
         return jsonify(dict(new_moneda)), 201
@@ -102,6 +189,7 @@ def add_moneda():
         conn.close()
 
 @app.route('/api/catalogos/monedas/<int:id_moneda>', methods=['PUT'])
+@autenticado('Administrador')
 def update_moneda(id_moneda):
     data = request.get_json()
     nombre_moneda, codigo_moneda, tipo_cambio = data.get('nombre_moneda'), data.get('codigo_moneda'), data.get('tipo_cambio')
@@ -111,6 +199,7 @@ def update_moneda(id_moneda):
     try:
         conn.execute("UPDATE monedas SET nombre_moneda = ?, codigo_moneda = ?, tipo_cambio = ?, ultima_actualizacion = CURRENT_TIMESTAMP WHERE id_moneda = ?", (nombre_moneda, codigo_moneda, tipo_cambio, id_moneda))
         conn.commit()
+        catalogos_cache.invalidar('monedas')
         updated_moneda = conn.execute("SELECT * FROM monedas WHERE id_moneda = ?", (id_moneda,)).fetchone()
         return jsonify(dict(updated_moneda)), 200
     except sqlite3.IntegrityError:
@@ -119,22 +208,24 @@ def update_moneda(id_moneda):
         conn.close()
 
 @app.route('/api/catalogos/monedas/<int:id_moneda>', methods=['DELETE'])
+@autenticado('Administrador')
 def delete_moneda(id_moneda):
     conn = get_db_connection()
     conn.execute("DELETE FROM monedas WHERE id_moneda = ?", (id_moneda,))
     conn.commit()
+    catalogos_cache.invalidar('monedas')
     conn.close()
     return jsonify({"message": "Moneda eliminada exitosamente"}), 200
 
 @app.route('/api/catalogos/tipos_pago', methods=['GET'])
 def get_tipos_pago():
     conn = get_db_connection()
-    tipos_pago_cursor = conn.execute("SELECT id_tipo_pago, nombre_tipo, siglas FROM tipos_pago ORDER BY nombre_tipo").fetchall()
+    entrada = catalogos_cache.obtener(conn, 'tipos_pago', CONSULTAS_CATALOGOS['tipos_pago'])
     conn.close()
-    tipos_pago = [dict(row) for row in tipos_pago_cursor]
-    return jsonify(tipos_pago), 200
+    return respuesta_condicional('tipos_pago', entrada)
 
 @app.route('/api/catalogos/tipos_pago', methods=['POST'])
+@autenticado('Administrador')
 def add_tipo_pago():
     data = request.get_json()
     nombre_tipo, siglas = data.get('nombre_tipo'), data.get('siglas')
@@ -145,6 +236,7 @@ def add_tipo_pago():
         cursor = conn.cursor()
         cursor.execute("INSERT INTO tipos_pago (nombre_tipo, siglas) VALUES (?, ?)", (nombre_tipo, siglas))
         conn.commit()
+        catalogos_cache.invalidar('tipos_pago')
         new_id = cursor.lastrowid
         new_tipo_pago = conn.execute("SELECT * FROM tipos_pago WHERE id_tipo_pago = ?", (new_id,)).fetchone()
         return jsonify(dict(new_tipo_pago)), 201
@@ -154,6 +246,7 @@ def add_tipo_pago():
         conn.close()
 
 @app.route('/api/catalogos/tipos_pago/<int:id_tipo_pago>', methods=['PUT'])
+@autenticado('Administrador')
 def update_tipo_pago(id_tipo_pago):
     data = request.get_json()
     nombre_tipo, siglas = data.get('nombre_tipo'), data.get('siglas')
@@ -163,6 +256,7 @@ def update_tipo_pago(id_tipo_pago):
     try:
         conn.execute("UPDATE tipos_pago SET nombre_tipo = ?, siglas = ? WHERE id_tipo_pago = ?", (nombre_tipo, siglas, id_tipo_pago))
         conn.commit()
+        catalogos_cache.invalidar('tipos_pago')
         updated_tipo_pago = conn.execute("SELECT * FROM tipos_pago WHERE id_tipo_pago = ?", (id_tipo_pago,)).fetchone()
         return jsonify(dict(updated_tipo_pago)), 200
     except sqlite3.IntegrityError:
@@ -171,11 +265,13 @@ def update_tipo_pago(id_tipo_pago):
         conn.close()
 
 @app.route('/api/catalogos/tipos_pago/<int:id_tipo_pago>', methods=['DELETE'])
+@autenticado('Administrador')
 def delete_tipo_pago(id_tipo_pago):
     conn = get_db_connection()
     try:
         conn.execute("DELETE FROM tipos_pago WHERE id_tipo_pago = ?", (id_tipo_pago,))
         conn.commit()
+        catalogos_cache.invalidar('tipos_pago')
     except sqlite3.IntegrityError:
         # Esto ocurrirá si una orden de pago existente está usando este tipo de pago.
         return jsonify({"error": "No se puede eliminar el tipo de pago porque está en uso"}), 409
@@ -190,12 +286,12 @@ def delete_tipo_pago(id_tipo_pago):
 @app.route('/api/catalogos/tipos_devolucion', methods=['GET'])
 def get_tipos_devolucion():
     conn = get_db_connection()
-    tipos_dev_cursor = conn.execute("SELECT * FROM tipos_devolucion ORDER BY nombre_devolucion").fetchall()
+    entrada = catalogos_cache.obtener(conn, 'tipos_devolucion', CONSULTAS_CATALOGOS['tipos_devolucion'])
     conn.close()
-    tipos_devolucion = [dict(row) for row in tipos_dev_cursor]
-    return jsonify(tipos_devolucion), 200
+    return respuesta_condicional('tipos_devolucion', entrada)
 
 @app.route('/api/catalogos/tipos_devolucion', methods=['POST'])
+@autenticado('Administrador')
 def add_tipo_devolucion():
     data = request.get_json()
     nombre_devolucion, descripcion = data.get('nombre_devolucion'), data.get('descripcion')
@@ -206,6 +302,7 @@ def add_tipo_devolucion():
         cursor = conn.cursor()
         cursor.execute("INSERT INTO tipos_devolucion (nombre_devolucion, descripcion) VALUES (?, ?)", (nombre_devolucion, descripcion))
         conn.commit()
+        catalogos_cache.invalidar('tipos_devolucion')
         new_id = cursor.lastrowid
         new_tipo_dev = conn.execute("SELECT * FROM tipos_devolucion WHERE id_tipo_devolucion = ?", (new_id,)).fetchone()
         return jsonify(dict(new_tipo_dev)), 201
@@ -215,6 +312,7 @@ def add_tipo_devolucion():
         conn.close()
 
 @app.route('/api/catalogos/tipos_devolucion/<int:id_tipo_devolucion>', methods=['PUT'])
+@autenticado('Administrador')
 def update_tipo_devolucion(id_tipo_devolucion):
     data = request.get_json()
     nombre_devolucion, descripcion = data.get('nombre_devolucion'), data.get('descripcion')
@@ -223,93 +321,120 @@ def update_tipo_devolucion(id_tipo_devolucion):
     conn = get_db_connection()
     conn.execute("UPDATE tipos_devolucion SET nombre_devolucion = ?, descripcion = ? WHERE id_tipo_devolucion = ?", (nombre_devolucion, descripcion, id_tipo_devolucion))
     conn.commit()
+    catalogos_cache.invalidar('tipos_devolucion')
     updated_tipo_dev = conn.execute("SELECT * FROM tipos_devolucion WHERE id_tipo_devolucion = ?", (id_tipo_devolucion,)).fetchone()
     conn.close()
     return jsonify(dict(updated_tipo_dev)), 200
 
 @app.route('/api/catalogos/tipos_devolucion/<int:id_tipo_devolucion>', methods=['DELETE'])
+@autenticado('Administrador')
 def delete_tipo_devolucion(id_tipo_devolucion):
     conn = get_db_connection()
     conn.execute("DELETE FROM tipos_devolucion WHERE id_tipo_devolucion = ?", (id_tipo_devolucion,))
     conn.commit()
+    catalogos_cache.invalidar('tipos_devolucion')
     conn.close()
     return jsonify({"message": "Tipo de devolución eliminado exitosamente"}), 200
 
 @app.route('/api/reportes/summary', methods=['GET'])
 def get_report_summary():
-    conn = get_db_connection()
-
-    # Reporte 1: Pagos generados por cada coordinador
-    pagos_por_coordinador = conn.execute("""
-        SELECT u.nombre || ' ' || u.apellido as coordinador, COUNT(o.id_orden) as total_ordenes
-        FROM ordenes_pago o
-        JOIN usuarios u ON o.id_coordinador = u.id_usuario
-        GROUP BY o.id_coordinador
-    """).fetchall()
-
-    # Reporte 2: Pagos revisados por cada analista (basado en la bitácora)
-    pagos_por_analista = conn.execute("""
-        SELECT u.nombre || ' ' || u.apellido as analista, COUNT(b.id_bitacora) as total_acciones
-        FROM bitacora b
-        JOIN usuarios u ON b.id_usuario_accion = u.id_usuario
-        WHERE b.accion IN ('PAGAR_ORDEN', 'DEVOLVER_ORDEN')
-        GROUP BY b.id_usuario_accion
-    """).fetchall()
-
-    # Reporte 3: Reporte por tipo de pago
-    reporte_tipo_pago = conn.execute("""
-        SELECT tp.nombre_tipo, COUNT(o.id_orden) as total
-        FROM ordenes_pago o
-        JOIN tipos_pago tp ON o.id_tipo_pago = tp.id_tipo_pago
-        GROUP BY tp.nombre_tipo
-    """).fetchall()
-
-    # Reporte 4: Cantidad total de pagos realizados
-    total_pagos_realizados = conn.execute("SELECT COUNT(*) as total FROM ordenes_pago WHERE estado = 'Pagada'").fetchone()
-
+    """Resumen para el dashboard, leído de las tablas de contadores."""
+    conn = replicas.conexion_lectura()
+    summary = resumenes.obtener_resumen(conn)
     conn.close()
+    return jsonify(summary), 200
 
-    summary = {
-        "pagos_por_coordinador": [dict(row) for row in pagos_por_coordinador],
-        "pagos_por_analista": [dict(row) for row in pagos_por_analista],
-        "reporte_tipo_pago": [dict(row) for row in reporte_tipo_pago],
-        "total_pagos_realizados": dict(total_pagos_realizados)
-    }
+@app.route('/api/reportes/totales', methods=['GET'])
+def get_reporte_totales():
+    """Totales netos a pagar convertidos a una moneda (ver totales.py).
+
+    Parámetros opcionales:
+      - moneda: código de la moneda destino (USD).
+      - agrupar=coordinador,tipo_pago,acreedor,estado,moneda,vencimiento (estado).
+      - estado=Creada,Enviada: solo esos estados (la exposición pendiente).
+      - desde / hasta (AAAA-MM-DD): rango de fecha_creacion, con los meses archivados.
+      - al (AAAA-MM-DD): fecha de corte de los tramos de vencimiento (hoy).
+      - formato=csv: los grupos como CSV.
+      - detalle=csv|ndjson: exporta cada orden con su neto convertido, por partes.
+    """
+    formato_detalle = request.args.get('detalle')
+    if formato_detalle and formato_detalle not in ('csv', 'ndjson'):
+        return jsonify({"error": "Formato de detalle no soportado"}), 400
+    try:
+        parametros = totales.Parametros(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    return jsonify(summary), 200
+    conn = replicas.conexion_lectura()
+    try:
+        if formato_detalle:
+            return totales.exportar_detalle(conn, parametros, formato_detalle)
+        reporte = totales.calcular(conn, parametros)
+    except totales.ParametrosInvalidos as e:
+        conn.close()
+        return jsonify({"error": str(e)}), 400
+    conn.close()
+    if request.args.get('formato') == 'csv':
+        return Response(totales.csv_grupos(reporte), mimetype='text/csv',
+                        headers={'Content-Disposition': 'attachment; filename="totales.csv"'})
+    return respuesta_json(reporte)
 
 @app.route('/api/exchange/update', methods=['POST'])
 def update_exchange_rates():
-    # URL de la API gratuita. La base es USD.
-    api_url = "https://open.er-api.com/v6/latest/USD"
+    """Pide una actualización de tipos de cambio al hilo de segundo plano.
 
+    Usa la última tabla descargada si no venció su TTL (?forzar=1 la ignora).
+    Si la actualización tarda más de unos segundos se responde 202 y termina
+    en segundo plano.
+    """
+    futuro = actualizador_tasas.solicitar(forzar=request.args.get('forzar') == '1')
     try:
-        response = requests.get(api_url)
-        response.raise_for_status() # Lanza un error si la petición no fue exitosa (ej. 404, 500)
-        data = response.json()
-
-        if data.get("result") == "success":
-            rates = data.get("rates")
-            conn = get_db_connection()
-            cursor = conn.cursor()
-
-            # Actualizamos cada moneda que tenemos en nuestra BD con el valor de la API
-            for codigo, valor in rates.items():
-                cursor.execute(
-                    "UPDATE monedas SET tipo_cambio = ?, ultima_actualizacion = CURRENT_TIMESTAMP WHERE codigo_moneda = ?",
-                    (valor, codigo)
-                )
-
-            conn.commit()
-            conn.close()
-            return jsonify({"message": "Tipos de cambio actualizados exitosamente"}), 200
-        else:
-            return jsonify({"error": "La respuesta de la API externa no fue exitosa"}), 500
-
+        actualizadas = futuro.result(timeout=ESPERA_TIPOS_CAMBIO)
+    except FuturesTimeout:
+        return jsonify({"message": "La actualización de tipos de cambio sigue en curso"}), 202
     except requests.exceptions.RequestException as e:
         return jsonify({"error": "Error al conectar con el servicio de tipos de cambio", "details": str(e)}), 503
+    except tipos_cambio.ErrorProveedor as e:
+        return jsonify({"error": str(e)}), 500
     except Exception as e:
         return jsonify({"error": "Ocurrió un error inesperado", "details": str(e)}), 500
+    return jsonify({"message": "Tipos de cambio actualizados exitosamente", "monedas_actualizadas": actualizadas}), 200
+
+@app.route('/api/sistema/db_stats', methods=['GET'])
+def get_db_stats():
+    """Estadísticas del pool de conexiones de este worker."""
+    return jsonify(db.pool.stats()), 200
+
+@app.route('/api/sistema/bitacora_stats', methods=['GET'])
+def get_bitacora_stats():
+    """Estado del escritor diferido de la bitácora de este worker."""
+    return jsonify(auditoria.escritor.stats()), 200
+
+@app.route('/api/sistema/eventos_stats', methods=['GET'])
+def get_eventos_stats():
+    """Suscriptores y mensajes del difusor de eventos de este worker."""
+    return jsonify(eventos.difusor.stats()), 200
+
+@app.route('/api/sistema/replicas_stats', methods=['GET'])
+def get_replicas_stats():
+    """Generación y atraso de las copias de lectura, y lecturas por origen en este worker."""
+    return jsonify(replicas.enrutador.stats()), 200
+
+@app.route('/api/sistema/planificador_stats', methods=['GET'])
+def get_planificador_stats():
+    """Tamaño de la cola de pagos en memoria, eventos aplicados y verificaciones de este worker."""
+    return jsonify(planificador.planificador.stats()), 200
+
+@app.route('/api/sistema/idempotencia_stats', methods=['GET'])
+def get_idempotencia_stats():
+    """Requests ejecutados y repetidos por clave de idempotencia en este worker."""
+    return jsonify(idempotencia.stats()), 200
+
+@app.route('/api/sistema/cache_stats', methods=['GET'])
+def get_cache_stats():
+    """Aciertos y fallos de las cachés de catálogos y de usuarios de este worker."""
+    return jsonify({**catalogos_cache.stats(), "usuarios": autenticacion.cache.stats()}), 200
+
 @app.route('/')
 def index():
     return jsonify({"message": "API del Sistema de Pagos funcionando!"})
@@ -317,10 +442,12 @@ def index():
 # --- RUTAS PARA ÓRDENES DE PAGO ---
 
 @app.route('/api/ordenes', methods=['POST'])
+@autenticado('Coordinador')
+@idempotente
 def create_orden():
     data = request.get_json()
-    # Obtenemos todos los campos del JSON
-    id_coordinador = data.get('id_coordinador')
+    # Obtenemos todos los campos del JSON (con token, el coordinador es el del token)
+    id_coordinador = autenticacion.id_usuario(data.get('id_coordinador'))
     monto = data.get('monto')
     id_moneda = data.get('id_moneda')
     id_tipo_pago = data.get('id_tipo_pago')
@@ -335,6 +462,11 @@ def create_orden():
 
     if not all([id_coordinador, monto, id_moneda, id_tipo_pago, fecha_factura, fecha_vencimiento]):
         return jsonify({"error": "Faltan datos para crear la orden"}), 400
+    try:
+        fecha_factura = importacion.fecha_iso(fecha_factura)
+        fecha_vencimiento = importacion.fecha_iso(fecha_vencimiento)
+    except ValueError:
+        return jsonify({"error": "Fecha inválida, se espera AAAA-MM-DD"}), 400
 
     conn = get_db_connection()
     try:
@@ -345,10 +477,7 @@ def create_orden():
             (monto, id_moneda, id_tipo_pago, fecha_factura, fecha_vencimiento, id_coordinador, urgente, impuesto, descuento, acreedor, documento_compensacion)
         )
         id_nueva_orden = cursor.lastrowid
-        cursor.execute(
-            "INSERT INTO bitacora (id_usuario_accion, accion, detalles, id_orden_afectada) VALUES (?, ?, ?, ?)",
-            (id_coordinador, 'CREAR_ORDEN', f'Se creó la orden con monto {monto}', id_nueva_orden)
-        )
+        auditoria.registrar(conn, id_coordinador, 'CREAR_ORDEN', id_nueva_orden, f'Se creó la orden con monto {monto}')
         conn.commit()
     except Exception as e:
         conn.rollback()
@@ -358,6 +487,31 @@ def create_orden():
 
     return jsonify({"message": "Orden de pago creada exitosamente"}), 201
 
+@app.route('/api/ordenes/importar', methods=['POST'])
+@autenticado('Coordinador')
+@idempotente(con_cuerpo=False)
+def importar_ordenes():
+    """Crea muchas órdenes de una vez (arreglo JSON, NDJSON o CSV).
+
+    Las filas inválidas se reportan y no detienen la importación. Con token
+    todas las órdenes quedan a nombre del usuario del token, aunque las filas
+    traigan otro id_coordinador; sin token, las filas que no lo traen usan el
+    de la URL (?id_coordinador=).
+    """
+    usuario = g.get('usuario')
+    conn = get_db_connection()
+    try:
+        resultados, insertadas, rechazadas = importacion.importar(
+            conn, importacion.leer_filas(request), request.args.get('id_coordinador'),
+            id_coordinador_forzado=usuario['id_usuario'] if usuario else None)
+    except importacion.ErrorFormato as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        conn.close()
+
+    status = 201 if insertadas else 400
+    return jsonify({"insertadas": insertadas, "rechazadas": rechazadas, "resultados": resultados}), status
+
 @app.route('/api/ordenes/<int:id_coordinador>', methods=['GET'])
 def get_ordenes_by_coordinador(id_coordinador):
     # Obtenemos los parámetros de filtro de la URL
@@ -388,27 +542,31 @@ def get_ordenes_by_coordinador(id_coordinador):
 
     base_query += " ORDER BY o.fecha_creacion DESC"
 
-    ordenes_cursor = conn.execute(base_query, tuple(params)).fetchall()
-    conn.close()
+    try:
+        cursor = consultar(conn, base_query, tuple(params))
+        proyeccion = Proyeccion(cursor, campos_pedidos(query_params))
+        ordenes = proyeccion.filas(cursor.fetchall())
+    except CamposInvalidos as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        conn.close()
 
-    ordenes = [dict(row) for row in ordenes_cursor]
-    return jsonify(ordenes), 200
+    return respuesta_json(ordenes)
 
 # Reemplaza la función enviar_orden existente con esta
 @app.route('/api/ordenes/<int:id_orden>/enviar', methods=['PUT'])
+@autenticado('Coordinador')
+@idempotente
 def enviar_orden(id_orden):
-    data = request.get_json()
-    id_usuario = data.get('id_usuario') # Obtenemos el ID del usuario que realiza la acción
+    data = request.get_json() or {}
+    id_usuario = autenticacion.id_usuario(data.get('id_usuario')) # Obtenemos el ID del usuario que realiza la acción
     if not id_usuario:
         return jsonify({"error": "No se identificó al usuario"}), 400
 
     conn = get_db_connection()
     try:
         conn.execute("UPDATE ordenes_pago SET estado = 'Enviada' WHERE id_orden = ?", (id_orden,))
-        conn.execute(
-            "INSERT INTO bitacora (id_usuario_accion, accion, id_orden_afectada) VALUES (?, ?, ?)",
-            (id_usuario, 'ENVIAR_ORDEN', id_orden)
-        )
+        auditoria.registrar(conn, id_usuario, 'ENVIAR_ORDEN', id_orden)
         conn.commit()
     except Exception as e:
         return jsonify({"error": "Error al actualizar la orden", "details": str(e)}), 500
@@ -432,15 +590,16 @@ def get_ordenes_enviadas():
         FROM ordenes_pago o
         JOIN monedas m ON o.id_moneda = m.id_moneda
         JOIN usuarios u ON o.id_coordinador = u.id_usuario
-        WHERE o.estado = 'Enviada'
     """
 
     params = []
-    # Añadir filtro de búsqueda
-    if search_term:
-        base_query += " AND (o.acreedor LIKE ? OR u.nombre LIKE ? OR u.apellido LIKE ?)"
-        like_term = f"%{search_term}%"
-        params.extend([like_term, like_term, like_term])
+    # Añadir filtro de búsqueda (índice de texto completo)
+    match = fts_query(search_term)
+    if match:
+        base_query += " JOIN ordenes_busqueda f ON f.rowid = o.id_orden WHERE f.ordenes_busqueda MATCH ? AND o.estado = 'Enviada'"
+        params.append(match)
+    else:
+        base_query += " WHERE o.estado = 'Enviada'"
 
     # Añadir filtro de urgencia
     if filter_urgente == 'si':
@@ -449,19 +608,121 @@ def get_ordenes_enviadas():
         base_query += " AND o.urgente = 0"
 
     base_query += " ORDER BY o.urgente DESC, o.fecha_vencimiento ASC"
+    if match:
+        # A igual prioridad, primero las que mejor coinciden con la búsqueda
+        base_query += ", f.rank"
 
-    ordenes_cursor = conn.execute(base_query, params).fetchall()
-    conn.close()
+    try:
+        cursor = consultar(conn, base_query, params)
+        proyeccion = Proyeccion(cursor, campos_pedidos(query_params))
+        ordenes = proyeccion.filas(cursor.fetchall())
+    except CamposInvalidos as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        conn.close()
 
-    ordenes = [dict(row) for row in ordenes_cursor]
-    return jsonify(ordenes), 200
+    return respuesta_json(ordenes)
+
+@app.route('/api/ordenes/enviadas/siguientes', methods=['GET'])
+def get_siguientes_a_pagar():
+    """Las próximas ?n= órdenes a pagar (10 por defecto): urgentes primero y
+    después por fecha de vencimiento, desde la cola en memoria (planificador.py)."""
+    try:
+        cantidad = int(request.args.get('n', '10'))
+    except ValueError:
+        return jsonify({"error": "n debe ser un número"}), 400
+    if cantidad < 1:
+        return jsonify({"error": "n debe ser mayor a cero"}), 400
+    cola = planificador.planificador.siguientes(min(cantidad, planificador.MAXIMO))
+    conn = get_db_connection()
+    try:
+        ordenes = planificador.ordenes(conn, [id_orden for id_orden, _, _ in cola], campos_pedidos(request.args))
+    except CamposInvalidos as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        conn.close()
+    return respuesta_json(ordenes)
+
+@app.route('/api/ordenes/enviadas/por_vencer', methods=['GET'])
+def get_por_vencer():
+    """Órdenes enviadas que vencen en los próximos ?dias= días (7 por defecto),
+    incluidas las ya vencidas, de la que vence antes a la que vence después.
+
+    Cada orden lleva "dias_para_vencer" (negativo si ya venció).
+    """
+    try:
+        dias = int(request.args.get('dias', '7'))
+    except ValueError:
+        return jsonify({"error": "dias debe ser un número"}), 400
+    if abs(dias) > MAXIMO_DIAS:
+        return jsonify({"error": f"dias fuera de rango (hasta {MAXIMO_DIAS})"}), 400
+    hoy = datetime.date.today()
+    cola = planificador.planificador.por_vencer(dias, hoy)
+    extra = {id_orden: {"dias_para_vencer": (datetime.date.fromisoformat(vencimiento) - hoy).days}
+             for id_orden, _, vencimiento in cola}
+    conn = get_db_connection()
+    try:
+        ordenes = planificador.ordenes(conn, [id_orden for id_orden, _, _ in cola], campos_pedidos(request.args), extra)
+    except CamposInvalidos as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        conn.close()
+    return respuesta_json(ordenes)
+
+@app.route('/api/ordenes/enviadas/eventos', methods=['GET'])
+def get_eventos_enviadas():
+    """Cola de órdenes enviadas por Server-Sent Events (ver eventos.py).
+
+    Empieza con un evento 'snapshot' y sigue con 'alta' / 'baja' / 'cambio'.
+    Para reanudar se usa el header Last-Event-ID o ?desde=<seq>.
+    """
+    desde = request.headers.get('Last-Event-ID') or request.args.get('desde')
+    try:
+        desde = int(desde) if desde else None
+    except ValueError:
+        return jsonify({"error": "El número de secuencia debe ser un entero"}), 400
+    try:
+        flujo = eventos.flujo_sse(desde)
+        primero = next(flujo)  # toma la suscripción ahora para poder responder 503
+    except eventos.Saturado as e:
+        return jsonify({"error": str(e)}), 503
+
+    def generar():
+        yield primero
+        yield from flujo
+
+    return Response(generar(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/ordenes/enviadas/cambios', methods=['GET'])
+def get_cambios_enviadas():
+    """Los mismos eventos que /eventos, por polling: ?desde=<seq>.
+
+    Devuelve {"seq": ..., "eventos": [...]} (hasta 500 por llamada); 410 si
+    ya no se puede reanudar desde ese seq y hay que volver a pedir la cola.
+    """
+    try:
+        desde = int(request.args.get('desde', ''))
+    except ValueError:
+        return jsonify({"error": "Se requiere ?desde=<seq>"}), 400
+    conn = get_db_connection()
+    try:
+        eventos.comprobar_seq(conn, desde)
+        cambios = eventos.eventos_desde(conn, desde)
+    except eventos.HistorialPerdido as e:
+        return jsonify({"error": str(e)}), 410
+    finally:
+        conn.close()
+    return respuesta_json({"seq": cambios[-1]["seq"] if cambios else desde, "eventos": cambios})
 
 @app.route('/api/ordenes/<int:id_orden>/devolver', methods=['PUT'])
+@autenticado('Analista')
+@idempotente
 def devolver_orden(id_orden):
     """Devuelve una orden, cambiando su estado a 'Devuelta'."""
-    data = request.get_json()
+    data = request.get_json() or {}
     motivo = data.get('motivo', 'Sin motivo especificado')
-    id_analista = data.get('id_analista')
+    id_analista = autenticacion.id_usuario(data.get('id_analista'))
 
     if not id_analista:
         return jsonify({"error": "Se requiere la identificación del analista"}), 400
@@ -472,10 +733,7 @@ def devolver_orden(id_orden):
         conn.execute("UPDATE ordenes_pago SET estado = 'Devuelta' WHERE id_orden = ?", (id_orden,))
         # Insertamos el registro en la tabla de devoluciones
         conn.execute("INSERT INTO devoluciones (id_orden, motivo, id_analista) VALUES (?, ?, ?)", (id_orden, motivo, id_analista))
-        conn.execute(
-        "INSERT INTO bitacora (id_usuario_accion, accion, detalles, id_orden_afectada) VALUES (?, ?, ?, ?)",
-        (id_analista, 'DEVOLVER_ORDEN', f'Motivo: {motivo}', id_orden)
-        )   
+        auditoria.registrar(conn, id_analista, 'DEVOLVER_ORDEN', id_orden, f'Motivo: {motivo}')
         conn.commit()
     except Exception as e:
         return jsonify({"error": "Error al devolver la orden", "details": str(e)}), 500
@@ -486,19 +744,18 @@ def devolver_orden(id_orden):
 
 # Reemplaza la función pagar_orden existente con esta
 @app.route('/api/ordenes/<int:id_orden>/pagar', methods=['PUT'])
+@autenticado('Analista')
+@idempotente
 def pagar_orden(id_orden):
-    data = request.get_json()
-    id_analista = data.get('id_analista')
+    data = request.get_json() or {}
+    id_analista = autenticacion.id_usuario(data.get('id_analista'))
     if not id_analista:
         return jsonify({"error": "No se identificó al analista"}), 400
 
     conn = get_db_connection()
     try:
         conn.execute("UPDATE ordenes_pago SET estado = 'Pagada', fecha_pago_real = CURRENT_DATE WHERE id_orden = ?", (id_orden,))
-        conn.execute(
-            "INSERT INTO bitacora (id_usuario_accion, accion, id_orden_afectada) VALUES (?, ?, ?)",
-            (id_analista, 'PAGAR_ORDEN', id_orden)
-        )
+        auditoria.registrar(conn, id_analista, 'PAGAR_ORDEN', id_orden)
         conn.commit()
     except Exception as e:
         return jsonify({"error": "Error al pagar la orden", "details": str(e)}), 500
@@ -507,20 +764,80 @@ def pagar_orden(id_orden):
 
     return jsonify({"message": "Orden marcada como pagada exitosamente"}), 200
 
+@app.route('/api/ordenes/lote/<accion>', methods=['PUT'])
+@autenticado('Coordinador', 'Analista')
+@idempotente
+def cambiar_estado_lote(accion):
+    """Enviar, pagar o devolver varias órdenes en una sola transacción.
+
+    Cuerpo: {"ids": [...], "id_usuario": ...} (enviar) o
+    {"ids": [...], "id_analista": ..., "motivo": ...} (pagar / devolver).
+    Las órdenes que no están en el estado correcto se informan en "omitidas".
+    """
+    if accion not in transiciones.TRANSICIONES:
+        return jsonify({"error": "Acción no válida"}), 404
+    if g.usuario and not autenticacion.permitido(g.usuario, ['Coordinador' if accion == 'enviar' else 'Analista']):
+        return jsonify({"error": "No tiene permiso para esta operación"}), 403
+    data = request.get_json() or {}
+    id_usuario = autenticacion.id_usuario(data.get('id_usuario') if accion == 'enviar' else data.get('id_analista'))
+    if not id_usuario:
+        return jsonify({"error": "No se identificó al usuario"}), 400
+    try:
+        ids = transiciones.normalizar_ids(data.get('ids'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = get_db_connection()
+    try:
+        procesadas, omitidas = transiciones.aplicar_lote(conn, accion, ids, id_usuario, data.get('motivo', 'Sin motivo especificado'))
+    except Exception as e:
+        return jsonify({"error": "Error al actualizar las órdenes", "details": str(e)}), 500
+    finally:
+        conn.close()
+
+    return jsonify({"procesadas": procesadas, "omitidas": omitidas}), 200
+
 # Añade esta nueva ruta en backend/app.py
 
 @app.route('/api/ordenes/historial', methods=['GET'])
 def get_historial_ordenes():
-    """Obtiene un historial completo de todas las órdenes, con filtros."""
+    """Obtiene un historial completo de todas las órdenes, con filtros.
+
+    Parámetros opcionales:
+      - limite / cursor: paginación por cursor sobre id_orden. La respuesta
+        pasa a ser {"datos": [...], "next_cursor": ...}.
+      - stream=json|ndjson: envía el resultado por partes, sin armarlo en memoria.
+        En este modo no se devuelve next_cursor (pensado para exportar todo).
+      - campos=a,b,c: solo esas columnas en cada orden (también ?fields=).
+      - desde / hasta (AAAA-MM-DD): rango de fecha_creacion. Con un rango se
+        consultan también los meses archivados (ver archivo.py).
+    """
     query_params = request.args
     search_term = query_params.get('buscar', '')
     filter_estado = query_params.get('estado', 'todos')
+    formato_stream = query_params.get('stream')
+    if formato_stream and formato_stream not in ('json', 'ndjson'):
+        return jsonify({"error": "Formato de stream no soportado"}), 400
+    cursor_param = query_params.get('cursor')
 
-    conn = get_db_connection()
+    try:
+        limite = parse_limite(query_params.get('limite'))
+        if cursor_param and limite is None:
+            limite = LIMITE_POR_DEFECTO
+        cursor_valores = decode_cursor(cursor_param) if cursor_param else None
+        desde, hasta = archivo.rango_fechas(query_params)
+    except (CursorInvalido, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = replicas.conexion_lectura()
+    # En el archivo solo hay órdenes pagadas
+    meses = []
+    if (desde or hasta) and filter_estado in ('todos', 'Pagada'):
+        meses = archivo.particiones(conn, desde, hasta)
 
     base_query = """
         SELECT o.*, m.codigo_moneda, u.nombre as coordinador_nombre, u.apellido as coordinador_apellido
-        FROM ordenes_pago o
+        FROM {esquema}ordenes_pago o
         JOIN monedas m ON o.id_moneda = m.id_moneda
         JOIN usuarios u ON o.id_coordinador = u.id_usuario
     """
@@ -529,39 +846,142 @@ def get_historial_ordenes():
     where_clauses = []
     params = []
 
-    if search_term:
-        where_clauses.append("(o.acreedor LIKE ? OR u.nombre LIKE ? OR u.apellido LIKE ?)")
-        like_term = f"%{search_term}%"
-        params.extend([like_term, like_term, like_term])
+    match = fts_query(search_term)
+    if match:
+        base_query += " JOIN {esquema}ordenes_busqueda f ON f.rowid = o.id_orden"
+        where_clauses.append("f.ordenes_busqueda MATCH ?")
+        params.append(match)
 
     if filter_estado != 'todos':
         where_clauses.append("o.estado = ?")
         params.append(filter_estado)
 
+    if desde:
+        where_clauses.append("o.fecha_creacion >= ?")
+        params.append(desde)
+    if hasta:
+        where_clauses.append("o.fecha_creacion < ?")
+        params.append(hasta)
+
+    if cursor_valores:
+        where_clauses.append("o.id_orden < ?")
+        params.append(cursor_valores[0])
+
     if where_clauses:
         base_query += " WHERE " + " AND ".join(where_clauses)
 
-    base_query += " ORDER BY o.id_orden DESC"
+    if match and limite is None and not meses:
+        # Sin paginación los resultados de una búsqueda van por relevancia
+        base_query += " ORDER BY f.rank, o.id_orden DESC"
+    else:
+        base_query += " ORDER BY o.id_orden DESC"
+
+    if limite is not None:
+        # Pedimos una fila de más para saber si hay otra página
+        base_query += " LIMIT ?"
+        params.append(limite if formato_stream else limite + 1)
 
-    ordenes_cursor = conn.execute(base_query, tuple(params)).fetchall()
+    if meses:
+        cursor = archivo.consultar_particionado(conn, base_query, tuple(params), meses, ('id_orden',),
+                                                params[-1] if limite is not None else None)
+    else:
+        cursor = consultar(conn, base_query.format(esquema=''), tuple(params))
+    try:
+        proyeccion = Proyeccion(cursor, campos_pedidos(query_params))
+    except CamposInvalidos as e:
+        conn.close()
+        return jsonify({"error": str(e)}), 400
+    if formato_stream:
+        return stream_response(conn, cursor, formato_stream, proyeccion)
+
+    filas = cursor.fetchall()
     conn.close()
 
-    ordenes = [dict(row) for row in ordenes_cursor]
-    return jsonify(ordenes), 200
+    if limite is None:
+        return respuesta_json(proyeccion.filas(filas))
+
+    next_cursor = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        next_cursor = encode_cursor([filas[-1][proyeccion.indice('id_orden')]])
+    return respuesta_json({"datos": proyeccion.filas(filas), "next_cursor": next_cursor})
 
 # --- RUTA PARA BITÁCORA ---
 @app.route('/api/bitacora', methods=['GET'])
 def get_bitacora():
-    conn = get_db_connection()
-    logs_cursor = conn.execute("""
+    """Bitácora de acciones, de la más reciente a la más antigua.
+
+    Acepta los mismos parámetros limite / cursor / stream / campos que el historial;
+    el cursor se basa en (fecha_accion, id_bitacora). Con desde / hasta
+    (AAAA-MM-DD, sobre fecha_accion) se consultan también los meses archivados.
+    """
+    query_params = request.args
+    formato_stream = query_params.get('stream')
+    if formato_stream and formato_stream not in ('json', 'ndjson'):
+        return jsonify({"error": "Formato de stream no soportado"}), 400
+    cursor_param = query_params.get('cursor')
+
+    try:
+        limite = parse_limite(query_params.get('limite'))
+        if cursor_param and limite is None:
+            limite = LIMITE_POR_DEFECTO
+        cursor_valores = decode_cursor(cursor_param) if cursor_param else None
+        if cursor_valores is not None and len(cursor_valores) != 2:
+            raise CursorInvalido("Cursor inválido")
+        desde, hasta = archivo.rango_fechas(query_params)
+    except (CursorInvalido, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = replicas.conexion_lectura()
+    meses = archivo.particiones(conn, desde, hasta) if desde or hasta else []
+    base_query = """
         SELECT b.id_bitacora, u.nombre, u.apellido, b.accion, b.detalles, b.id_orden_afectada, b.fecha_accion
-        FROM bitacora b
+        FROM {esquema}bitacora b
         JOIN usuarios u ON b.id_usuario_accion = u.id_usuario
-        ORDER BY b.fecha_accion DESC
-    """).fetchall()
+    """
+    where_clauses = []
+    params = []
+    if desde:
+        where_clauses.append("b.fecha_accion >= ?")
+        params.append(desde)
+    if hasta:
+        where_clauses.append("b.fecha_accion < ?")
+        params.append(hasta)
+    if cursor_valores:
+        where_clauses.append("(b.fecha_accion, b.id_bitacora) < (?, ?)")
+        params.extend(cursor_valores)
+    if where_clauses:
+        base_query += " WHERE " + " AND ".join(where_clauses)
+    base_query += " ORDER BY b.fecha_accion DESC, b.id_bitacora DESC"
+    if limite is not None:
+        base_query += " LIMIT ?"
+        params.append(limite if formato_stream else limite + 1)
+
+    if meses:
+        cursor = archivo.consultar_particionado(conn, base_query, tuple(params), meses,
+                                                ('fecha_accion', 'id_bitacora'),
+                                                params[-1] if limite is not None else None)
+    else:
+        cursor = consultar(conn, base_query.format(esquema=''), tuple(params))
+    try:
+        proyeccion = Proyeccion(cursor, campos_pedidos(query_params))
+    except CamposInvalidos as e:
+        conn.close()
+        return jsonify({"error": str(e)}), 400
+    if formato_stream:
+        return stream_response(conn, cursor, formato_stream, proyeccion)
+
+    filas = cursor.fetchall()
     conn.close()
-    logs = [dict(row) for row in logs_cursor]
-    return jsonify(logs), 200
+    if limite is None:
+        return respuesta_json(proyeccion.filas(filas))
+
+    next_cursor = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        ultima = filas[-1]
+        next_cursor = encode_cursor([ultima[proyeccion.indice('fecha_accion')], ultima[proyeccion.indice('id_bitacora')]])
+    return respuesta_json({"datos": proyeccion.filas(filas), "next_cursor": next_cursor})
 
 # Añade estas nuevas rutas en backend/app.py
 
@@ -576,6 +996,8 @@ def get_orden_detalle(id_orden):
     return jsonify(dict(orden)), 200
 
 @app.route('/api/ordenes/<int:id_orden>', methods=['PUT'])
+@autenticado('Coordinador')
+@idempotente
 def update_orden(id_orden):
     """Actualiza los datos de una orden existente."""
     data = request.get_json()
@@ -583,6 +1005,11 @@ def update_orden(id_orden):
 
     if not all([monto, id_moneda, id_tipo_pago, fecha_factura, fecha_vencimiento]):
         return jsonify({"error": "Faltan datos para actualizar la orden"}), 400
+    try:
+        fecha_factura = importacion.fecha_iso(fecha_factura)
+        fecha_vencimiento = importacion.fecha_iso(fecha_vencimiento)
+    except ValueError:
+        return jsonify({"error": "Fecha inválida, se espera AAAA-MM-DD"}), 400
 
     conn = get_db_connection()
     try:
@@ -594,12 +1021,9 @@ def update_orden(id_orden):
             (monto, id_moneda, id_tipo_pago, fecha_factura, fecha_vencimiento, id_orden)
         )
         # También registramos la edición en la bitácora
-        id_coordinador = data.get('id_coordinador') # El frontend debe enviar el ID del usuario
+        id_coordinador = autenticacion.id_usuario(data.get('id_coordinador')) # Sin token, el frontend debe enviar el ID del usuario
         if id_coordinador:
-             conn.execute(
-                "INSERT INTO bitacora (id_usuario_accion, accion, detalles, id_orden_afectada) VALUES (?, ?, ?, ?)",
-                (id_coordinador, 'EDITAR_ORDEN', 'El coordinador modificó la orden', id_orden)
-            )
+            auditoria.registrar(conn, id_coordinador, 'EDITAR_ORDEN', id_orden, 'El coordinador modificó la orden')
         conn.commit()
     except Exception as e:
         return jsonify({"error": "Error al actualizar la orden", "details": str(e)}), 500
@@ -608,9 +1032,17 @@ def update_orden(id_orden):
 
     return jsonify({"message": "Orden actualizada exitosamente"}), 200
 
-if __name__ == '__main__':
+def inicializar():
+    """Migraciones y diarios de la bitácora pendientes, antes de atender."""
     init_db()
+    auditoria.reproducir_diarios()
+
+if __name__ == '__main__':
+    inicializar()
     app.run(debug=False, port=5000) # Cambiamos debug a False para producción
-else:
-    # Esto se ejecuta cuando Gunicorn inicia la app en Render
-    init_db()
\ No newline at end of file
+elif __name__ == 'app':
+    # Esto se ejecuta cuando Gunicorn inicia la app en Render (y con flask o
+    # asgi.py). Los procesos del pool de bcrypt, que arrancan con 'spawn',
+    # reimportan este archivo como '__mp_main__' si se lanzó con
+    # `python app.py`: ellos no tocan la base.
+    inicializar()
\ No newline at end of file
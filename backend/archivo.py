@@ -0,0 +1,334 @@
+# backend/archivo.py
+# Archivo mensual de órdenes pagadas y de la bitácora.
+#
+# Las órdenes en estado 'Pagada' y las entradas de la bitácora más viejas que
+# ARCHIVO_MESES_ACTIVOS meses se mueven a un archivo SQLite por mes
+# (ARCHIVO_DIR/pagos-AAAA-MM.db, por defecto junto a pagos.db), así la base
+# principal conserva solo el conjunto de trabajo. Las órdenes se asignan al
+# mes de fecha_creacion y la bitácora al de fecha_accion.
+#
+# El historial y la bitácora consultan también los meses archivados cuando el
+# request pide un rango con ?desde= / ?hasta=: cada mes se adjunta con ATTACH
+# DATABASE, se consulta con la misma sentencia y los resultados se mezclan en
+# el orden del endpoint. Los contadores del resumen no cambian al archivar
+# (siguen contando toda la historia).
+#
+#   flask archivo mover          mueve los meses vencidos, luego VACUUM incremental y ANALYZE
+#   flask archivo particiones    lista los meses archivados
+#   flask archivo compactar      pasa la base a auto_vacuum incremental (VACUUM completo, una vez)
+#
+# Solo mover_mes escribe en las particiones, y lo hace con bloqueo() tomado:
+# los respaldos (respaldos.py) toman el mismo lock mientras capturan la base
+# principal y copian las particiones, así las dos quedan del mismo momento.
+import datetime
+import heapq
+import itertools
+import os
+import re
+from contextlib import contextmanager
+from operator import itemgetter
+
+import click
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin lock entre procesos
+    fcntl = None
+
+import db
+from db import get_db_connection
+from respuestas import consultar
+
+DIRECTORIO = os.environ.get('ARCHIVO_DIR', os.path.join(os.path.dirname(db.DATABASE_PATH), 'archivo'))
+MESES_ACTIVOS = int(os.environ.get('ARCHIVO_MESES_ACTIVOS', '12'))
+
+_MES = re.compile(r'^\d{4}-\d{2}$')
+
+
+def ruta_particion(mes, directorio=DIRECTORIO):
+    return os.path.join(directorio, f"pagos-{mes}.db")
+
+
+@contextmanager
+def bloqueo():
+    """Lock de archivo entre procesos: mientras se tiene, las particiones no cambian."""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(DIRECTORIO, exist_ok=True)
+    with open(os.path.join(DIRECTORIO, 'archivo.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _esquema(mes):
+    return f"archivo_{mes.replace('-', '_')}"
+
+
+def _mes_siguiente(mes):
+    anio, numero = int(mes[:4]), int(mes[5:7])
+    return f"{anio + numero // 12:04d}-{numero % 12 + 1:02d}-01"
+
+
+def corte_activo(hoy=None, meses=MESES_ACTIVOS):
+    """Primer día del mes más viejo que se queda en la base principal."""
+    hoy = hoy or datetime.date.today()
+    total = hoy.year * 12 + hoy.month - 1 - meses
+    return f"{total // 12:04d}-{total % 12 + 1:02d}-01"
+
+
+def rango_fechas(args):
+    """Lee ?desde= y ?hasta= (AAAA-MM-DD, ambos incluidos).
+
+    Devuelve (desde, hasta_exclusivo) como texto comparable con las fechas de
+    SQLite; None en los que no se pidieron. ValueError si no son fechas.
+    """
+    desde, hasta = args.get('desde'), args.get('hasta')
+    try:
+        if desde:
+            desde = datetime.date.fromisoformat(desde).isoformat()
+        if hasta:
+            hasta = (datetime.date.fromisoformat(hasta) + datetime.timedelta(days=1)).isoformat()
+    except ValueError:
+        raise ValueError("Las fechas deben tener el formato AAAA-MM-DD")
+    return desde or None, hasta or None
+
+
+def meses_archivados(conn):
+    return [fila[0] for fila in conn.execute("SELECT mes FROM archivo_particiones ORDER BY mes DESC").fetchall()]
+
+
+def particiones(conn, desde=None, hasta=None):
+    """Meses archivados que se cruzan con [desde, hasta)."""
+    return [mes for mes in meses_archivados(conn)
+            if (desde is None or _mes_siguiente(mes) > desde) and (hasta is None or f"{mes}-01" < hasta)]
+
+
+def adjuntar(conn, mes, crear=False):
+    """ATTACH del archivo del mes; devuelve el nombre del esquema o None si no existe."""
+    ruta = ruta_particion(mes)
+    if not crear and not os.path.exists(ruta):
+        print(f"Falta el archivo de la partición {mes}: {ruta}")
+        return None
+    esquema = _esquema(mes)
+    conn.execute(f"ATTACH DATABASE ? AS {esquema}", (ruta,))
+    return esquema
+
+
+def separar(conn, esquema):
+    conn.execute(f"DETACH DATABASE {esquema}")
+
+
+class ResultadoParticionado:
+    """Filas ya mezcladas de la base principal y del archivo; se usa como un cursor."""
+
+    def __init__(self, description, filas):
+        self.description = description
+        self._filas = iter(filas)
+
+    def fetchall(self):
+        return list(self._filas)
+
+    def fetchmany(self, size):
+        return list(itertools.islice(self._filas, size))
+
+
+def consultar_particionado(conn, consulta, params, meses, clave, limite=None):
+    """Ejecuta `consulta` en la base principal y en cada mes de `meses`.
+
+    La consulta lleva {esquema} delante de ordenes_pago, ordenes_busqueda y
+    bitacora, y debe ordenar de forma descendente por las columnas `clave`.
+    Una fila que por un corte a mitad del archivado quedó en las dos bases se
+    toma una sola vez, de la principal. `limite` corta cada fuente y el total.
+    """
+    def leer(cursor):
+        return cursor.fetchall() if limite is None else cursor.fetchmany(limite)
+
+    cursor = consultar(conn, consulta.format(esquema='main.'), params)
+    description = cursor.description
+    columnas = [d[0] for d in description]
+    fuentes = [leer(cursor)]
+    for mes in meses:
+        esquema = adjuntar(conn, mes)
+        if esquema is None:
+            continue
+        try:
+            cursor = consultar(conn, consulta.format(esquema=esquema + '.'), params)
+            fuentes.append(leer(cursor))
+            cursor.close()
+        finally:
+            separar(conn, esquema)
+
+    obtener_clave = itemgetter(*[columnas.index(c) for c in clave])
+
+    def sin_duplicados():
+        anterior = object()
+        # heapq.merge es estable: con claves iguales sale primero la base principal
+        for fila in heapq.merge(*fuentes, key=obtener_clave, reverse=True):
+            actual = obtener_clave(fila)
+            if actual != anterior:
+                anterior = actual
+                yield fila
+
+    filas = sin_duplicados()
+    if limite is not None:
+        filas = itertools.islice(filas, limite)
+    return ResultadoParticionado(description, list(filas))
+
+
+def _crear_tablas(conn, esquema):
+    for tabla in ('ordenes_pago', 'bitacora'):
+        sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (tabla,)).fetchone()[0]
+        conn.execute(re.sub(r'^CREATE TABLE\s+"?%s"?' % tabla, f"CREATE TABLE IF NOT EXISTS {esquema}.{tabla}", sql))
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {esquema}.idx_archivo_ordenes_fecha ON ordenes_pago (fecha_creacion)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {esquema}.idx_archivo_bitacora_fecha ON bitacora (fecha_accion)")
+    conn.execute(f"""CREATE VIRTUAL TABLE IF NOT EXISTS {esquema}.ordenes_busqueda USING fts5(
+        acreedor, documento_compensacion, coordinador,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')""")
+
+
+def mover_mes(conn, mes):
+    """Mueve las órdenes pagadas y la bitácora de `mes` ('AAAA-MM') a su archivo.
+
+    Se hace en pasos que se pueden repetir sin riesgo: copiar al archivo,
+    borrar de la base principal solo las filas que quedaron idénticas en el
+    archivo, y quitar del archivo lo que cambió en el medio. Devuelve
+    (órdenes, entradas de bitácora) movidas.
+    """
+    with bloqueo():
+        return _mover_mes(conn, mes)
+
+
+def _mover_mes(conn, mes):
+    if not _MES.match(mes):
+        raise ValueError(f"Mes inválido: {mes}")
+    inicio, fin = f"{mes}-01", _mes_siguiente(mes)
+    os.makedirs(DIRECTORIO, exist_ok=True)
+    esquema = adjuntar(conn, mes, crear=True)
+    try:
+        _crear_tablas(conn, esquema)
+        columnas = [fila[1] for fila in conn.execute("PRAGMA main.table_info(ordenes_pago)").fetchall()]
+        iguales = " AND ".join(f"a.{c} IS o.{c}" for c in columnas)
+        ids_mes = ("SELECT id_orden FROM main.ordenes_pago "
+                   "WHERE estado = 'Pagada' AND fecha_creacion >= ? AND fecha_creacion < ?")
+
+        # 1) Copiar al archivo (solo escribe en el archivo)
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(f"INSERT OR REPLACE INTO {esquema}.ordenes_pago SELECT * FROM main.ordenes_pago "
+                     "WHERE estado = 'Pagada' AND fecha_creacion >= ? AND fecha_creacion < ?", (inicio, fin))
+        conn.execute(f"DELETE FROM {esquema}.ordenes_busqueda WHERE rowid IN ({ids_mes})", (inicio, fin))
+        conn.execute(f"""INSERT INTO {esquema}.ordenes_busqueda (rowid, acreedor, documento_compensacion, coordinador)
+                         SELECT rowid, acreedor, documento_compensacion, coordinador FROM main.ordenes_busqueda
+                         WHERE rowid IN ({ids_mes})""", (inicio, fin))
+        conn.execute(f"INSERT OR IGNORE INTO {esquema}.bitacora SELECT * FROM main.bitacora "
+                     "WHERE fecha_accion >= ? AND fecha_accion < ?", (inicio, fin))
+        conn.commit()
+
+        # 2) Borrar de la base principal (solo escribe en la principal)
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("INSERT INTO archivo_en_curso (activo) VALUES (1)")
+        ordenes = conn.execute(
+            f"""DELETE FROM main.ordenes_pago AS o
+                WHERE estado = 'Pagada' AND fecha_creacion >= ? AND fecha_creacion < ?
+                  AND EXISTS (SELECT 1 FROM {esquema}.ordenes_pago a WHERE a.id_orden = o.id_orden AND {iguales})""",
+            (inicio, fin)).rowcount
+        bitacora = conn.execute(
+            f"""DELETE FROM main.bitacora
+                WHERE fecha_accion >= ? AND fecha_accion < ?
+                  AND id_bitacora IN (SELECT id_bitacora FROM {esquema}.bitacora)""", (inicio, fin)).rowcount
+        conn.execute("DELETE FROM archivo_en_curso")
+        conn.execute(
+            f"""INSERT INTO archivo_particiones (mes, ordenes, bitacora, actualizado)
+                VALUES (?, (SELECT COUNT(*) FROM {esquema}.ordenes_pago), (SELECT COUNT(*) FROM {esquema}.bitacora),
+                        CURRENT_TIMESTAMP)
+                ON CONFLICT (mes) DO UPDATE SET ordenes = excluded.ordenes, bitacora = excluded.bitacora,
+                                                actualizado = excluded.actualizado""", (mes,))
+        conn.commit()
+
+        # 3) Lo que cambió entre los pasos 1 y 2 sigue en la principal: se quita del archivo
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(f"DELETE FROM {esquema}.ordenes_busqueda WHERE rowid IN (SELECT id_orden FROM main.ordenes_pago)")
+        conn.execute(f"DELETE FROM {esquema}.ordenes_pago WHERE id_orden IN (SELECT id_orden FROM main.ordenes_pago)")
+        conn.commit()
+        conn.execute(f"ANALYZE {esquema}")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        separar(conn, esquema)
+    return ordenes, bitacora
+
+
+def meses_pendientes(conn, corte):
+    filas = conn.execute("""
+        SELECT substr(fecha_creacion, 1, 7) FROM ordenes_pago WHERE estado = 'Pagada' AND fecha_creacion < ?
+        UNION
+        SELECT substr(fecha_accion, 1, 7) FROM bitacora WHERE fecha_accion < ?
+    """, (corte, corte)).fetchall()
+    return sorted(fila[0] for fila in filas if fila[0] and _MES.match(fila[0]))
+
+
+def compactar(conn):
+    """Devuelve espacio libre al sistema y actualiza estadísticas del planificador."""
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        conn.execute("PRAGMA incremental_vacuum")
+    conn.execute("ANALYZE ordenes_pago")
+    conn.execute("ANALYZE bitacora")
+    conn.commit()
+
+
+def archivar(conn, meses_activos=MESES_ACTIVOS):
+    """Mueve al archivo todos los meses anteriores al corte. Devuelve {mes: (órdenes, bitácora)}."""
+    movidos = {}
+    for mes in meses_pendientes(conn, corte_activo(meses=meses_activos)):
+        movidos[mes] = mover_mes(conn, mes)
+    if movidos:
+        compactar(conn)
+    return movidos
+
+
+@click.group('archivo')
+def cli():
+    """Archivo mensual de órdenes pagadas y bitácora."""
+
+
+@cli.command('mover')
+@click.option('--meses-activos', type=int, default=MESES_ACTIVOS, show_default=True,
+              help="Meses completos que se quedan en la base principal")
+def mover_command(meses_activos):
+    conn = get_db_connection()
+    try:
+        movidos = archivar(conn, meses_activos)
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            click.echo("La base no usa auto_vacuum incremental; ejecute 'flask archivo compactar' una vez.")
+    finally:
+        conn.close()
+    for mes, (ordenes, bitacora) in movidos.items():
+        click.echo(f"{mes}: {ordenes} órdenes, {bitacora} entradas de bitácora")
+    if not movidos:
+        click.echo("No hay meses para archivar.")
+
+
+@cli.command('particiones')
+def particiones_command():
+    conn = get_db_connection()
+    filas = conn.execute("SELECT mes, ordenes, bitacora, actualizado FROM archivo_particiones ORDER BY mes").fetchall()
+    conn.close()
+    for mes, ordenes, bitacora, actualizado in filas:
+        click.echo(f"{mes}  {ordenes:>8} órdenes  {bitacora:>9} bitácora  ({actualizado})  {ruta_particion(mes)}")
+
+
+@cli.command('compactar')
+def compactar_command():
+    conn = get_db_connection()
+    try:
+        # Cambiar auto_vacuum en una base existente requiere un VACUUM completo
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        compactar(conn)
+    finally:
+        conn.close()
+    click.echo("Base compactada; los próximos archivados liberan espacio con VACUUM incremental.")
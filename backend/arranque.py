@@ -0,0 +1,79 @@
+# backend/arranque.py
+# Preparación del servidor antes de recibir tráfico (la usa gunicorn.conf.py).
+#
+# En el master, una sola vez y antes del fork:
+#   - ANALYZE, para que el planificador tenga estadísticas desde el primer
+#     request (ARRANQUE_ANALYZE_LIMITE filas por índice; 0 = completo);
+#   - la caché de catálogos llena: los workers la heredan ya armada;
+#   - la cola de pagos en memoria (planificador.py), también heredada;
+#   - las copias de lectura al día (replicas.py), si están activadas.
+# En cada worker, antes de aceptar conexiones:
+#   - las conexiones del pool abiertas y con el esquema ya leído;
+#   - los hilos de segundo plano y el pool de bcrypt arrancados;
+#   - los diarios de la bitácora de un worker anterior que murió.
+import os
+import time
+
+import auditoria
+import db
+import eventos
+import idempotencia
+import planificador
+import replicas
+
+ANALYZE_LIMITE = int(os.environ.get('ARRANQUE_ANALYZE_LIMITE', '1000'))
+
+
+def analizar(limite=ANALYZE_LIMITE):
+    conn = db.pool.acquire()
+    try:
+        conn.execute(f"PRAGMA analysis_limit = {int(limite)}")
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def cachear_catalogos(app):
+    from app import CONSULTAS_CATALOGOS, catalogos_cache
+    with app.app_context():
+        conn = db.pool.acquire()
+        try:
+            for catalogo, consulta in CONSULTAS_CATALOGOS.items():
+                catalogos_cache.obtener(conn, catalogo, consulta)
+        finally:
+            conn.close()
+
+
+def preparar_master(app):
+    """Trabajo de una sola vez en el master; deja el pool sin conexiones para el fork."""
+    inicio = time.perf_counter()
+    analizar()
+    cachear_catalogos(app)
+    planificador.planificador.sincronizar()
+    if replicas.CANTIDAD > 0:
+        replicas.refrescar()
+    db.pool.cerrar_libres()
+    return time.perf_counter() - inicio
+
+
+def calentar_worker(conexiones):
+    """Deja listo un worker recién creado. Devuelve los segundos que tardó."""
+    from app import actualizador_tasas
+    from contrasenas import hasher
+
+    inicio = time.perf_counter()
+    auditoria.reproducir_diarios()
+    abiertas = [db.pool.acquire() for _ in range(min(conexiones, db.pool.size))]
+    for conn in abiertas:
+        # La primera sentencia de cada conexión lee el esquema
+        conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+    for conn in abiertas:
+        conn.close()
+    actualizador_tasas.iniciar_programador()
+    eventos.difusor.iniciar()
+    replicas.refrescador.iniciar()
+    planificador.planificador.iniciar()
+    idempotencia.barredor.iniciar()
+    hasher.calentar()
+    return time.perf_counter() - inicio
@@ -0,0 +1,197 @@
+# backend/asgi.py
+# Modo de servicio asíncrono (ASGI) de la API.
+#
+#   uvicorn asgi:app --host 0.0.0.0 --port 5000
+#
+# Las rutas que esperan algo lento sin usar la base tienen handlers async
+# propios y no ocupan un hilo mientras esperan:
+#   - POST /api/auth/login            bcrypt en el pool de procesos (contrasenas.py)
+#   - POST /api/exchange/update       descarga de tasas con httpx.AsyncClient
+#   - GET  /api/ordenes/enviadas/eventos   conexiones SSE de larga duración
+# Todas las demás son las mismas rutas de Flask (app.py) montadas a través de
+# un pool de hilos acotado, igual que el acceso a SQLite de los handlers
+# async: ASGI_HILOS hilos (por defecto DB_POOL_SIZE), así nunca hay más
+# consultas en curso que conexiones en el pool.
+#
+# Un solo proceso puede mantener miles de conexiones de eventos abiertas
+# (EVENTOS_MAX_SUSCRIPTORES, por defecto 10000 en este modo). Para comparar
+# con Gunicorn sync ver bench_asgi.py.
+import asyncio
+import itertools
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import httpx
+import requests
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import autenticacion
+import db
+import eventos
+import idempotencia
+import planificador
+import replicas
+import tipos_cambio
+from app import ESPERA_TIPOS_CAMBIO, actualizador_tasas, app as flask_app
+from contrasenas import PoolSaturado, hash_ficticio, hasher as hasher_contrasenas, necesita_rehash
+from respuestas import dumps
+
+HILOS = int(os.environ.get('ASGI_HILOS', str(db.POOL_SIZE)))
+eventos.difusor.max_suscriptores = int(os.environ.get('EVENTOS_MAX_SUSCRIPTORES', '10000'))
+
+ejecutor_db = ThreadPoolExecutor(max_workers=HILOS, thread_name_prefix='asgi-db')
+# Actualizaciones de tasas que siguen después de responder 202
+_tareas = set()
+
+
+async def en_hilo(funcion, *args):
+    """Corre `funcion` en el pool de hilos de la base y espera el resultado."""
+    return await asyncio.get_running_loop().run_in_executor(ejecutor_db, funcion, *args)
+
+
+def respuesta_json(obj, status=200):
+    return Response(dumps(obj), status_code=status, media_type='application/json')
+
+
+async def login(request):
+    """Igual que app.login, esperando bcrypt sin ocupar un hilo."""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return respuesta_json({"error": "Faltan correo o contraseña"}, 400)
+    email, password = data.get('email'), data.get('password')
+    if not email or not password:
+        return respuesta_json({"error": "Faltan correo o contraseña"}, 400)
+    user = await en_hilo(autenticacion.buscar_por_email, email)
+    password_hash = user['password_hash'] if user else hash_ficticio()
+    try:
+        password_valida = await hasher_contrasenas.verificar_async(password, password_hash) and user is not None
+    except PoolSaturado:
+        return respuesta_json({"error": "El servidor está ocupado, intente de nuevo"}, 503)
+    if password_valida and necesita_rehash(user['password_hash']):
+        try:
+            nuevo_hash = await hasher_contrasenas.hash_async(password)
+        except PoolSaturado:
+            nuevo_hash = None  # se intentará en el próximo inicio de sesión
+        if nuevo_hash:
+            await en_hilo(autenticacion.guardar_hash, user['id_usuario'], nuevo_hash)
+    return respuesta_json(*autenticacion.resultado_login(user, password_valida))
+
+
+async def update_exchange_rates(request):
+    """Igual que app.update_exchange_rates, con la descarga en httpx."""
+    tarea = asyncio.ensure_future(actualizador_tasas.actualizar_async(en_hilo, request.query_params.get('forzar') == '1'))
+    _tareas.add(tarea)
+    tarea.add_done_callback(_tareas.discard)
+    try:
+        actualizadas = await asyncio.wait_for(asyncio.shield(tarea), ESPERA_TIPOS_CAMBIO)
+    except asyncio.TimeoutError:
+        return respuesta_json({"message": "La actualización de tipos de cambio sigue en curso"}, 202)
+    except (httpx.HTTPError, requests.exceptions.RequestException) as e:
+        return respuesta_json({"error": "Error al conectar con el servicio de tipos de cambio", "details": str(e)}, 503)
+    except tipos_cambio.ErrorProveedor as e:
+        return respuesta_json({"error": str(e)}, 500)
+    except Exception as e:
+        return respuesta_json({"error": "Ocurrió un error inesperado", "details": str(e)}, 500)
+    return respuesta_json({"message": "Tipos de cambio actualizados exitosamente", "monedas_actualizadas": actualizadas})
+
+
+async def _flujo_sse(desde_seq):
+    """Versión async de eventos.flujo_sse: espera mensajes sin ocupar un hilo."""
+    loop = asyncio.get_running_loop()
+    despertar = asyncio.Event()
+    # La suscripción se toma recién al empezar a enviar: si el cliente se va
+    # antes, el generador nunca arranca y no queda nada que cancelar
+    futuro = loop.run_in_executor(ejecutor_db, eventos.difusor.suscribir)
+    try:
+        suscripcion = await asyncio.shield(futuro)
+    except eventos.Saturado:
+        return
+    except asyncio.CancelledError:
+        futuro.add_done_callback(lambda f: f.cancelled() or f.exception() or eventos.difusor.cancelar(f.result()))
+        raise
+
+    def avisar():
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(despertar.set)
+
+    suscripcion.al_recibir = avisar
+    try:
+        yield b"retry: 3000\n\n"
+        # Snapshot o eventos faltantes: se leen en el pool de hilos, de a partes
+        iniciales = eventos.mensajes_iniciales(suscripcion, desde_seq)
+        while True:
+            parte = await en_hilo(lambda: list(itertools.islice(iniciales, 100)))
+            if not parte:
+                break
+            for mensaje in parte:
+                yield mensaje
+
+        while not suscripcion.desbordada:
+            try:
+                seq, mensaje = suscripcion.cola.get_nowait()
+            except queue.Empty:
+                despertar.clear()
+                if not suscripcion.cola.empty() or suscripcion.desbordada:
+                    continue
+                try:
+                    await asyncio.wait_for(despertar.wait(), eventos.PING)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                continue
+            if seq > suscripcion.ultimo:
+                suscripcion.ultimo = seq
+                yield mensaje
+    finally:
+        suscripcion.al_recibir = None
+        eventos.difusor.cancelar(suscripcion)
+
+
+async def get_eventos_enviadas(request):
+    """Igual que app.get_eventos_enviadas."""
+    desde = request.headers.get('last-event-id') or request.query_params.get('desde')
+    try:
+        desde = int(desde) if desde else None
+    except ValueError:
+        return respuesta_json({"error": "El número de secuencia debe ser un entero"}, 400)
+    if eventos.difusor.lleno():
+        return respuesta_json({"error": "Demasiadas conexiones de eventos abiertas"}, 503)
+    return StreamingResponse(_flujo_sse(desde), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@asynccontextmanager
+async def ciclo_de_vida(aplicacion):
+    # Lo mismo que hace el before_request de Flask, al arrancar cada worker
+    actualizador_tasas.iniciar_programador()
+    eventos.difusor.iniciar()
+    replicas.refrescador.iniciar()
+    planificador.planificador.iniciar()
+    idempotencia.barredor.iniciar()
+    # El hash ficticio del login se calcula acá y no en el primer request
+    await en_hilo(hash_ficticio)
+    yield
+    ejecutor_db.shutdown(wait=False)
+
+
+app = Starlette(
+    routes=[
+        Route('/api/auth/login', login, methods=['POST']),
+        Route('/api/exchange/update', update_exchange_rates, methods=['POST']),
+        Route('/api/ordenes/enviadas/eventos', get_eventos_enviadas, methods=['GET']),
+        Mount('/', app=WSGIMiddleware(flask_app, workers=HILOS)),
+    ],
+    # Los handlers async no pasan por flask-cors; mismos valores por defecto
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'],
+                           expose_headers=[*replicas.ENCABEZADOS, idempotencia.ENCABEZADO_REPETIDA])],
+    lifespan=ciclo_de_vida,
+)
@@ -0,0 +1,283 @@
+# backend/auditoria.py
+# Escritura de la bitácora de acciones.
+#
+# BITACORA_MODO=estricto (por defecto): cada entrada se inserta en la misma
+# transacción que el cambio que registra, como siempre.
+#
+# BITACORA_MODO=diferido: la entrada se anota en un diario local (un archivo
+# por proceso, una línea JSON por entrada) y, cuando la transacción del
+# request hace commit, un hilo escritor la inserta junto con otras, en un
+# solo executemany por lote. Así los cambios de estado no retienen el lock de
+# escritura de SQLite para insertar en la tabla que más crece.
+#
+# La línea del diario se escribe antes del commit, y la transacción del
+# cambio inserta (diario, seq) en bitacora_confirmada, una tabla que se
+# mantiene casi vacía. Si escribir el diario falla (disco lleno), el request
+# falla sin haber guardado el cambio. Si el proceso muere con entradas sin
+# escribir, siguen en su diario: al arrancar, reproducir_diarios() inserta
+# las que tienen fila en bitacora_confirmada; las de transacciones que
+# hicieron rollback no la tienen y se saltan. Cada lote borra las filas de
+# sus entradas en la misma transacción que las inserta, por lo que
+# reproducir un diario nunca duplica entradas.
+#
+# Otras variables de entorno:
+#   BITACORA_DIARIOS     directorio de los diarios (por defecto el de la base)
+#   BITACORA_LOTE        entradas máximas por transacción (500)
+#   BITACORA_ESPERA_MS   cuánto se espera a juntar un lote (50 ms)
+#   BITACORA_FSYNC=1     fsync del diario en cada entrada (sobrevive también
+#                        a un corte de luz, a cambio de latencia)
+import atexit
+import datetime
+import glob
+import json
+import os
+import queue
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo de archivos
+    fcntl = None
+
+import db
+
+MODO = os.environ.get('BITACORA_MODO', 'estricto')
+DIRECTORIO = os.environ.get('BITACORA_DIARIOS', os.path.dirname(db.DATABASE_PATH))
+TAMANO_LOTE = int(os.environ.get('BITACORA_LOTE', '500'))
+ESPERA = float(os.environ.get('BITACORA_ESPERA_MS', '50')) / 1000
+FSYNC = os.environ.get('BITACORA_FSYNC', '0') == '1'
+# Al vaciarse la cola, el diario se trunca si pasó este tamaño
+TAMANO_MAXIMO_DIARIO = 1024 * 1024
+
+INSERTAR = ("INSERT INTO bitacora (id_usuario_accion, accion, detalles, id_orden_afectada, fecha_accion) "
+            "VALUES (?, ?, ?, ?, ?)")
+CONFIRMAR = "INSERT INTO bitacora_confirmada (diario, seq) VALUES (?, ?)"
+ESCRITA = "DELETE FROM bitacora_confirmada WHERE diario = ? AND seq = ?"
+
+
+def _ahora():
+    # Mismo formato y zona (UTC) que CURRENT_TIMESTAMP de SQLite
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _bloquear(fd):
+    """Bloqueo exclusivo sin espera; False si otro proceso vivo lo tiene."""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+class EscritorBitacora:
+    """Cola en memoria + diario en disco + hilo que escribe por lotes."""
+
+    def __init__(self, directorio=DIRECTORIO, tamano_lote=TAMANO_LOTE, espera=ESPERA):
+        self.directorio = directorio
+        self.tamano_lote = tamano_lote
+        self.espera = espera
+        self._lock = threading.Lock()
+        self._vacio = threading.Condition(self._lock)
+        self._pid = None
+        self._pendientes = 0
+        self._en_curso = 0
+        self.encoladas = self.escritas = self.lotes = self.errores = 0
+
+    def _iniciar(self):
+        # Un diario y un hilo por proceso (también después de un fork)
+        os.makedirs(self.directorio, exist_ok=True)
+        nombre = f"bitacora-{os.getpid()}-{int(time.time() * 1000)}.journal"
+        ruta = os.path.join(self.directorio, nombre)
+        # Se crea con otro nombre y se bloquea antes de renombrarlo: así
+        # reproducir_diarios() nunca lo ve sin el lock y lo toma por huérfano
+        temporal = ruta + '.tmp'
+        fd = os.open(temporal, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o600)
+        try:
+            if not _bloquear(fd):
+                raise OSError(f"No se pudo bloquear el diario de la bitácora {temporal}")
+            os.rename(temporal, ruta)
+        except BaseException:
+            os.close(fd)
+            os.remove(temporal)
+            raise
+        self._pid = os.getpid()
+        self.nombre, self.ruta, self._fd = nombre, ruta, fd
+        self._cola = queue.Queue()
+        self._seq = 0
+        self._pendientes = 0
+        self._en_curso = 0
+        self.encoladas = self.escritas = self.lotes = self.errores = 0
+        self._hilo = threading.Thread(target=self._ciclo, name='escritor-bitacora', daemon=True)
+        self._hilo.start()
+
+    def anotar(self, id_usuario, accion, detalles, id_orden, fecha):
+        """Escribe la entrada en el diario, antes del commit del cambio.
+        Devuelve (diario, entrada); la entrada se encola con confirmar()."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._iniciar()
+            self._seq += 1
+            entrada = (id_usuario, accion, detalles, id_orden, fecha, self._seq)
+            linea = json.dumps({"seq": self._seq, "id_usuario_accion": id_usuario, "accion": accion,
+                                "detalles": detalles, "id_orden_afectada": id_orden, "fecha_accion": fecha})
+            os.write(self._fd, (linea + "\n").encode('utf-8'))
+            if FSYNC:
+                os.fsync(self._fd)
+            self._en_curso += 1
+            return self.nombre, entrada
+
+    def confirmar(self, entrada):
+        """La transacción de la entrada hizo commit: pasa al hilo escritor."""
+        with self._lock:
+            self._en_curso -= 1
+            self._pendientes += 1
+            self.encoladas += 1
+            self._cola.put(entrada)
+
+    def descartar(self):
+        """La transacción de una entrada anotada hizo rollback."""
+        with self._lock:
+            self._en_curso -= 1
+
+    def _ciclo(self):
+        while True:
+            lote = [self._cola.get()]
+            limite = time.monotonic() + self.espera
+            while len(lote) < self.tamano_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self._cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+            self._escribir(lote)
+
+    def _escribir(self, lote):
+        filas = [entrada[:5] for entrada in lote]
+        escritas = [(self.nombre, entrada[5]) for entrada in lote]
+        while True:
+            try:
+                conn = db.pool.acquire()
+                try:
+                    conn.executemany(INSERTAR, filas)
+                    conn.executemany(ESCRITA, escritas)
+                    conn.commit()
+                finally:
+                    conn.close()
+                break
+            except Exception as e:
+                # Las entradas siguen en el diario; se reintenta sin perderlas
+                with self._lock:
+                    self.errores += 1
+                print(f"No se pudo escribir la bitácora, se reintenta: {e}")
+                time.sleep(1)
+
+        with self._lock:
+            self.escritas += len(lote)
+            self.lotes += 1
+            self._pendientes -= len(lote)
+            if self._pendientes == 0:
+                # Todo lo anotado ya está en la base (y no hay transacciones
+                # con entradas en curso): el diario puede empezar de cero
+                if self._en_curso == 0 and os.fstat(self._fd).st_size > TAMANO_MAXIMO_DIARIO:
+                    os.ftruncate(self._fd, 0)
+                self._vacio.notify_all()
+
+    def vaciar(self, timeout=None):
+        """Espera a que se escriban todas las entradas encoladas por este proceso."""
+        with self._lock:
+            if self._pid != os.getpid():
+                return True
+            return self._vacio.wait_for(lambda: self._pendientes == 0, timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "modo": MODO,
+                "encoladas": self.encoladas,
+                "escritas": self.escritas,
+                "pendientes": self._pendientes,
+                "en_curso": self._en_curso,
+                "lotes": self.lotes,
+                "errores": self.errores,
+            }
+
+
+escritor = EscritorBitacora()
+atexit.register(lambda: escritor.vaciar(timeout=10))
+
+
+def registrar(conn, id_usuario, accion, id_orden, detalles=None):
+    """Registra una acción de la bitácora para el cambio en curso en `conn`.
+
+    En modo estricto se inserta dentro de la transacción; en modo diferido se
+    anota en el diario ya y se encola cuando esa transacción hace commit (y se
+    descarta si hace rollback).
+    """
+    if MODO != 'diferido':
+        conn.execute(
+            "INSERT INTO bitacora (id_usuario_accion, accion, detalles, id_orden_afectada) VALUES (?, ?, ?, ?)",
+            (id_usuario, accion, detalles, id_orden)
+        )
+        return
+    diario, entrada = escritor.anotar(id_usuario, accion, detalles, id_orden, _ahora())
+    conn.al_confirmar(lambda: escritor.confirmar(entrada))
+    conn.al_descartar(escritor.descartar)
+    conn.execute(CONFIRMAR, (diario, entrada[5]))
+
+
+def _leer_diario(ruta):
+    entradas = []
+    with open(ruta, 'r', encoding='utf-8') as f:
+        for linea in f:
+            try:
+                entradas.append(json.loads(linea))
+            except ValueError:
+                # Última línea cortada por una caída a mitad de la escritura
+                continue
+    return entradas
+
+
+def reproducir_diarios(directorio=DIRECTORIO):
+    """Inserta las entradas de diarios de procesos que ya no existen.
+
+    Se llama al arrancar cada worker; los diarios de procesos vivos están
+    bloqueados y se saltan. Devuelve la cantidad de entradas recuperadas.
+    """
+    recuperadas = 0
+    for ruta in sorted(glob.glob(os.path.join(directorio, 'bitacora-*.journal'))):
+        if escritor._pid == os.getpid() and ruta == escritor.ruta:
+            continue
+        try:
+            fd = os.open(ruta, os.O_RDWR)
+        except FileNotFoundError:
+            continue  # otro worker lo terminó de reproducir
+        try:
+            if not _bloquear(fd):
+                continue
+            nombre = os.path.basename(ruta)
+            conn = db.pool.acquire()
+            try:
+                confirmadas = {fila[0] for fila in conn.execute(
+                    "SELECT seq FROM bitacora_confirmada WHERE diario = ?", (nombre,))}
+                # Sin fila: ya escrita, o de una transacción que hizo rollback
+                faltantes = [e for e in _leer_diario(ruta) if e.get("seq") in confirmadas]
+                if confirmadas:
+                    conn.executemany(INSERTAR, [(e["id_usuario_accion"], e["accion"], e.get("detalles"),
+                                                 e.get("id_orden_afectada"), e["fecha_accion"]) for e in faltantes])
+                    conn.execute("DELETE FROM bitacora_confirmada WHERE diario = ?", (nombre,))
+                    conn.commit()
+                os.remove(ruta)
+            finally:
+                conn.close()
+            recuperadas += len(faltantes)
+        finally:
+            os.close(fd)
+    if recuperadas:
+        print(f"Bitácora: se recuperaron {recuperadas} entradas de diarios anteriores")
+    return recuperadas
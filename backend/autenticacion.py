@@ -0,0 +1,254 @@
+# backend/autenticacion.py
+# Tokens firmados (JWT, HS256) para identificar al usuario en cada request.
+#
+# El inicio de sesión entrega un token corto con el id del usuario y su rol.
+# El decorador autenticado() verifica la firma y el vencimiento sin ir a la
+# base; para saber si el usuario sigue activo (o si le cambiaron el rol) usa
+# una caché LRU de filas de usuarios por worker. La migración 8 sube la
+# versión 'usuarios' en catalogos_version con cada cambio, así que, igual que
+# con los catálogos, un cambio hecho en otro worker se nota con una lectura
+# por clave primaria, que se hace a lo sumo cada AUTH_REVISION segundos.
+#
+# Variables de entorno:
+#   JWT_SECRETO         clave de firma, obligatoria: la misma en todos los
+#                       procesos y réplicas, para que un token firmado por
+#                       uno valga en los demás y después de reiniciar
+#   JWT_SECRETO_TEMPORAL  1 = sin JWT_SECRETO, generar una clave al azar por
+#                       proceso (solo para desarrollo y pruebas)
+#   JWT_MINUTOS         duración del token (por defecto 30)
+#   AUTH_CACHE          filas de usuarios en la caché de cada worker (1024)
+#   AUTH_REVISION       segundos entre lecturas de la versión (por defecto 2)
+#   AUTH_OBLIGATORIA    1 = rechazar requests sin token; 0 (por defecto) =
+#                       aceptar los ids del cuerpo como hasta ahora
+import functools
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+from flask import g, jsonify, request
+
+import db
+
+logger = logging.getLogger(__name__)
+
+SECRETO = os.environ.get('JWT_SECRETO')
+if not SECRETO:
+    if os.environ.get('JWT_SECRETO_TEMPORAL', '0') != '1':
+        raise RuntimeError("Falta JWT_SECRETO, la clave para firmar los tokens "
+                           "(JWT_SECRETO_TEMPORAL=1 usa una al azar, solo para desarrollo)")
+    SECRETO = secrets.token_hex(32)
+    logger.warning("JWT_SECRETO no está definido: se usa una clave temporal")
+ALGORITMO = 'HS256'
+MINUTOS = int(os.environ.get('JWT_MINUTOS', '30'))
+TAMANO_CACHE = int(os.environ.get('AUTH_CACHE', '1024'))
+REVISION = float(os.environ.get('AUTH_REVISION', '2'))
+OBLIGATORIA = os.environ.get('AUTH_OBLIGATORIA', '0') == '1'
+
+# Los mismos ids que crea database/schema.sql
+ROLES = {1: 'Analista', 2: 'Coordinador', 3: 'Administrador'}
+ADMINISTRADOR = 'Administrador'
+
+
+class TokenInvalido(Exception):
+    pass
+
+
+def emitir_token(usuario):
+    """Token firmado para una fila de usuarios. Devuelve (token, segundos de validez)."""
+    ahora = int(time.time())
+    claims = {
+        'sub': str(usuario['id_usuario']),
+        'rol': ROLES.get(usuario['id_rol']),
+        'iat': ahora,
+        'exp': ahora + MINUTOS * 60,
+    }
+    return jwt.encode(claims, SECRETO, algorithm=ALGORITMO), MINUTOS * 60
+
+
+def verificar_token(token):
+    """Claims de un token válido y vigente; TokenInvalido si no lo es."""
+    try:
+        claims = jwt.decode(token, SECRETO, algorithms=[ALGORITMO], options={'require': ['sub', 'exp']})
+        claims['id_usuario'] = int(claims['sub'])
+    except (jwt.InvalidTokenError, ValueError) as e:
+        raise TokenInvalido(str(e)) from e
+    return claims
+
+
+def buscar_por_email(email):
+    """Fila completa del usuario con ese correo (con el hash), o None."""
+    conn = db.pool.acquire()
+    try:
+        return conn.execute("SELECT * FROM usuarios WHERE email = ?", (email,)).fetchone()
+    finally:
+        conn.close()
+
+
+def guardar_hash(id_usuario, nuevo_hash):
+    conn = db.pool.acquire()
+    try:
+        conn.execute("UPDATE usuarios SET password_hash = ? WHERE id_usuario = ?", (nuevo_hash, id_usuario))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def resultado_login(usuario, password_valida):
+    """(cuerpo, estado) de /api/auth/login, ya verificada la contraseña.
+
+    Un correo inexistente y una contraseña incorrecta dan el mismo 401, y
+    una cuenta desactivada se informa solo a quien dio su contraseña: así
+    el login no revela qué correos existen ni cuáles están desactivados.
+    """
+    if usuario is None or not password_valida:
+        return {"error": "Credenciales inválidas"}, 401
+    if usuario['activo'] == 0:
+        return {"error": "Usuario desactivado"}, 403
+    datos = {campo: usuario[campo] for campo in ('id_usuario', 'nombre', 'apellido', 'email', 'id_rol')}
+    token, expira_en = emitir_token(usuario)
+    return {"message": "Inicio de sesión exitoso", "user": datos, "token": token, "expira_en": expira_en}, 200
+
+
+class CacheUsuarios:
+    """LRU de filas de usuarios (con el nombre del rol) de este worker."""
+
+    CONSULTA = """
+        SELECT u.id_usuario, u.nombre, u.apellido, u.email, u.id_rol, u.activo, r.nombre_rol
+        FROM usuarios u LEFT JOIN roles r ON r.id_rol = u.id_rol
+        WHERE u.id_usuario = ?
+    """
+
+    def __init__(self, tamano=TAMANO_CACHE, revision=REVISION):
+        self.tamano = tamano
+        self.revision = revision
+        self._lock = threading.Lock()
+        self._filas = OrderedDict()
+        self._version = None
+        self._revisada = 0.0
+        # Sube con cada invalidación: una fila leída antes de invalidar no se guarda
+        self._generacion = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _revisar_version(self, conn):
+        ahora = time.monotonic()
+        if ahora - self._revisada < self.revision:
+            return
+        fila = conn.execute("SELECT version FROM catalogos_version WHERE catalogo = 'usuarios'").fetchone()
+        version = fila['version'] if fila else 0
+        with self._lock:
+            self._revisada = ahora
+            if version != self._version:
+                self._filas.clear()
+                self._generacion += 1
+                self._version = version
+
+    def obtener(self, id_usuario):
+        """Fila del usuario como dict, o None si no existe."""
+        with self._lock:
+            if time.monotonic() - self._revisada < self.revision:
+                fila = self._filas.get(id_usuario)
+                if fila is not None:
+                    self._filas.move_to_end(id_usuario)
+                    self.hits += 1
+                    return fila
+
+        conn = db.pool.acquire()
+        try:
+            self._revisar_version(conn)
+            with self._lock:
+                fila = self._filas.get(id_usuario)
+                if fila is not None:
+                    self._filas.move_to_end(id_usuario)
+                    self.hits += 1
+                    return fila
+                self.misses += 1
+                generacion = self._generacion
+            row = conn.execute(self.CONSULTA, (id_usuario,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        fila = dict(row)
+        with self._lock:
+            if generacion == self._generacion:
+                self._filas[id_usuario] = fila
+                if len(self._filas) > self.tamano:
+                    self._filas.popitem(last=False)
+        return fila
+
+    def invalidar(self, id_usuario=None):
+        """Descarta un usuario (todos si no se indica) en este worker."""
+        with self._lock:
+            self._generacion += 1
+            if id_usuario is None:
+                self._filas.clear()
+            else:
+                self._filas.pop(id_usuario, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "usuarios": len(self._filas),
+                "tamano": self.tamano,
+                "version": self._version,
+            }
+
+
+cache = CacheUsuarios()
+
+
+def _token_del_request():
+    encabezado = request.headers.get('Authorization', '')
+    tipo, _, token = encabezado.partition(' ')
+    if tipo.lower() != 'bearer' or not token.strip():
+        return None
+    return token.strip()
+
+
+def permitido(usuario, roles):
+    """Si el usuario tiene alguno de los roles (el Administrador, siempre)."""
+    return not roles or usuario['nombre_rol'] in roles or usuario['nombre_rol'] == ADMINISTRADOR
+
+
+def autenticado(*roles, obligatoria=None):
+    """Exige un token válido de un usuario activo con alguno de los roles.
+
+    Sin roles basta con estar autenticado. Deja la fila del usuario en
+    g.usuario. Sin token el request sigue con g.usuario = None, salvo que
+    AUTH_OBLIGATORIA=1 o la ruta pida obligatoria=True.
+    """
+    def decorador(vista):
+        @functools.wraps(vista)
+        def envoltura(*args, **kwargs):
+            g.usuario = None
+            token = _token_del_request()
+            if token is None:
+                if OBLIGATORIA if obligatoria is None else obligatoria:
+                    return jsonify({"error": "Se requiere iniciar sesión"}), 401
+                return vista(*args, **kwargs)
+            try:
+                claims = verificar_token(token)
+            except TokenInvalido:
+                return jsonify({"error": "Token inválido o vencido"}), 401
+            usuario = cache.obtener(claims['id_usuario'])
+            if usuario is None or not usuario['activo']:
+                return jsonify({"error": "Usuario inexistente o desactivado"}), 401
+            if not permitido(usuario, roles):
+                return jsonify({"error": "No tiene permiso para esta operación"}), 403
+            g.usuario = usuario
+            return vista(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def id_usuario(valor_cuerpo=None):
+    """Id del usuario del token; sin token, el que vino en el cuerpo o la URL."""
+    usuario = g.get('usuario')
+    return usuario['id_usuario'] if usuario else valor_cuerpo
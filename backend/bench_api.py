@@ -0,0 +1,352 @@
+# backend/bench_api.py
+# Suite de carga de la API completa con volumen de producción.
+#
+# Genera datos sintéticos (datos_sinteticos.py) en una base temporal, o usa
+# una existente con --base, y recorre las rutas de app.py con dos
+# conductores:
+#   - cliente: el cliente de pruebas de Flask, con varios hilos en el mismo
+#     proceso (mide la aplicación sin la capa HTTP);
+#   - gunicorn: un Gunicorn local con varios workers, atacado por HTTP.
+# Cada escenario corre --segundos con --hilos concurrentes y se reporta, por
+# escenario, requests, errores, req/s y latencia p50/p95/p99 en JSON, para
+# comparar el resultado entre commits (--comparar resultado_anterior.json).
+#
+# Los escenarios de escritura (crear, enviar, pagar, lotes, importar)
+# modifican la base; con --base conviene trabajar sobre una copia.
+# La actualización de tipos de cambio no se incluye: depende de la API externa.
+#
+# Uso:
+#   python bench_api.py --salida bench.json
+#   python bench_api.py --usuarios 500 --ordenes 50000 --acciones-extra 0 --segundos 3
+#   python bench_api.py --base /tmp/datos --modo gunicorn --workers 4
+#   python bench_api.py --base /tmp/datos --comparar bench.json
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+PASSWORD = 'clave123'
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+def commit_actual():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=DIRECTORIO,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Datos:
+    """Ids de la base que usan los escenarios, leídos una vez antes de medir.
+
+    Las órdenes 'Creada' y 'Enviada' se reparten sin repetir entre los
+    escenarios de transición, para que cada request haga un cambio real.
+    """
+
+    def __init__(self, path):
+        conn = sqlite3.connect(path)
+        usuarios = conn.execute("SELECT id_usuario, id_rol, email FROM usuarios WHERE email LIKE '%@pagos.test'").fetchall()
+        self.coordinadores = [u[0] for u in usuarios if u[1] == 2]
+        self.analistas = [u[0] for u in usuarios if u[1] == 1]
+        self.emails = [u[2] for u in usuarios]
+        self.max_orden = conn.execute("SELECT MAX(id_orden) FROM ordenes_pago").fetchone()[0] or 1
+        self.monedas = [r[0] for r in conn.execute("SELECT id_moneda FROM monedas")]
+        self.tipos_pago = [r[0] for r in conn.execute("SELECT id_tipo_pago FROM tipos_pago")]
+        self._creadas = [r[0] for r in conn.execute("SELECT id_orden FROM ordenes_pago WHERE estado = 'Creada'")]
+        self._enviadas = [r[0] for r in conn.execute("SELECT id_orden FROM ordenes_pago WHERE estado = 'Enviada'")]
+        self.conteos = {tabla: conn.execute(f"SELECT COUNT(*) FROM {tabla}").fetchone()[0]
+                        for tabla in ('usuarios', 'ordenes_pago', 'bitacora')}
+        conn.close()
+        if not self.coordinadores or not self.analistas:
+            raise SystemExit("La base no tiene usuarios sintéticos (usuarioN@pagos.test); genérela con datos_sinteticos.py")
+        random.Random(7).shuffle(self._creadas)
+        random.Random(7).shuffle(self._enviadas)
+        self._lock = threading.Lock()
+
+    def tomar(self, estado, n=1):
+        """Saca n órdenes sin usar en `estado`; lista vacía si se agotaron."""
+        pila = self._creadas if estado == 'Creada' else self._enviadas
+        with self._lock:
+            tomadas = pila[-n:] if len(pila) >= n else []
+            del pila[len(pila) - len(tomadas):]
+        return tomadas
+
+
+def _orden_nueva(datos, rnd):
+    dia = datetime.date(2026, 1, 1) + datetime.timedelta(days=rnd.randint(0, 300))
+    return {"id_coordinador": rnd.choice(datos.coordinadores), "monto": round(rnd.uniform(10, 50000), 2),
+            "id_moneda": rnd.choice(datos.monedas), "id_tipo_pago": rnd.choice(datos.tipos_pago),
+            "fecha_factura": dia.isoformat(), "fecha_vencimiento": (dia + datetime.timedelta(days=30)).isoformat(),
+            "acreedor": f"Proveedor de carga {rnd.randint(1, 10 ** 6)}"}
+
+
+# Cada escenario devuelve (método, url, cuerpo JSON) o None si ya no quedan datos
+def _login(d, rnd):
+    return 'POST', '/api/auth/login', {"email": rnd.choice(d.emails), "password": PASSWORD}
+
+
+def _enviar(d, rnd):
+    ids = d.tomar('Creada')
+    return ids and ('PUT', f'/api/ordenes/{ids[0]}/enviar', {"id_usuario": rnd.choice(d.coordinadores)})
+
+
+def _pagar(d, rnd):
+    ids = d.tomar('Enviada')
+    return ids and ('PUT', f'/api/ordenes/{ids[0]}/pagar', {"id_analista": rnd.choice(d.analistas)})
+
+
+def _lote_enviar(d, rnd):
+    ids = d.tomar('Creada', 50)
+    return ids and ('PUT', '/api/ordenes/lote/enviar', {"ids": ids, "id_usuario": rnd.choice(d.coordinadores)})
+
+
+def _editar(d, rnd):
+    orden = _orden_nueva(d, rnd)
+    return 'PUT', f'/api/ordenes/{rnd.randint(1, d.max_orden)}', orden
+
+
+ESCENARIOS = {
+    "login": _login,
+    "catalogo_monedas": lambda d, rnd: ('GET', '/api/catalogos/monedas', None),
+    "catalogo_tipos_pago": lambda d, rnd: ('GET', '/api/catalogos/tipos_pago', None),
+    "catalogo_tipos_devolucion": lambda d, rnd: ('GET', '/api/catalogos/tipos_devolucion', None),
+    "ordenes_coordinador": lambda d, rnd: ('GET', f'/api/ordenes/{rnd.choice(d.coordinadores)}', None),
+    "ordenes_coordinador_filtro": lambda d, rnd: (
+        'GET', f'/api/ordenes/{rnd.choice(d.coordinadores)}?estado=Pagada&tipo_pago={rnd.choice(d.tipos_pago)}', None),
+    "enviadas": lambda d, rnd: ('GET', '/api/ordenes/enviadas?urgente=si', None),
+    "enviadas_busqueda": lambda d, rnd: ('GET', f'/api/ordenes/enviadas?buscar={rnd.choice(["ferre", "distri", "mora", "pacífico"])}', None),
+    "historial_pagina": lambda d, rnd: ('GET', '/api/ordenes/historial?limite=100', None),
+    "historial_busqueda": lambda d, rnd: (
+        'GET', f'/api/ordenes/historial?buscar={rnd.choice(["Núñez", "Arenal", "DC-0001", "construc"])}&limite=100', None),
+    "bitacora_pagina": lambda d, rnd: ('GET', '/api/bitacora?limite=100', None),
+    "resumen": lambda d, rnd: ('GET', '/api/reportes/summary', None),
+    "detalle": lambda d, rnd: ('GET', f'/api/ordenes/detalle/{rnd.randint(1, d.max_orden)}', None),
+    "crear_orden": lambda d, rnd: ('POST', '/api/ordenes', _orden_nueva(d, rnd)),
+    "editar_orden": _editar,
+    "enviar": _enviar,
+    "pagar": _pagar,
+    "lote_enviar": _lote_enviar,
+    "importar": lambda d, rnd: ('POST', '/api/ordenes/importar', [_orden_nueva(d, rnd) for _ in range(100)]),
+}
+
+
+class ClienteFlask:
+    """Cliente de pruebas de Flask (uno por hilo)."""
+
+    def __init__(self, app):
+        self._cliente = app.test_client()
+
+    def llamar(self, metodo, url, cuerpo):
+        r = self._cliente.open(url, method=metodo, json=cuerpo)
+        r.get_data()
+        return r.status_code
+
+
+class ClienteHTTP:
+    """Sesión HTTP con keep-alive contra el Gunicorn local (una por hilo)."""
+
+    def __init__(self, base_url):
+        import requests
+        self._base = base_url
+        self._sesion = requests.Session()
+
+    def llamar(self, metodo, url, cuerpo):
+        r = self._sesion.request(metodo, self._base + url, json=cuerpo, timeout=60)
+        return r.status_code
+
+
+def medir(crear_cliente, datos, escenarios, segundos, hilos):
+    """Corre cada escenario por separado y devuelve sus estadísticas."""
+    resultados = {}
+    for nombre in escenarios:
+        generador = ESCENARIOS[nombre]
+        latencias, errores = [], [0]
+        lock = threading.Lock()
+        fin = time.perf_counter() + segundos
+
+        def trabajador(semilla):
+            cliente = crear_cliente()
+            rnd = random.Random(semilla)
+            propias, fallidas = [], 0
+            while time.perf_counter() < fin:
+                peticion = generador(datos, rnd)
+                if not peticion:
+                    break  # no quedan órdenes en el estado que necesita el escenario
+                inicio = time.perf_counter()
+                try:
+                    status = cliente.llamar(*peticion)
+                except Exception:
+                    status = 599
+                propias.append((time.perf_counter() - inicio) * 1000)
+                if status >= 400:
+                    fallidas += 1
+            with lock:
+                latencias.extend(propias)
+                errores[0] += fallidas
+
+        trabajadores = [threading.Thread(target=trabajador, args=(f"{nombre}-{i}",)) for i in range(hilos)]
+        inicio = time.perf_counter()
+        for t in trabajadores:
+            t.start()
+        for t in trabajadores:
+            t.join()
+        total = time.perf_counter() - inicio
+        resultados[nombre] = {
+            "requests": len(latencias), "errores": errores[0],
+            "rps": round(len(latencias) / total, 1) if total else 0.0,
+            "p50_ms": round(percentil(latencias, 50), 2), "p95_ms": round(percentil(latencias, 95), 2),
+            "p99_ms": round(percentil(latencias, 99), 2),
+        }
+        print(f"  {nombre:<28}{resultados[nombre]['rps']:>9.1f} req/s  p95 {resultados[nombre]['p95_ms']:>8.1f} ms"
+              f"  errores {errores[0]}", file=sys.stderr)
+    return resultados
+
+
+def _esperar_servidor(base_url, proceso, espera=60):
+    import requests
+    limite = time.monotonic() + espera
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"El servidor terminó al arrancar (código {proceso.returncode})")
+        try:
+            if requests.get(base_url + '/', timeout=1).status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("El servidor no respondió a tiempo")
+
+
+def correr_gunicorn(disco, datos, escenarios, args):
+    entorno = dict(os.environ, RENDER_DISK_PATH=disco)
+    base_url = f"http://127.0.0.1:{args.puerto}"
+    proceso = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(args.workers), '--threads', str(args.hilos_gunicorn),
+         '--bind', f"127.0.0.1:{args.puerto}", '--log-level', 'warning', 'app:app'],
+        cwd=DIRECTORIO, env=entorno)
+    try:
+        _esperar_servidor(base_url, proceso)
+        return medir(lambda: ClienteHTTP(base_url), datos, escenarios, args.segundos, args.hilos)
+    finally:
+        proceso.terminate()
+        proceso.wait(timeout=30)
+
+
+def comparar(anterior, actual):
+    """Imprime la variación de req/s y p95 respecto de un resultado anterior."""
+    print(f"comparando {anterior.get('commit')} -> {actual.get('commit')}", file=sys.stderr)
+    for modo, escenarios in actual["resultados"].items():
+        previos = anterior.get("resultados", {}).get(modo) or {}
+        for nombre, r in escenarios.items():
+            p = previos.get(nombre)
+            if not p or not p["rps"] or not p["p95_ms"]:
+                continue
+            print(f"  {modo:<9}{nombre:<28}req/s {100 * (r['rps'] / p['rps'] - 1):>+7.1f} %"
+                  f"   p95 {100 * (r['p95_ms'] / p['p95_ms'] - 1):>+7.1f} %", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de toda la API con datos sintéticos.")
+    parser.add_argument('--base', help="Directorio RENDER_DISK_PATH con database/pagos.db ya generada")
+    parser.add_argument('--usuarios', type=int, default=10000)
+    parser.add_argument('--ordenes', type=int, default=2000000)
+    parser.add_argument('--acciones-extra', type=int, default=5000000,
+                        help="Entradas de bitácora además del recorrido de cada orden (~2,5 por orden)")
+    parser.add_argument('--modo', choices=('cliente', 'gunicorn', 'ambos'), default='ambos')
+    parser.add_argument('--escenarios', help="Lista separada por comas (por defecto todos)")
+    parser.add_argument('--segundos', type=float, default=10, help="Duración de cada escenario")
+    parser.add_argument('--hilos', type=int, default=8, help="Clientes concurrentes")
+    parser.add_argument('--workers', type=int, default=max(2, os.cpu_count() or 2))
+    parser.add_argument('--hilos-gunicorn', type=int, default=4, help="Hilos por worker de Gunicorn")
+    parser.add_argument('--puerto', type=int, default=8765)
+    parser.add_argument('--salida', help="Archivo JSON de resultados (por defecto la salida estándar)")
+    parser.add_argument('--comparar', help="Resultado JSON anterior contra el cual comparar")
+    args = parser.parse_args()
+
+    escenarios = args.escenarios.split(',') if args.escenarios else list(ESCENARIOS)
+    desconocidos = [e for e in escenarios if e not in ESCENARIOS]
+    if desconocidos:
+        parser.error(f"Escenarios desconocidos: {', '.join(desconocidos)}")
+    hay_gunicorn = importlib.util.find_spec('gunicorn') is not None
+    if args.modo == 'gunicorn' and not hay_gunicorn:
+        parser.error("Gunicorn no está instalado (pip install gunicorn)")
+
+    # Sin descargas de tipos de cambio durante la medición
+    os.environ.setdefault('TIPOS_CAMBIO_INTERVALO', '0')
+    temporal = None
+    disco = args.base
+    if not disco:
+        temporal = disco = tempfile.mkdtemp()
+    os.environ['RENDER_DISK_PATH'] = disco
+    os.environ.setdefault('JWT_SECRETO', 'benchmark-solo-para-pruebas-locales-0000')
+    try:
+        import datos_sinteticos
+        import db
+        path = db.DATABASE_PATH
+        if temporal:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            inicio = time.perf_counter()
+            datos_sinteticos.generar(path, args.usuarios, args.ordenes, args.acciones_extra)
+            print(f"datos generados en {time.perf_counter() - inicio:.0f} s", file=sys.stderr)
+        elif not os.path.exists(path):
+            parser.error(f"No existe {path}")
+        datos = Datos(path)
+
+        reporte = {
+            "commit": commit_actual(),
+            "fecha": datetime.datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "cpus": os.cpu_count(),
+            "config": {"segundos": args.segundos, "hilos": args.hilos, "workers": args.workers,
+                       "hilos_gunicorn": args.hilos_gunicorn,
+                       "bcrypt_rounds": int(os.environ.get('BCRYPT_ROUNDS', '12')),
+                       "db_pool_size": int(os.environ.get('DB_POOL_SIZE', '8'))},
+            "datos": datos.conteos,
+            "resultados": {},
+        }
+        if args.modo in ('cliente', 'ambos'):
+            print("cliente de pruebas de Flask", file=sys.stderr)
+            import app as aplicacion
+            aplicacion.init_db()
+            reporte["resultados"]["cliente"] = medir(lambda: ClienteFlask(aplicacion.app), datos, escenarios,
+                                                     args.segundos, args.hilos)
+        if args.modo in ('gunicorn', 'ambos'):
+            if hay_gunicorn:
+                print(f"gunicorn con {args.workers} workers", file=sys.stderr)
+                reporte["resultados"]["gunicorn"] = correr_gunicorn(disco, datos, escenarios, args)
+            else:
+                reporte["omitidos"] = {"gunicorn": "Gunicorn no está instalado"}
+
+        texto = json.dumps(reporte, indent=2, ensure_ascii=False)
+        if args.salida:
+            with open(args.salida, 'w', encoding='utf-8') as f:
+                f.write(texto + "\n")
+        else:
+            print(texto)
+        if args.comparar:
+            with open(args.comparar, 'r', encoding='utf-8') as f:
+                comparar(json.load(f), reporte)
+    finally:
+        if temporal:
+            shutil.rmtree(temporal, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+# backend/bench_arranque.py
+# Mide el arranque en frío y el rendimiento estable de tres formas de servir
+# la API sobre la misma base:
+#   - flask: `flask run` (servidor de desarrollo, lo que usaba el Dockerfile);
+#   - gunicorn_simple: `gunicorn app:app` sin gunicorn.conf.py (cada worker
+#     importa la app y arranca en frío);
+#   - gunicorn: con gunicorn.conf.py (preload_app y calentamiento).
+# Para cada una se reporta el tiempo desde lanzar el proceso hasta la primera
+# respuesta, la latencia de los primeros requests de algunas rutas y luego
+# req/s y p50/p95/p99 con bench_api.medir.
+#
+# Uso:
+#   python bench_arranque.py --ordenes 500000 --salida arranque.json
+#   python bench_arranque.py --base /tmp/datos --modos gunicorn_simple,gunicorn
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from bench_api import DIRECTORIO, PASSWORD, ClienteHTTP, Datos, commit_actual, medir
+
+ESCENARIOS = ['catalogo_monedas', 'historial_pagina', 'resumen', 'login']
+
+
+def comando(modo, args):
+    bind = f"127.0.0.1:{args.puerto}"
+    if modo == 'flask':
+        return [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(args.puerto)], DIRECTORIO
+    gunicorn = [sys.executable, '-m', 'gunicorn', '--bind', bind, '--log-level', 'warning']
+    if modo == 'gunicorn_simple':
+        # Desde otro directorio para que no tome gunicorn.conf.py
+        return gunicorn + ['--chdir', DIRECTORIO, '--workers', str(args.workers), '--threads', str(args.hilos_gunicorn),
+                           '--worker-class', 'gthread', 'app:app'], tempfile.gettempdir()
+    return gunicorn + ['--config', 'gunicorn.conf.py', 'app:app'], DIRECTORIO
+
+
+def primeros_requests(base_url, datos):
+    """Latencia del primer request a cada ruta, en ms."""
+    sesion = requests.Session()
+    rutas = [('GET', '/api/catalogos/monedas', None), ('GET', '/api/ordenes/historial?limite=100', None),
+             ('GET', '/api/reportes/summary', None),
+             ('POST', '/api/auth/login', {"email": datos.emails[0], "password": PASSWORD})]
+    resultado = {}
+    for metodo, url, cuerpo in rutas:
+        inicio = time.perf_counter()
+        r = sesion.request(metodo, base_url + url, json=cuerpo, timeout=60)
+        resultado[url.split('?')[0]] = {"status": r.status_code, "ms": round((time.perf_counter() - inicio) * 1000, 1)}
+    return resultado
+
+
+def correr(modo, disco, datos, args):
+    argv, cwd = comando(modo, args)
+    entorno = dict(os.environ, RENDER_DISK_PATH=disco, WEB_CONCURRENCY=str(args.workers),
+                   GUNICORN_HILOS=str(args.hilos_gunicorn))
+    base_url = f"http://127.0.0.1:{args.puerto}"
+    inicio = time.perf_counter()
+    # El servidor de desarrollo escribe una línea por request
+    salida = subprocess.DEVNULL if modo == 'flask' else None
+    proceso = subprocess.Popen(argv, cwd=cwd, env=entorno, stdout=salida, stderr=salida)
+    try:
+        while True:
+            if proceso.poll() is not None:
+                raise RuntimeError(f"{modo} terminó al arrancar (código {proceso.returncode})")
+            if time.perf_counter() - inicio > 120:
+                raise RuntimeError(f"{modo} no respondió a tiempo")
+            try:
+                if requests.get(base_url + '/', timeout=5).status_code == 200:
+                    break
+            except requests.ConnectionError:
+                time.sleep(0.01)
+        listo = time.perf_counter() - inicio
+        resultado = {"segundos_hasta_primera_respuesta": round(listo, 3),
+                     "primeros_requests": primeros_requests(base_url, datos)}
+        print(f"{modo}: primera respuesta a los {listo:.2f} s", file=sys.stderr)
+        resultado["estable"] = medir(lambda: ClienteHTTP(base_url), datos, ESCENARIOS, args.segundos, args.hilos)
+        return resultado
+    finally:
+        proceso.terminate()
+        proceso.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arranque en frío y rendimiento estable según el servidor.")
+    parser.add_argument('--base', help="Directorio RENDER_DISK_PATH con database/pagos.db ya generada")
+    parser.add_argument('--usuarios', type=int, default=500)
+    parser.add_argument('--ordenes', type=int, default=200000)
+    parser.add_argument('--modos', default='flask,gunicorn_simple,gunicorn')
+    parser.add_argument('--segundos', type=float, default=10, help="Duración de cada escenario estable")
+    parser.add_argument('--hilos', type=int, default=16, help="Clientes concurrentes")
+    parser.add_argument('--workers', type=int, default=(os.cpu_count() or 1) * 2 + 1)
+    parser.add_argument('--hilos-gunicorn', type=int, default=4)
+    parser.add_argument('--puerto', type=int, default=8767)
+    parser.add_argument('--salida', help="Archivo JSON de resultados (por defecto la salida estándar)")
+    args = parser.parse_args()
+
+    os.environ.setdefault('TIPOS_CAMBIO_INTERVALO', '0')
+    temporal = None
+    disco = args.base
+    if not disco:
+        temporal = disco = tempfile.mkdtemp()
+    os.environ['RENDER_DISK_PATH'] = disco
+    os.environ.setdefault('JWT_SECRETO', 'benchmark-solo-para-pruebas-locales-0000')
+    try:
+        import datos_sinteticos
+        import db
+        path = db.DATABASE_PATH
+        if temporal:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            datos_sinteticos.generar(path, args.usuarios, args.ordenes)
+        elif not os.path.exists(path):
+            parser.error(f"No existe {path}")
+        # Las migraciones se aplican antes: se mide el arranque de siempre, no el primero
+        db.init_db()
+        datos = Datos(path)
+
+        reporte = {
+            "commit": commit_actual(),
+            "fecha": datetime.datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "cpus": os.cpu_count(),
+            "config": {"segundos": args.segundos, "hilos": args.hilos, "workers": args.workers,
+                       "hilos_gunicorn": args.hilos_gunicorn,
+                       "bcrypt_rounds": int(os.environ.get('BCRYPT_ROUNDS', '12'))},
+            "datos": datos.conteos,
+            "resultados": {},
+        }
+        for modo in args.modos.split(','):
+            reporte["resultados"][modo] = correr(modo, disco, datos, args)
+
+        texto = json.dumps(reporte, indent=2, ensure_ascii=False)
+        if args.salida:
+            with open(args.salida, 'w', encoding='utf-8') as f:
+                f.write(texto + "\n")
+        else:
+            print(texto)
+    finally:
+        if temporal:
+            shutil.rmtree(temporal, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
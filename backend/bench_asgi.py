@@ -0,0 +1,251 @@
+# backend/bench_asgi.py
+# Compara el modo ASGI (uvicorn asgi:app, un proceso) con Gunicorn sync
+# (app:app con --workers y --threads) sobre la misma base:
+#   - carga: req/s y latencia p50/p95/p99 de algunas rutas con --concurrencia
+#     clientes simultáneos;
+#   - conexiones: abre --conexiones conexiones SSE a la cola de enviadas y
+#     mide cuántas quedan establecidas, la latencia de una ruta normal
+#     mientras siguen abiertas y cuántas reciben un cambio de estado.
+# Los clientes son corrutinas con httpx, así el generador de carga no es el
+# límite al mantener miles de conexiones.
+#
+# Uso:
+#   python bench_asgi.py --ordenes 100000 --conexiones 2000
+#   python bench_asgi.py --base /tmp/datos --modos asgi --salida asgi.json
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench_api import DIRECTORIO, PASSWORD, Datos, _esperar_servidor, commit_actual, percentil
+
+ESCENARIOS = {
+    'catalogos': lambda d, rnd: ('GET', '/api/catalogos/monedas', None),
+    'historial': lambda d, rnd: ('GET', '/api/ordenes/historial?limite=100', None),
+    'login': lambda d, rnd: ('POST', '/api/auth/login', {"email": rnd.choice(d.emails), "password": PASSWORD}),
+}
+
+
+def comando(modo, args):
+    if modo == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', '--workers', str(args.workers), '--threads', str(args.hilos_gunicorn),
+                '--bind', f"127.0.0.1:{args.puerto}", '--log-level', 'warning', 'app:app']
+    return [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(args.puerto),
+            '--log-level', 'warning', '--no-access-log']
+
+
+def estadisticas(latencias, errores, segundos):
+    return {
+        "requests": len(latencias), "errores": errores,
+        "rps": round(len(latencias) / segundos, 1) if segundos else 0.0,
+        "p50_ms": round(percentil(latencias, 50), 2), "p95_ms": round(percentil(latencias, 95), 2),
+        "p99_ms": round(percentil(latencias, 99), 2),
+    }
+
+
+async def carga(base_url, datos, nombre, segundos, concurrencia):
+    generador = ESCENARIOS[nombre]
+    latencias, errores = [], [0]
+    limites = httpx.Limits(max_connections=concurrencia, max_keepalive_connections=concurrencia)
+    async with httpx.AsyncClient(base_url=base_url, limits=limites, timeout=30) as cliente:
+        fin = time.perf_counter() + segundos
+
+        async def trabajador(semilla):
+            rnd = random.Random(semilla)
+            while time.perf_counter() < fin:
+                metodo, url, cuerpo = generador(datos, rnd)
+                inicio = time.perf_counter()
+                try:
+                    status = (await cliente.request(metodo, url, json=cuerpo)).status_code
+                except httpx.HTTPError:
+                    status = 599
+                latencias.append((time.perf_counter() - inicio) * 1000)
+                if status >= 400:
+                    errores[0] += 1
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(trabajador(f"{nombre}-{i}") for i in range(concurrencia)))
+        return estadisticas(latencias, errores[0], time.perf_counter() - inicio)
+
+
+async def conexiones(base_url, path, datos, cantidad, espera):
+    """Abre `cantidad` conexiones SSE y mide el servicio mientras siguen abiertas."""
+    conn = sqlite3.connect(path)
+    seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM eventos_enviadas").fetchone()[0]
+    conn.close()
+    establecidas, recibidas = [0], [0]
+    abiertas = asyncio.Event()
+    cambio = asyncio.Event()
+    sin_limite = httpx.Limits(max_connections=None, max_keepalive_connections=0)
+    tiempo = httpx.Timeout(None, connect=espera)
+    async with httpx.AsyncClient(base_url=base_url, limits=sin_limite, timeout=tiempo) as cliente:
+
+        async def suscriptor():
+            # Reanuda desde el último seq para no bajar el snapshot completo
+            try:
+                async with cliente.stream('GET', '/api/ordenes/enviadas/eventos',
+                                          headers={'Last-Event-ID': str(seq)}) as respuesta:
+                    if respuesta.status_code != 200:
+                        return
+                    lineas = respuesta.aiter_lines()
+                    async for linea in lineas:
+                        if linea.startswith('retry:'):
+                            establecidas[0] += 1
+                            break
+                    await abiertas.wait()
+                    async for linea in lineas:
+                        if linea.startswith('event: alta'):
+                            recibidas[0] += 1
+                            if recibidas[0] == establecidas[0]:
+                                cambio.set()
+                            break
+            except httpx.HTTPError:
+                pass
+
+        tareas = [asyncio.create_task(suscriptor()) for _ in range(cantidad)]
+        inicio = time.perf_counter()
+        while establecidas[0] < cantidad and time.perf_counter() - inicio < espera:
+            await asyncio.sleep(0.1)
+        tiempo_apertura = time.perf_counter() - inicio
+        abiertas.set()
+
+        # Una ruta normal mientras las conexiones siguen abiertas
+        latencias, errores = [], 0
+        async with httpx.AsyncClient(base_url=base_url, timeout=5) as otro:
+            for _ in range(20):
+                inicio = time.perf_counter()
+                try:
+                    status = (await otro.get('/api/catalogos/monedas')).status_code
+                except httpx.HTTPError:
+                    status = 599
+                latencias.append((time.perf_counter() - inicio) * 1000)
+                errores += status >= 400
+
+            # Un cambio de estado que tiene que llegar a todas las conexiones
+            id_orden = datos.tomar('Creada')
+            entrega_ms = None
+            if id_orden and establecidas[0]:
+                inicio = time.perf_counter()
+                try:
+                    await otro.put(f'/api/ordenes/{id_orden[0]}/enviar', json={"id_usuario": datos.coordinadores[0]})
+                    await asyncio.wait_for(cambio.wait(), espera)
+                except (httpx.HTTPError, asyncio.TimeoutError):
+                    pass
+                entrega_ms = round((time.perf_counter() - inicio) * 1000, 1)
+
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+    return {
+        "pedidas": cantidad, "establecidas": establecidas[0], "segundos_apertura": round(tiempo_apertura, 2),
+        "otra_ruta": estadisticas(latencias, errores, sum(latencias) / 1000),
+        "recibieron_cambio": recibidas[0], "entrega_ms": entrega_ms,
+    }
+
+
+def correr(modo, disco, path, datos, args):
+    entorno = dict(os.environ, RENDER_DISK_PATH=disco)
+    base_url = f"http://127.0.0.1:{args.puerto}"
+    proceso = subprocess.Popen(comando(modo, args), cwd=DIRECTORIO, env=entorno)
+    try:
+        _esperar_servidor(base_url, proceso)
+        resultado = {}
+        for nombre in args.escenarios:
+            resultado[nombre] = asyncio.run(carga(base_url, datos, nombre, args.segundos, args.concurrencia))
+            print(f"  {modo:<9}{nombre:<12}{resultado[nombre]['rps']:>9.1f} req/s  p95 "
+                  f"{resultado[nombre]['p95_ms']:>8.1f} ms  errores {resultado[nombre]['errores']}", file=sys.stderr)
+        if args.conexiones:
+            r = asyncio.run(conexiones(base_url, path, datos, args.conexiones, args.espera))
+            resultado["conexiones_sse"] = r
+            print(f"  {modo:<9}SSE {r['establecidas']}/{r['pedidas']} abiertas, otra ruta p95 "
+                  f"{r['otra_ruta']['p95_ms']:.1f} ms (errores {r['otra_ruta']['errores']}), "
+                  f"{r['recibieron_cambio']} recibieron el cambio", file=sys.stderr)
+        return resultado
+    finally:
+        proceso.terminate()
+        proceso.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Modo ASGI contra Gunicorn sync.")
+    parser.add_argument('--base', help="Directorio RENDER_DISK_PATH con database/pagos.db ya generada")
+    parser.add_argument('--usuarios', type=int, default=500)
+    parser.add_argument('--ordenes', type=int, default=100000)
+    parser.add_argument('--modos', default='gunicorn,asgi')
+    parser.add_argument('--escenarios', default=','.join(ESCENARIOS))
+    parser.add_argument('--segundos', type=float, default=10, help="Duración de cada escenario de carga")
+    parser.add_argument('--concurrencia', type=int, default=64, help="Clientes simultáneos en la carga")
+    parser.add_argument('--conexiones', type=int, default=2000, help="Conexiones SSE simultáneas (0 = no medir)")
+    parser.add_argument('--espera', type=float, default=20, help="Segundos para abrir las conexiones")
+    parser.add_argument('--workers', type=int, default=max(2, os.cpu_count() or 2))
+    parser.add_argument('--hilos-gunicorn', type=int, default=4, help="Hilos por worker de Gunicorn")
+    parser.add_argument('--puerto', type=int, default=8766)
+    parser.add_argument('--salida', help="Archivo JSON de resultados (por defecto la salida estándar)")
+    args = parser.parse_args()
+    args.escenarios = [e for e in args.escenarios.split(',') if e]
+    desconocidos = [e for e in args.escenarios if e not in ESCENARIOS]
+    if desconocidos:
+        parser.error(f"Escenarios desconocidos: {', '.join(desconocidos)}")
+
+    # Cada conexión es un descriptor en el cliente y otro en el servidor
+    blando, duro = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if blando < 2 * args.conexiones + 1024:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(duro, 2 * args.conexiones + 1024), duro))
+
+    os.environ.setdefault('TIPOS_CAMBIO_INTERVALO', '0')
+    temporal = None
+    disco = args.base
+    if not disco:
+        temporal = disco = tempfile.mkdtemp()
+    os.environ['RENDER_DISK_PATH'] = disco
+    os.environ.setdefault('JWT_SECRETO', 'benchmark-solo-para-pruebas-locales-0000')
+    try:
+        import datos_sinteticos
+        import db
+        path = db.DATABASE_PATH
+        if temporal:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            datos_sinteticos.generar(path, args.usuarios, args.ordenes)
+        elif not os.path.exists(path):
+            parser.error(f"No existe {path}")
+        db.init_db()
+        datos = Datos(path)
+
+        reporte = {
+            "commit": commit_actual(),
+            "fecha": datetime.datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "cpus": os.cpu_count(),
+            "config": {"segundos": args.segundos, "concurrencia": args.concurrencia, "conexiones": args.conexiones,
+                       "workers": args.workers, "hilos_gunicorn": args.hilos_gunicorn,
+                       "bcrypt_rounds": int(os.environ.get('BCRYPT_ROUNDS', '12'))},
+            "datos": datos.conteos,
+            "resultados": {},
+        }
+        for modo in args.modos.split(','):
+            reporte["resultados"][modo] = correr(modo, disco, path, datos, args)
+
+        texto = json.dumps(reporte, indent=2, ensure_ascii=False)
+        if args.salida:
+            with open(args.salida, 'w', encoding='utf-8') as f:
+                f.write(texto + "\n")
+        else:
+            print(texto)
+    finally:
+        if temporal:
+            shutil.rmtree(temporal, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# backend/bench_auth.py
+# Costo por request de la autenticación con token (autenticacion.py):
+# verificar la firma del JWT y buscar al usuario en la caché LRU del worker,
+# contra el diseño que va a la base en cada request (SELECT del usuario con
+# su rol por clave primaria).
+#
+# Mide la verificación sola (µs por llamada) y el request completo con el
+# cliente de pruebas de Flask sobre GET /api/auth/yo, con varios hilos.
+#
+# Uso:
+#   python bench_auth.py
+#   python bench_auth.py --usuarios 5000 --iteraciones 50000 --hilos 8
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from bench_api import percentil
+
+
+def micro(nombre, funcion, argumentos, iteraciones):
+    inicio = time.perf_counter()
+    for i in range(iteraciones):
+        funcion(argumentos[i % len(argumentos)])
+    total = time.perf_counter() - inicio
+    print(f"{nombre:<28}{total / iteraciones * 1e6:>10.1f}")
+
+
+def carga(cliente_de, tokens, hilos, requests_por_hilo):
+    latencias = []
+    lock = threading.Lock()
+
+    def trabajador(semilla):
+        c = cliente_de()
+        rnd = random.Random(semilla)
+        propias = []
+        for _ in range(requests_por_hilo):
+            token = rnd.choice(tokens)
+            inicio = time.perf_counter()
+            r = c.get('/api/auth/yo', headers={'Authorization': f'Bearer {token}'})
+            propias.append((time.perf_counter() - inicio) * 1000)
+            assert r.status_code == 200, r.get_data(as_text=True)
+        with lock:
+            latencias.extend(propias)
+
+    threads = [threading.Thread(target=trabajador, args=(i,)) for i in range(hilos)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencias, time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la verificación de tokens.")
+    parser.add_argument('--usuarios', type=int, default=2000)
+    parser.add_argument('--activos', type=int, default=200, help="Usuarios distintos que hacen requests")
+    parser.add_argument('--iteraciones', type=int, default=20000)
+    parser.add_argument('--hilos', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=2000, help="Requests por hilo")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['RENDER_DISK_PATH'] = tmp
+    os.environ.setdefault('JWT_SECRETO', 'benchmark-solo-para-pruebas-locales-0000')
+    try:
+        import datos_sinteticos
+        os.makedirs(os.path.join(tmp, 'database'))
+        datos_sinteticos.generar(os.path.join(tmp, 'database', 'pagos.db'), usuarios=args.usuarios, ordenes=0)
+        import app as aplicacion
+        import autenticacion
+        import db
+        aplicacion.init_db()
+
+        conn = db.pool.acquire()
+        filas = conn.execute("SELECT * FROM usuarios ORDER BY id_usuario LIMIT ?", (args.activos,)).fetchall()
+        conn.close()
+        tokens = [autenticacion.emitir_token(fila)[0] for fila in filas]
+        ids = [fila['id_usuario'] for fila in filas]
+
+        def por_base(id_usuario):
+            conn = db.pool.acquire()
+            try:
+                return conn.execute(autenticacion.CacheUsuarios.CONSULTA, (id_usuario,)).fetchone()
+            finally:
+                conn.close()
+
+        cache = autenticacion.cache
+        print(f"{len(tokens)} usuarios activos, {args.iteraciones} verificaciones")
+        print(f"{'verificación':<28}{'µs/req':>10}")
+        micro("solo firma JWT", autenticacion.verificar_token, tokens, args.iteraciones)
+        micro("SELECT usuario (base)", por_base, ids, args.iteraciones)
+        micro("JWT + SELECT usuario", lambda t: por_base(autenticacion.verificar_token(t)['id_usuario']),
+              tokens, args.iteraciones)
+        micro("JWT + caché LRU", lambda t: cache.obtener(autenticacion.verificar_token(t)['id_usuario']),
+              tokens, args.iteraciones)
+        print(f"caché: {cache.stats()}")
+
+        # Request completo: con la caché de tamaño 0 cada request lee al usuario
+        # de la base (la versión se sigue leyendo cada AUTH_REVISION segundos)
+        print(f"\n{args.hilos} hilos x {args.requests} requests a GET /api/auth/yo")
+        print(f"{'diseño':<16}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'media ms':>10}")
+        tamano = cache.tamano
+        for nombre, tamano_cache in (("base", 0), ("caché LRU", tamano)):
+            cache.tamano = tamano_cache
+            cache.invalidar()
+            latencias, total = carga(aplicacion.app.test_client, tokens, args.hilos, args.requests)
+            print(f"{nombre:<16}{len(latencias) / total:>9.0f}{percentil(latencias, 50):>9.2f}"
+                  f"{percentil(latencias, 99):>9.2f}{statistics.mean(latencias):>10.2f}")
+        cache.tamano = tamano
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
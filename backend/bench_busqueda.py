@@ -0,0 +1,81 @@
+# backend/bench_busqueda.py
+# Compara la búsqueda anterior con LIKE '%término%' contra el índice FTS5
+# sobre una base sintética (por defecto 1 millón de órdenes).
+#
+# Uso:
+#   python bench_busqueda.py --ordenes 1000000
+#   python bench_busqueda.py --base /tmp/pagos_grande.db   (reutiliza una base)
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import datos_sinteticos
+from db import aplicar_migraciones
+from busqueda import fts_query
+
+TERMINOS = ['ferre', 'nunez', 'Pérez', 'distribuidora pacifico', 'zzz']
+
+SQL_BASE = """
+    SELECT o.*, m.codigo_moneda, u.nombre as coordinador_nombre, u.apellido as coordinador_apellido
+    FROM ordenes_pago o
+    JOIN monedas m ON o.id_moneda = m.id_moneda
+    JOIN usuarios u ON o.id_coordinador = u.id_usuario
+"""
+
+SQL_LIKE = SQL_BASE + """
+    WHERE (o.acreedor LIKE ? OR u.nombre LIKE ? OR u.apellido LIKE ?)
+    ORDER BY o.id_orden DESC
+"""
+
+SQL_FTS = SQL_BASE + """
+    JOIN ordenes_busqueda f ON f.rowid = o.id_orden
+    WHERE f.ordenes_busqueda MATCH ?
+    ORDER BY f.rank, o.id_orden DESC
+"""
+
+
+def medir(conn, sql, params, repeticiones):
+    tiempos = []
+    filas = 0
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        filas = len(conn.execute(sql, params).fetchall())
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos), filas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de búsqueda LIKE vs FTS5.")
+    parser.add_argument('--ordenes', type=int, default=1000000)
+    parser.add_argument('--base', help="Base ya generada (se le aplican las migraciones)")
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = None
+    ruta = args.base
+    if not ruta:
+        tmp = tempfile.mkdtemp()
+        ruta = os.path.join(tmp, 'pagos.db')
+        print(f"Generando {args.ordenes} órdenes...")
+        datos_sinteticos.generar(ruta, usuarios=1000, ordenes=args.ordenes)
+    try:
+        conn = sqlite3.connect(ruta)
+        aplicar_migraciones(conn)
+        print(f"{'término':<26}{'LIKE ms':>10}{'filas':>9}{'FTS5 ms':>10}{'filas':>9}{'x':>8}")
+        for termino in TERMINOS:
+            like = f"%{termino}%"
+            ms_like, filas_like = medir(conn, SQL_LIKE, (like, like, like), args.repeticiones)
+            ms_fts, filas_fts = medir(conn, SQL_FTS, (fts_query(termino),), args.repeticiones)
+            print(f"{termino:<26}{ms_like:>10.1f}{filas_like:>9}{ms_fts:>10.1f}{filas_fts:>9}{ms_like / max(ms_fts, 0.001):>8.1f}")
+        conn.close()
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# backend/bench_idempotencia.py
+# Costo de resolver un reintento con Idempotency-Key (idempotencia.py) según
+# cuántas claves tenga la tabla: desde la LRU del worker y desde la base
+# (lectura por clave primaria). También mide el barrido de las vencidas.
+#
+# Uso:
+#   python bench_idempotencia.py
+#   python bench_idempotencia.py --tamanos 10000,100000,1000000,5000000
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+
+def medir(funcion, claves, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        clave = random.choice(claves)
+        inicio = time.perf_counter()
+        funcion(clave)
+        tiempos.append((time.perf_counter() - inicio) * 1e6)
+    return statistics.median(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de las claves de idempotencia.")
+    parser.add_argument('--tamanos', default='10000,100000,1000000')
+    parser.add_argument('--repeticiones', type=int, default=5000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.makedirs(os.path.join(tmp, 'database'))
+    os.environ['RENDER_DISK_PATH'] = tmp
+    try:
+        import db
+        import idempotencia
+        db.init_db()
+        conn = db.pool.acquire()
+        cuerpo = b'{"message": "Orden de pago creada exitosamente"}'
+        ahora = time.time()
+        total = 0
+        print(f"{'claves':>10}{'LRU µs':>9}{'base µs':>9}{'reserva nueva µs':>18}")
+        for tamano in (int(t) for t in args.tamanos.split(',')):
+            filas = ((f"1:create_orden:{i:012d}", 'h', 201, cuerpo, 'application/json', ahora, ahora + 3600)
+                     for i in range(total, tamano))
+            conn.executemany("INSERT INTO claves_idempotencia VALUES (?, ?, ?, ?, ?, ?, ?)", filas)
+            conn.commit()
+            total = tamano
+            claves = [f"1:create_orden:{random.randrange(tamano):012d}" for _ in range(1000)]
+
+            cache = idempotencia.CacheRespuestas(tamano=len(claves))
+            for clave in claves:
+                cache.poner(clave, ('h', 201, cuerpo, 'application/json', ahora + 3600))
+            us_lru = medir(lambda clave: cache.obtener(clave, time.time()), claves, args.repeticiones)
+            us_base = medir(lambda clave: idempotencia.reservar(conn, clave, 'h', time.time()), claves,
+                            args.repeticiones)
+            nuevas = iter(range(10 ** 12, 10 ** 13))
+            us_nueva = medir(lambda _: idempotencia.reservar(conn, f"2:create_orden:{next(nuevas)}", 'h', time.time()),
+                             claves, min(args.repeticiones, 2000))
+            print(f"{tamano:>10}{us_lru:>9.1f}{us_base:>9.1f}{us_nueva:>18.1f}")
+
+        conn.execute("UPDATE claves_idempotencia SET expira = 0")
+        conn.commit()
+        inicio = time.perf_counter()
+        borradas = idempotencia.barrer(conn)
+        print(f"Barrido: {borradas} claves vencidas en {time.perf_counter() - inicio:.2f} s")
+        conn.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
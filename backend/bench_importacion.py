@@ -0,0 +1,64 @@
+# backend/bench_importacion.py
+# Compara crear órdenes una por una (POST /api/ordenes) contra la
+# importación masiva (POST /api/ordenes/importar), usando el cliente de
+# pruebas de Flask sobre una base temporal.
+#
+# Uso:
+#   python bench_importacion.py --ordenes 5000
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+
+def _orden(i):
+    return {"id_coordinador": 1, "monto": 100 + i, "id_moneda": 1, "id_tipo_pago": 1,
+            "fecha_factura": "2026-01-31", "fecha_vencimiento": "2026-02-28",
+            "acreedor": f"Proveedor {i}", "documento_compensacion": f"FAC-{i:06d}"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de creación individual vs importación masiva.")
+    parser.add_argument('--ordenes', type=int, default=5000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['RENDER_DISK_PATH'] = tmp
+    os.environ.setdefault('JWT_SECRETO', 'benchmark-solo-para-pruebas-locales-0000')
+    try:
+        import app as aplicacion
+        aplicacion.init_db()
+        cliente = aplicacion.app.test_client()
+        cliente.post('/api/auth/register', json={"nombre": "Bench", "apellido": "Coordinador",
+                                                 "email": "bench@pagos.test", "password": "x", "id_rol": 2})
+        ordenes = [_orden(i) for i in range(args.ordenes)]
+
+        inicio = time.perf_counter()
+        for orden in ordenes:
+            cliente.post('/api/ordenes', json=orden)
+        individual = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        r = cliente.post('/api/ordenes/importar', json=ordenes)
+        masivo_json = time.perf_counter() - inicio
+        assert r.get_json()["insertadas"] == args.ordenes
+
+        cuerpo = "\n".join(json.dumps(o) for o in ordenes)
+        inicio = time.perf_counter()
+        r = cliente.post('/api/ordenes/importar', data=cuerpo, content_type='application/x-ndjson')
+        masivo_ndjson = time.perf_counter() - inicio
+        assert r.get_json()["insertadas"] == args.ordenes
+
+        print(f"{'camino':<28}{'segundos':>10}{'órdenes/s':>12}")
+        for nombre, segundos in (("POST /api/ordenes (1 a 1)", individual),
+                                 ("importar (arreglo JSON)", masivo_json),
+                                 ("importar (NDJSON)", masivo_ndjson)):
+            print(f"{nombre:<28}{segundos:>10.2f}{args.ordenes / segundos:>12.0f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
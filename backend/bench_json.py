@@ -0,0 +1,99 @@
+# backend/bench_json.py
+# Compara el armado de respuestas JSON de las listas:
+#   - anterior: sqlite3.Row -> dict(row) -> jsonify (claves ordenadas)
+#   - tuplas + biblioteca estándar (respuestas.py sin orjson)
+#   - tuplas + orjson (si está instalado)
+#   - tuplas + proyección de 3 columnas (?campos=)
+# sobre la consulta del historial, y luego el endpoint completo con el
+# cliente de pruebas de Flask.
+#
+# Uso:
+#   python bench_json.py --ordenes 50000 --filas 20000
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+CONSULTA = """
+    SELECT o.*, m.codigo_moneda, u.nombre as coordinador_nombre, u.apellido as coordinador_apellido
+    FROM ordenes_pago o
+    JOIN monedas m ON o.id_moneda = m.id_moneda
+    JOIN usuarios u ON o.id_coordinador = u.id_usuario
+    ORDER BY o.id_orden DESC LIMIT ?
+"""
+
+
+def mejor_de(funcion, repeticiones):
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de serialización JSON de las listas.")
+    parser.add_argument('--ordenes', type=int, default=50000)
+    parser.add_argument('--filas', type=int, default=20000, help="Filas por respuesta")
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['RENDER_DISK_PATH'] = tmp
+    os.environ.setdefault('JWT_SECRETO', 'benchmark-solo-para-pruebas-locales-0000')
+    os.environ.setdefault('TIPOS_CAMBIO_INTERVALO', '0')
+    try:
+        import datos_sinteticos
+        import db
+        os.makedirs(os.path.dirname(db.DATABASE_PATH))
+        datos_sinteticos.generar(db.DATABASE_PATH, 200, args.ordenes)
+
+        import app as aplicacion
+        import respuestas
+        conn = sqlite3.connect(db.DATABASE_PATH)
+
+        def anterior():
+            conn.row_factory = sqlite3.Row
+            filas = conn.execute(CONSULTA, (args.filas,)).fetchall()
+            with aplicacion.app.app_context():
+                aplicacion.jsonify([dict(row) for row in filas]).get_data()
+
+        def tuplas(campos=None, usar_orjson=False):
+            def correr():
+                respuestas.USAR_ORJSON = usar_orjson
+                conn.row_factory = None
+                cursor = conn.execute(CONSULTA, (args.filas,))
+                proyeccion = respuestas.Proyeccion(cursor, campos)
+                respuestas.dumps(proyeccion.filas(cursor.fetchall()))
+            return correr
+
+        casos = [("Row -> dict -> jsonify", anterior), ("tuplas + json", tuplas())]
+        if respuestas.orjson is not None:
+            casos.append(("tuplas + orjson", tuplas(usar_orjson=True)))
+        casos.append(("tuplas + json, 3 campos", tuplas(['id_orden', 'monto', 'estado'])))
+
+        print(f"{args.filas} filas del historial (mejor de {args.repeticiones})")
+        print(f"{'camino':<28}{'ms':>10}{'filas/s':>12}")
+        for nombre, funcion in casos:
+            ms = mejor_de(funcion, args.repeticiones)
+            print(f"{nombre:<28}{ms:>10.1f}{args.filas / ms * 1000:>12.0f}")
+        conn.close()
+
+        respuestas.USAR_ORJSON = respuestas.orjson is not None
+        cliente = aplicacion.app.test_client()
+        print(f"\nGET /api/ordenes/historial?limite=1000 (JSON con "
+              f"{'orjson' if respuestas.USAR_ORJSON else 'la biblioteca estándar'})")
+        for nombre, url in (("todas las columnas", '/api/ordenes/historial?limite=1000'),
+                            ("campos=id_orden,monto,estado",
+                             '/api/ordenes/historial?limite=1000&campos=id_orden,monto,estado')):
+            ms = mejor_de(lambda: cliente.get(url).get_data(), args.repeticiones)
+            print(f"{nombre:<32}{ms:>8.1f} ms")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
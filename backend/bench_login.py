@@ -0,0 +1,87 @@
+# backend/bench_login.py
+# Prueba de carga de una "ráfaga de inicios de sesión": varios hilos hacen
+# login sin parar mientras otros consultan catálogos y el resumen. Mide la
+# latencia p50/p99 de cada grupo y el throughput total, para comparar bcrypt
+# en el hilo del request contra el pool de procesos.
+#
+# Uso:
+#   BCRYPT_PROCESOS=0 python bench_login.py     (bcrypt en el hilo del request)
+#   python bench_login.py                       (pool de procesos)
+#   python bench_login.py --rounds 10 --segundos 20 --hilos-login 16
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from bench_api import percentil
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de inicios de sesión.")
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--hilos-login', type=int, default=8)
+    parser.add_argument('--hilos-lectura', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=None, help="Costo bcrypt (BCRYPT_ROUNDS)")
+    args = parser.parse_args()
+    if args.rounds:
+        os.environ['BCRYPT_ROUNDS'] = str(args.rounds)
+
+    tmp = tempfile.mkdtemp()
+    os.environ['RENDER_DISK_PATH'] = tmp
+    os.environ.setdefault('JWT_SECRETO', 'benchmark-solo-para-pruebas-locales-0000')
+    try:
+        import app as aplicacion
+        import contrasenas
+        aplicacion.init_db()
+        contrasenas.hasher.calentar()
+        cliente = aplicacion.app.test_client()
+        for i in range(args.hilos_login):
+            cliente.post('/api/auth/register', json={"nombre": "Carga", "apellido": str(i), "email": f"carga{i}@pagos.test",
+                                                     "password": "clave123", "id_rol": 1})
+
+        latencias = {"login": [], "lectura": []}
+        errores = {"login": 0, "lectura": 0}
+        fin = time.perf_counter() + args.segundos
+        lock = threading.Lock()
+
+        def trabajador(grupo, i):
+            c = aplicacion.app.test_client()
+            urls = ['/api/catalogos/monedas', '/api/catalogos/tipos_pago', '/api/reportes/summary']
+            n = 0
+            while time.perf_counter() < fin:
+                inicio = time.perf_counter()
+                if grupo == "login":
+                    r = c.post('/api/auth/login', json={"email": f"carga{i}@pagos.test", "password": "clave123"})
+                else:
+                    r = c.get(urls[n % len(urls)])
+                    n += 1
+                duracion = (time.perf_counter() - inicio) * 1000
+                with lock:
+                    latencias[grupo].append(duracion)
+                    if r.status_code >= 400:
+                        errores[grupo] += 1
+
+        hilos = [threading.Thread(target=trabajador, args=("login", i)) for i in range(args.hilos_login)]
+        hilos += [threading.Thread(target=trabajador, args=("lectura", i)) for i in range(args.hilos_lectura)]
+        inicio = time.perf_counter()
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        total = time.perf_counter() - inicio
+
+        modo = "en el hilo" if contrasenas.PROCESOS <= 0 else f"pool de {contrasenas.PROCESOS} procesos"
+        print(f"bcrypt {modo}, costo {contrasenas.ROUNDS}, {args.segundos:.0f} s")
+        print(f"{'grupo':<10}{'requests':>10}{'req/s':>9}{'p50 ms':>10}{'p99 ms':>10}{'errores':>9}")
+        for grupo, valores in latencias.items():
+            print(f"{grupo:<10}{len(valores):>10}{len(valores) / total:>9.1f}{percentil(valores, 50):>10.1f}"
+                  f"{percentil(valores, 99):>10.1f}{errores[grupo]:>9}")
+        print(f"throughput total: {sum(len(v) for v in latencias.values()) / total:.1f} req/s")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
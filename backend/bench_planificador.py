@@ -0,0 +1,104 @@
+# backend/bench_planificador.py
+# Compara las consultas de la cola de pagos en memoria (planificador.py) con
+# las mismas consultas en SQL sobre el índice parcial de órdenes 'Enviada':
+# "las próximas N a pagar" y "las que vencen en X días". También mide cuánto
+# cuesta aplicar los eventos de un lote de órdenes que entran a la cola.
+#
+# Uso:
+#   python bench_planificador.py --ordenes 500000
+#   python bench_planificador.py --base /tmp/pagos_grande.db
+import argparse
+import datetime
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+SIGUIENTES_SQL = """
+    SELECT id_orden FROM ordenes_pago WHERE estado = 'Enviada'
+    ORDER BY urgente DESC, fecha_vencimiento ASC LIMIT ?
+"""
+POR_VENCER_SQL = """
+    SELECT id_orden FROM ordenes_pago WHERE estado = 'Enviada' AND fecha_vencimiento <= ?
+    ORDER BY fecha_vencimiento LIMIT ?
+"""
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1e6)
+    return statistics.median(tiempos), resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la cola de pagos en memoria contra SQL.")
+    parser.add_argument('--ordenes', type=int, default=300000)
+    parser.add_argument('--base', help="Base ya generada (se copia; no se modifica)")
+    parser.add_argument('--repeticiones', type=int, default=200)
+    parser.add_argument('--lote', type=int, default=1000, help="Órdenes enviadas para medir la actualización")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.makedirs(os.path.join(tmp, 'database'))
+    os.environ['RENDER_DISK_PATH'] = tmp
+    ruta = os.path.join(tmp, 'database', 'pagos.db')
+    try:
+        if args.base:
+            shutil.copy(args.base, ruta)
+        else:
+            import datos_sinteticos
+            print(f"Generando {args.ordenes} órdenes...")
+            datos_sinteticos.generar(ruta, ordenes=args.ordenes)
+        import db
+        import planificador
+        db.init_db()
+        cola = planificador.Planificador(verificar_cada=0)
+
+        inicio = time.perf_counter()
+        cola.sincronizar()
+        print(f"Carga inicial: {len(cola._vigentes)} órdenes en cola, {(time.perf_counter() - inicio) * 1000:.1f} ms")
+
+        conn = db.pool.acquire()
+        hoy = datetime.date.today()
+        print(f"{'consulta':<26}{'filas':>7}{'SQL µs':>10}{'heap µs':>10}  iguales")
+        for n in (10, 100, 1000):
+            us_sql, filas_sql = medir(lambda: conn.execute(SIGUIENTES_SQL, (n,)).fetchall(), args.repeticiones)
+            us_heap, filas_heap = medir(lambda: cola.siguientes(n), args.repeticiones)
+            # A igual prioridad el orden entre órdenes puede diferir: se comparan conjuntos sin el último grupo
+            iguales = [f[0] for f in filas_sql][:n // 2] == [f[0] for f in filas_heap][:n // 2]
+            print(f"{'siguientes ' + str(n):<26}{len(filas_heap):>7}{us_sql:>10.0f}{us_heap:>10.0f}  {'sí' if iguales else 'NO'}")
+        minimo = conn.execute("SELECT MIN(fecha_vencimiento) FROM ordenes_pago WHERE estado = 'Enviada'").fetchone()[0]
+        base = datetime.date.fromisoformat(minimo[:10])
+        for dias in (7, 30, 90):
+            limite = (base + datetime.timedelta(days=dias)).isoformat()
+            us_sql, filas_sql = medir(lambda: conn.execute(POR_VENCER_SQL, (limite, planificador.MAXIMO)).fetchall(),
+                                      args.repeticiones)
+            us_heap, filas_heap = medir(lambda: cola.por_vencer((base - hoy).days + dias, hoy), args.repeticiones)
+            iguales = len(filas_sql) == len(filas_heap)
+            print(f"{'por vencer ' + str(dias) + ' días':<26}{len(filas_heap):>7}{us_sql:>10.0f}{us_heap:>10.0f}"
+                  f"  {'sí' if iguales else 'NO'}")
+
+        # Actualización incremental: se envían órdenes creadas y se aplican sus eventos
+        ids = [f[0] for f in conn.execute("SELECT id_orden FROM ordenes_pago WHERE estado = 'Creada' LIMIT ?",
+                                          (args.lote,))]
+        conn.executemany("UPDATE ordenes_pago SET estado = 'Enviada' WHERE id_orden = ?", [(i,) for i in ids])
+        conn.commit()
+        inicio = time.perf_counter()
+        cola.sincronizar()
+        ms = (time.perf_counter() - inicio) * 1000
+        print(f"Eventos de {len(ids)} órdenes enviadas aplicados en {ms:.1f} ms ({ms * 1000 / max(len(ids), 1):.1f} µs c/u)")
+        inicio = time.perf_counter()
+        diferencias = cola.verificar()
+        print(f"Verificación contra la base: {diferencias} diferencias, {(time.perf_counter() - inicio) * 1000:.1f} ms")
+        conn.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
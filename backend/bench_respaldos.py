@@ -0,0 +1,158 @@
+# backend/bench_respaldos.py
+# Cuánto tarda un respaldo en caliente (respaldos.py) y cuánto afecta a los
+# requests mientras corre: hilos que leen y escriben órdenes miden su
+# latencia sin respaldo, durante una captura base y durante una incremental.
+# También mide el tamaño del incremental según cuántas órdenes cambiaron y
+# el tiempo de restaurar la cadena.
+#
+# Uso:
+#   python bench_respaldos.py --ordenes 300000
+#   python bench_respaldos.py --base /tmp/pagos_grande.db --pausa-ms 0
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+
+class Carga:
+    """Hilos que leen una orden por id y actualizan otra, midiendo cada operación."""
+
+    def __init__(self, ruta, maximo_id, hilos=2):
+        self.ruta = ruta
+        self.maximo_id = maximo_id
+        self.hilos = hilos
+        self._parar = threading.Event()
+        self.lecturas = []
+        self.escrituras = []
+
+    def _ciclo(self):
+        conn = sqlite3.connect(self.ruta, timeout=30)
+        conn.execute("PRAGMA busy_timeout = 30000")
+        lecturas, escrituras = [], []
+        while not self._parar.is_set():
+            id_orden = random.randint(1, self.maximo_id)
+            inicio = time.perf_counter()
+            conn.execute("SELECT * FROM ordenes_pago WHERE id_orden = ?", (id_orden,)).fetchone()
+            lecturas.append((time.perf_counter() - inicio) * 1000)
+            inicio = time.perf_counter()
+            conn.execute("UPDATE ordenes_pago SET monto = monto + 1 WHERE id_orden = ?", (id_orden,))
+            conn.commit()
+            escrituras.append((time.perf_counter() - inicio) * 1000)
+            time.sleep(0.002)
+        conn.close()
+        self.lecturas.extend(lecturas)
+        self.escrituras.extend(escrituras)
+
+    def medir(self, funcion=None, segundos=2.0):
+        """Corre la carga mientras se ejecuta `funcion` (o `segundos` si no hay)."""
+        self._parar.clear()
+        self.lecturas, self.escrituras = [], []
+        hilos = [threading.Thread(target=self._ciclo) for _ in range(self.hilos)]
+        for hilo in hilos:
+            hilo.start()
+        inicio = time.perf_counter()
+        resultado = funcion() if funcion else time.sleep(segundos)
+        duracion = time.perf_counter() - inicio
+        self._parar.set()
+        for hilo in hilos:
+            hilo.join()
+        return resultado, duracion
+
+
+def percentiles(tiempos):
+    if not tiempos:
+        return "sin datos"
+    tiempos = sorted(tiempos)
+    p99 = tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.99))]
+    return f"p50 {statistics.median(tiempos):6.2f} ms  p99 {p99:6.2f} ms  máx {tiempos[-1]:7.2f} ms"
+
+
+def informar(nombre, carga, duracion):
+    print(f"{nombre} ({duracion:.2f} s, {len(carga.escrituras) / duracion:.0f} escrituras/s)")
+    print(f"  lecturas:   {percentiles(carga.lecturas)}")
+    print(f"  escrituras: {percentiles(carga.escrituras)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de los respaldos en caliente.")
+    parser.add_argument('--ordenes', type=int, default=200000)
+    parser.add_argument('--base', help="Base ya generada (se copia; no se modifica)")
+    parser.add_argument('--hilos', type=int, default=2)
+    parser.add_argument('--paginas', type=int, help="Páginas por paso (RESPALDOS_PAGINAS)")
+    parser.add_argument('--pausa-ms', type=float, help="Pausa entre pasos (RESPALDOS_PAUSA_MS)")
+    parser.add_argument('--cambios', default='100,1000,10000', help="Órdenes modificadas antes de cada incremental")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.makedirs(os.path.join(tmp, 'database'))
+    os.environ['RENDER_DISK_PATH'] = tmp
+    if args.paginas:
+        os.environ['RESPALDOS_PAGINAS'] = str(args.paginas)
+    if args.pausa_ms is not None:
+        os.environ['RESPALDOS_PAUSA_MS'] = str(args.pausa_ms)
+    ruta = os.path.join(tmp, 'database', 'pagos.db')
+    try:
+        if args.base:
+            shutil.copy(args.base, ruta)
+        else:
+            import datos_sinteticos
+            print(f"Generando {args.ordenes} órdenes...")
+            datos_sinteticos.generar(ruta, ordenes=args.ordenes)
+        import db
+        import respaldos
+        db.init_db()
+        conn = sqlite3.connect(ruta)
+        maximo_id = conn.execute("SELECT MAX(id_orden) FROM ordenes_pago").fetchone()[0]
+        megas = os.path.getsize(ruta) / 1e6
+        print(f"Base de {megas:.1f} MB; {respaldos.PAGINAS_POR_PASO} páginas por paso, "
+              f"pausa {respaldos.PAUSA * 1000:.0f} ms\n")
+
+        carga = Carga(ruta, maximo_id, args.hilos)
+        _, duracion = carga.medir()
+        informar("Sin respaldo", carga, duracion)
+
+        entrada, duracion = carga.medir(lambda: respaldos.crear(completo=True))
+        informar("Durante la captura base", carga, duracion)
+        print(f"  copia {entrada['segundos_copia']:.2f} s ({megas / entrada['segundos_copia']:.0f} MB/s, "
+              f"{entrada['pasos']} pasos); con verificación {entrada['segundos']:.2f} s")
+
+        entrada, duracion = carga.medir(respaldos.crear)
+        informar("Durante una captura incremental", carga, duracion)
+        print(f"  {entrada['paginas_guardadas']} de {entrada['paginas']} páginas, "
+              f"{entrada['bytes'] / 1e6:.2f} MB\n")
+
+        # Lo que la carga escribió durante la última captura queda para la
+        # siguiente; se toma una aparte para que no se sume a la tabla
+        respaldos.crear()
+        print(f"{'órdenes cambiadas':>18}{'páginas':>10}{'MB':>9}{'segundos':>10}")
+        for cambios in (int(c) for c in args.cambios.split(',')):
+            ids = random.sample(range(1, maximo_id + 1), min(cambios, maximo_id))
+            conn.executemany("UPDATE ordenes_pago SET monto = monto + 1 WHERE id_orden = ?", [(i,) for i in ids])
+            conn.commit()
+            entrada = respaldos.crear()
+            print(f"{cambios:>18}{entrada['paginas_guardadas']:>10}{entrada['bytes'] / 1e6:>9.2f}"
+                  f"{entrada['segundos']:>10.2f}")
+        esperado = conn.execute("SELECT COUNT(*), SUM(monto) FROM ordenes_pago").fetchone()
+        conn.close()
+
+        destino = os.path.join(tmp, 'restaurada.db')
+        inicio = time.perf_counter()
+        restaurada, _ = respaldos.restaurar(destino=destino)
+        segundos = time.perf_counter() - inicio
+        conn = sqlite3.connect(destino)
+        obtenido = conn.execute("SELECT COUNT(*), SUM(monto) FROM ordenes_pago").fetchone()
+        conn.close()
+        print(f"\nRestauración de la captura {restaurada['numero']} (base y "
+              f"{len(respaldos.elegir(numero=restaurada['numero'])) - 1} incrementales) en {segundos:.2f} s; "
+              f"{'coincide' if obtenido == esperado else 'NO coincide'} con la base")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
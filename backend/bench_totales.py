@@ -0,0 +1,85 @@
+# backend/bench_totales.py
+# Compara el reporte de totales por moneda (totales.py) procesado fila por
+# fila en Python contra el procesamiento por columnas con NumPy, sobre una
+# base sintética, y verifica que los dos den los mismos totales.
+#
+# Uso:
+#   python bench_totales.py --ordenes 1000000
+#   python bench_totales.py --base /tmp/pagos_grande.db   (reutiliza una base)
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import datos_sinteticos
+import totales
+from db import aplicar_migraciones
+
+CASOS = [
+    # (nombre, parámetros)
+    ('estado', {'agrupar': 'estado'}),
+    ('coordinador', {'agrupar': 'coordinador', 'moneda': 'EUR'}),
+    ('exposicion', {'agrupar': 'coordinador,vencimiento', 'estado': 'Creada,Enviada', 'al': '2024-06-30'}),
+    ('acreedor', {'agrupar': 'acreedor,moneda'}),
+    ('todo', {'agrupar': 'coordinador,tipo_pago,acreedor,estado,moneda,vencimiento', 'al': '2024-06-30'}),
+]
+
+
+def medir(conn, parametros, vectorizado, repeticiones):
+    tiempos = []
+    reporte = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        reporte = totales.calcular(conn, parametros, vectorizado=vectorizado)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos), reporte
+
+
+def iguales(a, b):
+    def por_clave(reporte):
+        return {tuple((k, v) for k, v in grupo.items() if k not in totales.IMPORTES): grupo
+                for grupo in reporte['grupos']}
+    grupos_a, grupos_b = por_clave(a), por_clave(b)
+    if grupos_a.keys() != grupos_b.keys():
+        return False
+    return all(abs(grupos_a[k][campo] - grupos_b[k][campo]) <= 0.01 * max(1, abs(grupos_a[k][campo]) * 1e-9)
+               for k in grupos_a for campo in totales.IMPORTES)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del reporte de totales: filas vs columnas.")
+    parser.add_argument('--ordenes', type=int, default=1000000)
+    parser.add_argument('--base', help="Base ya generada (se le aplican las migraciones)")
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args()
+    if not totales.USAR_NUMPY:
+        raise SystemExit("Este benchmark necesita NumPy (pip install numpy)")
+
+    tmp = None
+    ruta = args.base
+    if not ruta:
+        tmp = tempfile.mkdtemp()
+        ruta = os.path.join(tmp, 'pagos.db')
+        print(f"Generando {args.ordenes} órdenes...")
+        datos_sinteticos.generar(ruta, usuarios=1000, ordenes=args.ordenes)
+    try:
+        conn = sqlite3.connect(ruta)
+        aplicar_migraciones(conn)
+        print(f"{'caso':<14}{'grupos':>9}{'filas ms':>11}{'NumPy ms':>11}{'x':>7}  iguales")
+        for nombre, valores in CASOS:
+            parametros = totales.Parametros(valores)
+            ms_filas, reporte_filas = medir(conn, parametros, False, args.repeticiones)
+            ms_numpy, reporte_numpy = medir(conn, parametros, True, args.repeticiones)
+            print(f"{nombre:<14}{len(reporte_numpy['grupos']):>9}{ms_filas:>11.1f}{ms_numpy:>11.1f}"
+                  f"{ms_filas / max(ms_numpy, 0.001):>7.2f}  {'sí' if iguales(reporte_filas, reporte_numpy) else 'NO'}")
+        conn.close()
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+# backend/busqueda.py
+# Búsqueda de órdenes sobre el índice FTS5 `ordenes_busqueda`
+# (acreedor, documento de compensación y nombre del coordinador).
+import re
+
+# Palabras de al menos un carácter alfanumérico; todo lo demás (comillas,
+# operadores de FTS5, signos) se descarta para no romper la sintaxis de MATCH.
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_query(termino):
+    """Convierte lo que escribe el usuario en una consulta MATCH de FTS5.
+
+    Cada palabra se busca como prefijo y todas deben aparecer:
+    'ferre nuñ' -> '"ferre"* "nuñ"*'. Devuelve None si no queda nada que buscar.
+    """
+    tokens = _TOKEN.findall(termino or '')
+    if not tokens:
+        return None
+    return ' '.join(f'"{t}"*' for t in tokens)
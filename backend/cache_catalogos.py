@@ -0,0 +1,80 @@
+# backend/cache_catalogos.py
+# Caché en memoria para los catálogos pequeños (monedas, tipos de pago,
+# tipos de devolución).
+#
+# Cada worker guarda la respuesta ya serializada junto con la versión del
+# catálogo. Los triggers de la migración 4 suben la versión en
+# catalogos_version con cada INSERT/UPDATE/DELETE, así que basta una lectura
+# por clave primaria para saber si la copia local sigue vigente, aunque el
+# cambio lo haya hecho otro worker.
+import datetime
+import threading
+
+from flask import Response, current_app, request
+
+
+class CatalogCache:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entradas = {}
+        self.hits = {}
+        self.misses = {}
+
+    def obtener(self, conn, catalogo, consulta):
+        """Devuelve (cuerpo_json, version, actualizado) del catálogo."""
+        fila = conn.execute(
+            "SELECT version, actualizado FROM catalogos_version WHERE catalogo = ?", (catalogo,)
+        ).fetchone()
+        version, actualizado = (fila['version'], fila['actualizado']) if fila else (0, None)
+
+        with self._lock:
+            entrada = self._entradas.get(catalogo)
+            if entrada is not None and entrada[1] == version:
+                self.hits[catalogo] = self.hits.get(catalogo, 0) + 1
+                return entrada
+            self.misses[catalogo] = self.misses.get(catalogo, 0) + 1
+
+        filas = [dict(row) for row in conn.execute(consulta).fetchall()]
+        # Mismo cuerpo que generaría jsonify()
+        entrada = (current_app.json.response(filas).get_data(), version, actualizado)
+        with self._lock:
+            self._entradas[catalogo] = entrada
+        return entrada
+
+    def invalidar(self, catalogo=None):
+        """Descarta la copia local (todas si no se indica catálogo)."""
+        with self._lock:
+            if catalogo is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(catalogo, None)
+
+    def stats(self):
+        with self._lock:
+            catalogos = set(self.hits) | set(self.misses)
+            return {
+                catalogo: {
+                    "hits": self.hits.get(catalogo, 0),
+                    "misses": self.misses.get(catalogo, 0),
+                    "version": self._entradas[catalogo][1] if catalogo in self._entradas else None,
+                }
+                for catalogo in sorted(catalogos)
+            }
+
+
+def respuesta_condicional(catalogo, entrada):
+    """Respuesta JSON con ETag y Last-Modified; 304 si el cliente ya la tiene."""
+    cuerpo, version, actualizado = entrada
+    response = Response(cuerpo, mimetype='application/json')
+    response.set_etag(f"{catalogo}-{version}")
+    if actualizado:
+        response.last_modified = datetime.datetime.strptime(actualizado, '%Y-%m-%d %H:%M:%S').replace(
+            tzinfo=datetime.timezone.utc)
+    # Los catálogos pueden cambiar en cualquier momento: el navegador debe
+    # revalidar siempre, pero con un 304 no vuelve a descargar el cuerpo.
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+cache = CatalogCache()
@@ -0,0 +1,159 @@
+# backend/contrasenas.py
+# Hash y verificación de contraseñas con bcrypt fuera del hilo del request.
+#
+# bcrypt es caro a propósito (~250 ms con costo 12). Las operaciones se
+# envían a un pool de procesos acotado para que una ráfaga de inicios de
+# sesión use todos los núcleos sin acaparar los hilos que atienden el resto
+# de la API. Si hay demasiadas operaciones en espera se rechaza la nueva con
+# PoolSaturado en lugar de acumular una cola sin límite.
+#
+# Variables de entorno:
+#   BCRYPT_ROUNDS           costo para hashes nuevos (por defecto 12)
+#   BCRYPT_PROCESOS         tamaño del pool de cada proceso; 0 = calcular en
+#                           el mismo hilo
+#   BCRYPT_MAX_PENDIENTES   operaciones en vuelo antes de rechazar
+#
+# Cada worker de Gunicorn (o de Uvicorn) tiene su propio pool. Por defecto
+# se reparten los núcleos entre WEB_CONCURRENCY workers (núcleos / workers,
+# al menos 1 proceso por worker); sin WEB_CONCURRENCY (flask run, un solo
+# proceso) se usan todos los núcleos menos uno. Un BCRYPT_PROCESOS explícito
+# vale para cada worker: el total es BCRYPT_PROCESOS x WEB_CONCURRENCY.
+#
+# Este módulo no importa Flask ni la base: los procesos del pool lo cargan.
+import asyncio
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+
+def _procesos_por_defecto():
+    nucleos = os.cpu_count() or 2
+    workers = int(os.environ.get('WEB_CONCURRENCY', '0') or 0)
+    if workers > 0:
+        return max(1, nucleos // workers)
+    return max(1, nucleos - 1)
+
+
+ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+PROCESOS = int(os.environ.get('BCRYPT_PROCESOS', str(_procesos_por_defecto())))
+MAX_PENDIENTES = int(os.environ.get('BCRYPT_MAX_PENDIENTES', str(PROCESOS * 8 or 1)))
+ESPERA_MAXIMA = 5  # segundos esperando lugar en la cola
+
+
+class PoolSaturado(Exception):
+    pass
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+
+def _verificar(password, password_hash):
+    return bcrypt.checkpw(password, password_hash)
+
+
+def costo_del_hash(password_hash):
+    """Costo con el que se generó un hash bcrypt ($2b$12$... -> 12)."""
+    if isinstance(password_hash, str):
+        password_hash = password_hash.encode('utf-8')
+    try:
+        return int(password_hash.split(b'$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def necesita_rehash(password_hash):
+    return costo_del_hash(password_hash) != ROUNDS
+
+
+_hash_ficticio = None
+_lock_ficticio = threading.Lock()
+
+
+def hash_ficticio():
+    """Hash al costo ROUNDS de una contraseña aleatoria que nadie conoce. El
+    login lo verifica cuando el correo no existe, así tarda lo mismo que con
+    un correo registrado y el tiempo de respuesta no revela cuáles existen."""
+    global _hash_ficticio
+    with _lock_ficticio:
+        if _hash_ficticio is None:
+            _hash_ficticio = _hash(secrets.token_bytes(32), ROUNDS)
+        return _hash_ficticio
+
+
+class HasherContrasenas:
+
+    def __init__(self, procesos=PROCESOS, max_pendientes=MAX_PENDIENTES):
+        self.procesos = procesos
+        self._cupos = threading.BoundedSemaphore(max_pendientes)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # 'spawn' evita heredar hilos y conexiones del worker de Gunicorn.
+                # Reimporta el script principal como '__mp_main__': app.py no
+                # inicializa la base con ese nombre
+                self._executor = ProcessPoolExecutor(max_workers=self.procesos,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+                self._pid = os.getpid()
+            return self._executor
+
+    def _ejecutar(self, funcion, *args):
+        if self.procesos <= 0:
+            return funcion(*args)
+        if not self._cupos.acquire(timeout=ESPERA_MAXIMA):
+            raise PoolSaturado("Demasiadas operaciones de contraseña en espera")
+        try:
+            return self._get_executor().submit(funcion, *args).result()
+        finally:
+            self._cupos.release()
+
+    async def _ejecutar_async(self, funcion, *args):
+        # Para el modo ASGI: se espera lugar en la cola y el resultado sin
+        # ocupar un hilo (el semáforo es de hilos, se reintenta sin bloquear).
+        if self.procesos <= 0:
+            return await asyncio.to_thread(funcion, *args)
+        limite = time.monotonic() + ESPERA_MAXIMA
+        while not self._cupos.acquire(blocking=False):
+            if time.monotonic() >= limite:
+                raise PoolSaturado("Demasiadas operaciones de contraseña en espera")
+            await asyncio.sleep(0.005)
+        try:
+            return await asyncio.wrap_future(self._get_executor().submit(funcion, *args))
+        finally:
+            self._cupos.release()
+
+    def hash(self, password, rounds=None):
+        return self._ejecutar(_hash, password.encode('utf-8'), rounds or ROUNDS)
+
+    def verificar(self, password, password_hash):
+        if isinstance(password_hash, str):
+            password_hash = password_hash.encode('utf-8')
+        return self._ejecutar(_verificar, password.encode('utf-8'), password_hash)
+
+    async def hash_async(self, password, rounds=None):
+        return await self._ejecutar_async(_hash, password.encode('utf-8'), rounds or ROUNDS)
+
+    async def verificar_async(self, password, password_hash):
+        if isinstance(password_hash, str):
+            password_hash = password_hash.encode('utf-8')
+        return await self._ejecutar_async(_verificar, password.encode('utf-8'), password_hash)
+
+    def calentar(self):
+        """Arranca los procesos del pool antes del primer inicio de sesión."""
+        hash_ficticio()
+        if self.procesos > 0:
+            executor = self._get_executor()
+            for futuro in [executor.submit(costo_del_hash, b'$2b$04$') for _ in range(self.procesos)]:
+                futuro.result()
+
+
+hasher = HasherContrasenas()
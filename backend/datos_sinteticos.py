@@ -0,0 +1,146 @@
+# backend/datos_sinteticos.py
+# Generador de datos de prueba con volumen de producción.
+# Crea (o completa) una base SQLite a partir de database/schema.sql.
+#
+# Uso:
+#   python datos_sinteticos.py /tmp/pagos_grande.db --ordenes 200000
+#   python datos_sinteticos.py /tmp/pagos_prod.db --usuarios 10000 --ordenes 2000000 --acciones-extra 4000000
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+
+import bcrypt
+
+from contrasenas import ROUNDS
+from db import SCHEMA_PATH, aplicar_migraciones
+
+NOMBRES = ["Ana", "Luis", "María", "José", "Sofía", "Andrés", "Lucía", "Carlos", "Valeria", "Diego",
+           "Camila", "Jorge", "Daniela", "Fernando", "Gabriela", "Ramón", "Natalia", "Tomás", "Isabel", "Óscar"]
+APELLIDOS = ["Pérez", "Mora", "Rodríguez", "Jiménez", "Vargas", "Núñez", "Solís", "Araya", "Chacón", "Quesada",
+             "Gómez", "Hernández", "Muñoz", "Castro", "Rojas", "Ureña", "Villalobos", "Zúñiga", "Álvarez", "Brenes"]
+EMPRESAS = ["Ferretería", "Distribuidora", "Servicios", "Comercial", "Inversiones", "Transportes",
+            "Constructora", "Importadora", "Consultores", "Suministros"]
+SUFIJOS = ["del Valle", "Central", "San José", "Pacífico", "Atlántico", "Montaña", "Norte", "Sur",
+           "Irazú", "Arenal", "Caribe", "Nacional"]
+ESTADOS = ["Creada", "Enviada", "Pagada", "Devuelta"]
+PESOS_ESTADO = [15, 20, 60, 5]
+ACCIONES = {"Creada": ["CREAR_ORDEN"], "Enviada": ["CREAR_ORDEN", "ENVIAR_ORDEN"],
+            "Pagada": ["CREAR_ORDEN", "ENVIAR_ORDEN", "PAGAR_ORDEN"],
+            "Devuelta": ["CREAR_ORDEN", "ENVIAR_ORDEN", "DEVOLVER_ORDEN"]}
+
+LOTE = 10000
+
+
+def _crear_esquema(conn):
+    existe = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'ordenes_pago'").fetchone()
+    if not existe:
+        with open(SCHEMA_PATH, 'r') as f:
+            conn.executescript(f.read())
+    aplicar_migraciones(conn)
+
+
+def _fecha(base, dias):
+    return (base + datetime.timedelta(days=dias)).isoformat()
+
+
+def generar(path, usuarios=200, ordenes=100000, acciones_extra=0, semilla=42, password='clave123'):
+    """Llena la base en `path` con usuarios, órdenes y su bitácora.
+
+    Cada orden genera las entradas de bitácora de su recorrido de estados;
+    `acciones_extra` agrega entradas adicionales (ediciones) para acercarse
+    al volumen real de la bitácora. Devuelve un resumen con los conteos.
+    """
+    rnd = random.Random(semilla)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    _crear_esquema(conn)
+
+    # Un solo hash para todos, con el costo real para que el login se mida igual que en producción
+    password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=ROUNDS))
+    id_inicial = conn.execute("SELECT COALESCE(MAX(id_usuario), 0) FROM usuarios").fetchone()[0]
+    filas_usuarios = []
+    for i in range(usuarios):
+        # Un tercio analistas (rol 1), el resto coordinadores (rol 2)
+        id_rol = 1 if i % 3 == 0 else 2
+        filas_usuarios.append((rnd.choice(NOMBRES), rnd.choice(APELLIDOS),
+                               f"usuario{id_inicial + i + 1}@pagos.test", password_hash, id_rol))
+    conn.executemany("INSERT INTO usuarios (nombre, apellido, email, password_hash, id_rol) VALUES (?, ?, ?, ?, ?)",
+                     filas_usuarios)
+    conn.commit()
+
+    ids = [r[0] for r in conn.execute("SELECT id_usuario, id_rol FROM usuarios")]
+    roles = dict(conn.execute("SELECT id_usuario, id_rol FROM usuarios").fetchall())
+    coordinadores = [i for i in ids if roles[i] == 2] or ids
+    analistas = [i for i in ids if roles[i] == 1] or ids
+    monedas = [r[0] for r in conn.execute("SELECT id_moneda FROM monedas")]
+    tipos_pago = [r[0] for r in conn.execute("SELECT id_tipo_pago FROM tipos_pago")]
+    acreedores = [f"{e} {a} {s}" for e in EMPRESAS for a in APELLIDOS for s in SUFIJOS]
+
+    base = datetime.datetime(2022, 1, 1)
+    siguiente_orden = conn.execute("SELECT COALESCE(MAX(id_orden), 0) FROM ordenes_pago").fetchone()[0] + 1
+    total_bitacora = 0
+    restantes = ordenes
+    while restantes > 0:
+        n = min(LOTE, restantes)
+        filas_ordenes, filas_bitacora, filas_devoluciones = [], [], []
+        for _ in range(n):
+            id_orden = siguiente_orden
+            siguiente_orden += 1
+            estado = rnd.choices(ESTADOS, PESOS_ESTADO)[0]
+            dias = rnd.randint(0, 1500)
+            creada = base + datetime.timedelta(days=dias, seconds=rnd.randint(0, 86399))
+            fecha_factura = _fecha(base.date(), dias - rnd.randint(0, 10))
+            fecha_vencimiento = _fecha(base.date(), dias + rnd.randint(5, 90))
+            fecha_pago = _fecha(base.date(), dias + rnd.randint(1, 60)) if estado == 'Pagada' else None
+            id_coordinador = rnd.choice(coordinadores)
+            filas_ordenes.append((
+                id_orden, round(rnd.uniform(10, 250000), 2), rnd.choice(monedas), rnd.choice(tipos_pago),
+                fecha_factura, fecha_vencimiento, fecha_pago, estado, id_coordinador,
+                creada.isoformat(sep=' '), 1 if rnd.random() < 0.15 else 0,
+                round(rnd.uniform(0, 1000), 2), round(rnd.uniform(0, 200), 2), rnd.choice(acreedores),
+                f"DC-{id_orden:08d}" if estado == 'Pagada' else None,
+            ))
+            momento = creada
+            for accion in ACCIONES[estado]:
+                usuario = id_coordinador if accion in ('CREAR_ORDEN', 'ENVIAR_ORDEN') else rnd.choice(analistas)
+                filas_bitacora.append((usuario, accion, None, id_orden, momento.isoformat(sep=' ')))
+                momento += datetime.timedelta(hours=rnd.randint(1, 72))
+            if estado == 'Devuelta':
+                filas_devoluciones.append((id_orden, 'Datos incompletos', rnd.choice(analistas)))
+        for _ in range(int(acciones_extra * n / ordenes)):
+            id_orden = rnd.randint(siguiente_orden - n, siguiente_orden - 1)
+            filas_bitacora.append((rnd.choice(coordinadores), 'EDITAR_ORDEN', 'El coordinador modificó la orden',
+                                   id_orden, (base + datetime.timedelta(days=rnd.randint(0, 1500))).isoformat(sep=' ')))
+
+        conn.executemany(
+            """INSERT INTO ordenes_pago (id_orden, monto, id_moneda, id_tipo_pago, fecha_factura, fecha_vencimiento,
+                   fecha_pago_real, estado, id_coordinador, fecha_creacion, urgente, impuesto, descuento, acreedor,
+                   documento_compensacion)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", filas_ordenes)
+        conn.executemany(
+            "INSERT INTO bitacora (id_usuario_accion, accion, detalles, id_orden_afectada, fecha_accion) VALUES (?, ?, ?, ?, ?)",
+            filas_bitacora)
+        conn.executemany("INSERT INTO devoluciones (id_orden, motivo, id_analista) VALUES (?, ?, ?)", filas_devoluciones)
+        conn.commit()
+        total_bitacora += len(filas_bitacora)
+        restantes -= n
+
+    conn.execute("ANALYZE")
+    conn.close()
+    return {"usuarios": usuarios, "ordenes": ordenes, "bitacora": total_bitacora}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Genera datos sintéticos para pruebas de carga.")
+    parser.add_argument('destino', help="Archivo SQLite a crear o completar")
+    parser.add_argument('--usuarios', type=int, default=200)
+    parser.add_argument('--ordenes', type=int, default=100000)
+    parser.add_argument('--acciones-extra', type=int, default=0)
+    parser.add_argument('--semilla', type=int, default=42)
+    args = parser.parse_args()
+    if os.path.dirname(args.destino):
+        os.makedirs(os.path.dirname(args.destino), exist_ok=True)
+    print(generar(args.destino, args.usuarios, args.ordenes, args.acciones_extra, args.semilla))
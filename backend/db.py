@@ -0,0 +1,407 @@
+# backend/db.py
+# Manejo de conexiones a SQLite: un pool de conexiones de larga duración por
+# proceso (cada worker de Gunicorn tiene el suyo), configuradas en modo WAL.
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from urllib.parse import quote
+
+from flask import g, has_app_context
+
+from migraciones import MIGRACIONES
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURACIÓN DE LA BASE DE DATOS PARA RENDER ---
+# Render nos da un disco persistente en /var/data
+# Usamos una variable de entorno para la ruta, con un valor local por defecto.
+DATABASE_PATH = os.path.join(os.environ.get('RENDER_DISK_PATH', '..'), 'database', 'pagos.db')
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), '..', 'database', 'schema.sql')
+
+# Parámetros del pool (se pueden ajustar con variables de entorno)
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+
+# PRAGMAs que se aplican a cada conexión nueva.
+# synchronous=NORMAL es seguro en modo WAL (solo se puede perder la última
+# transacción ante un corte de luz, nunca se corrompe la base).
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -20000",      # ~20 MB de caché de páginas
+    "PRAGMA mmap_size = 268435456",    # 256 MB de lectura por mmap
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",      # esperar hasta 5 s si otro proceso escribe
+)
+
+
+def init_db():
+    """Inicializa la base de datos si no existe."""
+    db_dir = os.path.dirname(DATABASE_PATH)
+    if not os.path.exists(db_dir):
+        os.makedirs(db_dir)
+
+    if not os.path.exists(DATABASE_PATH):
+        print("Creando la base de datos...")
+        conn = sqlite3.connect(DATABASE_PATH)
+        with open(SCHEMA_PATH, 'r') as f:
+            conn.executescript(f.read())
+        conn.commit()
+        conn.close()
+        print("Base de datos creada exitosamente.")
+
+    # El modo WAL queda guardado en el archivo, basta con activarlo una vez.
+    # Con WAL los lectores no se bloquean mientras alguien escribe.
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.execute("PRAGMA journal_mode = WAL")
+    aplicar_migraciones(conn)
+    conn.close()
+
+
+def aplicar_migraciones(conn):
+    """Aplica en orden las migraciones pendientes (ver migraciones.py).
+
+    Cada migración va en una transacción BEGIN IMMEDIATE, y user_version se
+    vuelve a leer ya con el lock de escritura tomado: si dos procesos
+    arrancan a la vez (Gunicorn sin preload_app, `flask run` y un worker),
+    el segundo espera al primero y saltea lo que este ya aplicó.
+    """
+    for version, descripcion, sql in MIGRACIONES:
+        if version <= conn.execute("PRAGMA user_version").fetchone()[0]:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= conn.execute("PRAGMA user_version").fetchone()[0]:
+                conn.rollback()
+                continue
+            print(f"Aplicando migración {version}: {descripcion}")
+            # Todo en la misma transacción: o se aplica completa o no se aplica
+            for sentencia in _sentencias(sql):
+                conn.execute(sentencia)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+def _sentencias(sql):
+    """Divide un script en sentencias (respetando los ; dentro de los triggers)."""
+    actual = ""
+    for linea in sql.splitlines(keepends=True):
+        actual += linea
+        if sqlite3.complete_statement(actual):
+            if actual.strip():
+                yield actual
+            actual = ""
+    if actual.strip() and not actual.strip().startswith('--'):
+        yield actual
+
+
+# Función opcional observador_sql(sql, segundos, filas) que recibe el tiempo
+# de cada sentencia y las filas leídas o modificadas. La registra metricas.py;
+# mientras sea None las conexiones no agregan ningún costo.
+observador_sql = None
+
+
+class CursorObservado:
+    """Cursor que informa a observador_sql el tiempo de execute y de fetch*."""
+
+    def __init__(self, cursor, sql=None):
+        self._cursor = cursor
+        self._sql = sql
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    @property
+    def row_factory(self):
+        return self._cursor.row_factory
+
+    @row_factory.setter
+    def row_factory(self, valor):
+        self._cursor.row_factory = valor
+
+    def _medir(self, funcion, *args):
+        inicio = time.perf_counter()
+        resultado = funcion(*args)
+        segundos = time.perf_counter() - inicio
+        return resultado, segundos
+
+    def execute(self, sql, params=()):
+        self._sql = sql
+        _, segundos = self._medir(self._cursor.execute, sql, params)
+        observador_sql(sql, segundos, max(self._cursor.rowcount, 0))
+        return self
+
+    def executemany(self, sql, seq_params):
+        self._sql = sql
+        _, segundos = self._medir(self._cursor.executemany, sql, seq_params)
+        observador_sql(sql, segundos, max(self._cursor.rowcount, 0))
+        return self
+
+    def fetchone(self):
+        fila, segundos = self._medir(self._cursor.fetchone)
+        observador_sql(self._sql, segundos, 1 if fila is not None else 0)
+        return fila
+
+    def fetchmany(self, size=None):
+        filas, segundos = self._medir(self._cursor.fetchmany, size or self._cursor.arraysize)
+        observador_sql(self._sql, segundos, len(filas))
+        return filas
+
+    def fetchall(self):
+        filas, segundos = self._medir(self._cursor.fetchall)
+        observador_sql(self._sql, segundos, len(filas))
+        return filas
+
+    def __iter__(self):
+        while True:
+            filas = self.fetchmany(500)
+            if not filas:
+                break
+            yield from filas
+
+
+class PooledConnection:
+    """Envuelve una conexión sqlite3 del pool.
+
+    Se usa igual que una conexión normal; close() la devuelve al pool en vez
+    de cerrarla de verdad.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._released = False
+        self._al_confirmar = []
+        self._al_descartar = []
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def execute(self, sql, params=()):
+        if observador_sql is None:
+            return self._conn.execute(sql, params)
+        return CursorObservado(self._conn.cursor()).execute(sql, params)
+
+    def executemany(self, sql, seq_params):
+        if observador_sql is None:
+            return self._conn.executemany(sql, seq_params)
+        return CursorObservado(self._conn.cursor()).executemany(sql, seq_params)
+
+    def cursor(self):
+        if observador_sql is None:
+            return self._conn.cursor()
+        return CursorObservado(self._conn.cursor())
+
+    def al_confirmar(self, funcion):
+        """Ejecuta `funcion` después del próximo commit; se descarta si hay rollback.
+
+        Un error en `funcion` se registra y no se propaga: el commit ya se
+        hizo, y si la ruta respondiera 500 el cliente reintentaría un cambio
+        que quedó guardado.
+        """
+        self._al_confirmar.append(funcion)
+
+    def al_descartar(self, funcion):
+        """Ejecuta `funcion` si la transacción en curso termina sin commit
+        (rollback, o close con la transacción abierta)."""
+        self._al_descartar.append(funcion)
+
+    def _ejecutar(self, funciones, mensaje):
+        for funcion in funciones:
+            try:
+                funcion()
+            except Exception:
+                logger.exception(mensaje)
+
+    def commit(self):
+        self._conn.commit()
+        pendientes, self._al_confirmar, self._al_descartar = self._al_confirmar, [], []
+        self._ejecutar(pendientes, "Falló una acción posterior al commit")
+
+    def rollback(self):
+        self._al_confirmar = []
+        try:
+            self._conn.rollback()
+        finally:
+            descartadas, self._al_descartar = self._al_descartar, []
+            self._ejecutar(descartadas, "Falló una acción posterior al rollback")
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._al_confirmar = []
+            try:
+                # release descarta la transacción que haya quedado abierta
+                self._pool.release(self._conn)
+            finally:
+                descartadas, self._al_descartar = self._al_descartar, []
+                self._ejecutar(descartadas, "Falló una acción posterior al rollback")
+
+
+class ConnectionPool:
+    """Pool de conexiones SQLite de larga duración para un proceso.
+
+    Con inmutable=True el archivo se abre en solo lectura y sin bloqueos
+    (immutable=1): solo sirve para archivos que nadie modifica mientras están
+    abiertos, como las copias de replicas.py.
+    """
+
+    def __init__(self, database_path, size=POOL_SIZE, timeout=POOL_TIMEOUT, pragmas=CONNECTION_PRAGMAS,
+                 inmutable=False):
+        self.database_path = database_path
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = pragmas
+        self.inmutable = inmutable
+        self.cerrado = False
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # Se llama también después de un fork: las conexiones no se comparten
+        # entre procesos, cada worker abre las suyas.
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._open = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+
+    def _connect(self):
+        if self.inmutable:
+            uri = f"file:{quote(os.path.abspath(self.database_path))}?mode=ro&immutable=1"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.database_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._open < self.size:
+                    self._open += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._open -= 1
+                    raise
+            else:
+                # El pool está lleno: esperamos a que alguien devuelva una conexión
+                start = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self.timeouts += 1
+                    raise sqlite3.OperationalError("No hay conexiones disponibles en el pool")
+                finally:
+                    with self._lock:
+                        self.waits += 1
+                        self.wait_time += time.perf_counter() - start
+
+        with self._lock:
+            self.checkouts += 1
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        if self._pid != os.getpid():
+            conn.close()
+            return
+        if self.cerrado:
+            conn.close()
+            with self._lock:
+                self._open -= 1
+            return
+        # Si quedó una transacción a medias (por un error), la descartamos
+        # para que el siguiente request reciba la conexión limpia.
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def cerrar_libres(self):
+        """Cierra las conexiones libres (p. ej. en el master de Gunicorn antes del fork)."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._open -= 1
+
+    def cerrar(self):
+        """Retira el pool: cierra las conexiones libres y las que se devuelvan después."""
+        self.cerrado = True
+        self.cerrar_libres()
+
+    def stats(self):
+        with self._lock:
+            idle = self._idle.qsize()
+            return {
+                "pid": self._pid,
+                "tamano_pool": self.size,
+                "conexiones_abiertas": self._open,
+                "conexiones_en_uso": self._open - idle,
+                "conexiones_libres": idle,
+                "checkouts": self.checkouts,
+                "esperas": self.waits,
+                "tiempo_espera_total_ms": round(self.wait_time * 1000, 3),
+                "timeouts": self.timeouts,
+            }
+
+
+pool = ConnectionPool(DATABASE_PATH)
+
+
+def get_db_connection():
+    """Obtiene una conexión del pool.
+
+    Dentro de un request la conexión se registra en `g` para que el hook de
+    teardown la devuelva aunque el handler no llame a close().
+    """
+    return registrar_en_request(pool.acquire())
+
+
+def registrar_en_request(conn):
+    """Anota la conexión en `g` para devolverla al pool al terminar el request."""
+    if has_app_context():
+        g.setdefault('_db_conexiones', []).append(conn)
+    return conn
+
+
+def release_request_connections(exception=None):
+    """Hook de teardown: devuelve al pool las conexiones del request."""
+    for conn in g.pop('_db_conexiones', []):
+        conn.close()
+
+
+def init_app(app):
+    app.teardown_appcontext(release_request_connections)
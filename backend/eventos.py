@@ -0,0 +1,316 @@
+# backend/eventos.py
+# Cambios de la cola de órdenes 'Enviada' para los analistas.
+#
+# En vez de volver a pedir /api/ordenes/enviadas cada tanto, el cliente abre
+# /api/ordenes/enviadas/eventos (Server-Sent Events): recibe la cola completa
+# una vez (evento 'snapshot') y después solo las órdenes que entran ('alta'),
+# salen ('baja') o cambian ('cambio'). Cada evento lleva su número de
+# secuencia como id; al reconectar, EventSource lo manda en Last-Event-ID y
+# la conexión sigue desde ahí sin volver a descargar la cola.
+#
+# Los triggers de la migración 7 anotan los cambios en eventos_enviadas en la
+# misma transacción que los produce, así que sirven para todos los workers y
+# para cualquier camino de escritura (rutas, transiciones en lote,
+# importación). Como SQLite tiene un solo escritor, el orden de seq es el
+# orden de los commits.
+#
+# En cada worker un único hilo (Difusor) lee los eventos nuevos cada
+# EVENTOS_INTERVALO_MS mientras haya suscriptores, arma cada delta una vez y
+# lo reparte a todas las conexiones abiertas: N analistas cuestan una
+# consulta chica por intervalo en lugar de N veces la cola completa.
+#
+#   EVENTOS_INTERVALO_MS       cada cuánto se buscan eventos nuevos (500)
+#   EVENTOS_RETENCION          eventos que se conservan para reanudar (50000)
+#   EVENTOS_PING_S             comentario keep-alive en la conexión SSE (15)
+#   EVENTOS_MAX_SUSCRIPTORES   conexiones SSE abiertas por worker (100); con
+#                              Gunicorn cada una ocupa un hilo del worker, y
+#                              gunicorn.conf.py lo baja a GUNICORN_HILOS - 1
+#                              para que siempre quede un hilo para la API
+import json
+import os
+import queue
+import threading
+import time
+
+import db
+from respuestas import Proyeccion, consultar, dumps
+
+INTERVALO = float(os.environ.get('EVENTOS_INTERVALO_MS', '500')) / 1000
+RETENCION = int(os.environ.get('EVENTOS_RETENCION', '50000'))
+PING = float(os.environ.get('EVENTOS_PING_S', '15'))
+MAX_SUSCRIPTORES = int(os.environ.get('EVENTOS_MAX_SUSCRIPTORES', '100'))
+TAMANO_LOTE = 500
+# Mensajes sin leer que se aceptan por conexión antes de cortarla; el cliente
+# reconecta con Last-Event-ID y se pone al día desde la tabla
+MAXIMO_PENDIENTES = 5000
+PURGA_CADA = 60
+
+ORDEN = """
+    SELECT o.*, m.codigo_moneda, u.nombre as coordinador_nombre, u.apellido as coordinador_apellido
+    FROM ordenes_pago o
+    JOIN monedas m ON o.id_moneda = m.id_moneda
+    JOIN usuarios u ON o.id_coordinador = u.id_usuario
+"""
+COLA = ORDEN + " WHERE o.estado = 'Enviada' ORDER BY o.urgente DESC, o.fecha_vencimiento ASC"
+
+
+class HistorialPerdido(Exception):
+    """Los eventos posteriores al seq pedido ya se purgaron: hace falta un snapshot."""
+
+
+class Saturado(Exception):
+    pass
+
+
+def ultimo_seq(conn):
+    # La purga siempre deja los últimos eventos, así que MAX(seq) es el último asignado
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM eventos_enviadas").fetchone()[0]
+
+
+def comprobar_seq(conn, seq):
+    """HistorialPerdido si ya no se puede reanudar desde `seq`."""
+    primero = conn.execute("SELECT MIN(seq) FROM eventos_enviadas").fetchone()[0]
+    ultimo = ultimo_seq(conn)
+    if seq > ultimo or seq < (primero - 1 if primero is not None else ultimo):
+        raise HistorialPerdido(f"No hay eventos desde {seq}")
+
+
+def snapshot(conn):
+    """(seq, órdenes de la cola) leídos en una misma transacción de lectura."""
+    conn.execute("BEGIN")
+    try:
+        seq = ultimo_seq(conn)
+        cursor = consultar(conn, COLA)
+        ordenes = Proyeccion(cursor).filas(cursor.fetchall())
+    finally:
+        conn.commit()
+    return seq, ordenes
+
+
+def eventos_desde(conn, seq, hasta=None, limite=TAMANO_LOTE):
+    """Eventos con seq mayor a `seq` (y hasta `hasta`), en orden.
+
+    Devuelve dicts {seq, tipo, id_orden[, orden]}: las altas y los cambios
+    llevan la orden como la devuelve /api/ordenes/enviadas. La orden se lee en
+    su estado actual; si ya salió de la cola, su 'baja' viene más adelante.
+    """
+    sql = "SELECT seq, tipo, id_orden FROM eventos_enviadas WHERE seq > ?"
+    params = [seq]
+    if hasta is not None:
+        sql += " AND seq <= ?"
+        params.append(hasta)
+    filas = conn.execute(sql + " ORDER BY seq LIMIT ?", (*params, limite)).fetchall()
+    ids = list({fila[2] for fila in filas if fila[1] != 'baja'})
+    actuales = {}
+    if ids:
+        cursor = consultar(conn, ORDEN + " WHERE o.id_orden IN (SELECT value FROM json_each(?))", (json.dumps(ids),))
+        for orden in Proyeccion(cursor).filas(cursor.fetchall()):
+            actuales[orden['id_orden']] = orden
+    eventos = []
+    for seq_evento, tipo, id_orden in filas:
+        evento = {"seq": seq_evento, "tipo": tipo, "id_orden": id_orden}
+        if tipo != 'baja':
+            if id_orden not in actuales:
+                # La orden se borró después del evento
+                evento["tipo"] = 'baja'
+            else:
+                evento["orden"] = actuales[id_orden]
+        eventos.append(evento)
+    return eventos
+
+
+def mensaje_sse(seq, evento, datos):
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (seq, evento.encode('ascii'), dumps(datos))
+
+
+def purgar(conn, retencion=RETENCION):
+    conn.execute("DELETE FROM eventos_enviadas WHERE seq <= ?", (ultimo_seq(conn) - retencion,))
+    conn.commit()
+
+
+class Suscripcion:
+    def __init__(self, inicio):
+        # Todo evento con seq mayor a `inicio` llega por la cola
+        self.inicio = inicio
+        self.ultimo = inicio
+        self.cola = queue.Queue(MAXIMO_PENDIENTES)
+        self.desbordada = False
+        # Se llama (desde el hilo del difusor) después de encolar mensajes;
+        # lo usa el modo ASGI para despertar a la corrutina que espera
+        self.al_recibir = None
+
+
+class Difusor:
+    """Hilo por worker que lee eventos nuevos y los reparte a las suscripciones."""
+
+    def __init__(self, intervalo=INTERVALO, max_suscriptores=MAX_SUSCRIPTORES):
+        self.intervalo = intervalo
+        self.max_suscriptores = max_suscriptores
+        self._lock = threading.Lock()
+        self._pid = None
+        self._hilo = None
+        self._suscripciones = set()
+        self._seq = None
+        self.consultas = self.eventos = self.mensajes = self.desbordes = 0
+
+    def iniciar(self):
+        if self._pid == os.getpid() and self._hilo.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._hilo.is_alive():
+                return
+            # Después de un fork las suscripciones del padre no son de este proceso
+            self._pid = os.getpid()
+            self._suscripciones = set()
+            self._seq = None
+            self._hilo = threading.Thread(target=self._ciclo, name='difusor-eventos', daemon=True)
+            self._hilo.start()
+
+    def suscribir(self):
+        self.iniciar()
+        with self._lock:
+            if len(self._suscripciones) >= self.max_suscriptores:
+                raise Saturado("Demasiadas conexiones de eventos abiertas")
+            if self._seq is None:
+                conn = db.pool.acquire()
+                try:
+                    self._seq = ultimo_seq(conn)
+                finally:
+                    conn.close()
+            suscripcion = Suscripcion(self._seq)
+            self._suscripciones.add(suscripcion)
+            return suscripcion
+
+    def lleno(self):
+        with self._lock:
+            return len(self._suscripciones) >= self.max_suscriptores
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            self._suscripciones.discard(suscripcion)
+
+    def _ciclo(self):
+        ultima_purga = 0
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                if time.monotonic() - ultima_purga > PURGA_CADA:
+                    ultima_purga = time.monotonic()
+                    conn = db.pool.acquire()
+                    try:
+                        purgar(conn)
+                    finally:
+                        conn.close()
+                self._difundir()
+            except Exception as e:
+                print(f"Error al difundir eventos de la cola: {e}")
+
+    def _difundir(self):
+        with self._lock:
+            if not self._suscripciones:
+                # Sin suscriptores no se sigue la tabla; el próximo arranca del último seq
+                self._seq = None
+                return
+            desde = self._seq
+        conn = db.pool.acquire()
+        try:
+            eventos = []
+            while True:
+                lote = eventos_desde(conn, eventos[-1]["seq"] if eventos else desde)
+                eventos.extend(lote)
+                if len(lote) < TAMANO_LOTE:
+                    break
+        finally:
+            conn.close()
+        if not eventos:
+            return
+        # Cada mensaje se codifica una sola vez para todas las conexiones
+        mensajes = [(e["seq"], mensaje_sse(e["seq"], e["tipo"], e)) for e in eventos]
+        with self._lock:
+            if self._seq != desde:
+                return
+            self.consultas += 1
+            self.eventos += len(mensajes)
+            for suscripcion in self._suscripciones:
+                if suscripcion.desbordada:
+                    continue
+                for mensaje in mensajes:
+                    try:
+                        suscripcion.cola.put_nowait(mensaje)
+                    except queue.Full:
+                        suscripcion.desbordada = True
+                        self.desbordes += 1
+                        break
+                    self.mensajes += 1
+                if suscripcion.al_recibir is not None:
+                    suscripcion.al_recibir()
+            self._seq = mensajes[-1][0]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "suscriptores": len(self._suscripciones),
+                "seq": self._seq,
+                "lecturas_con_eventos": self.consultas,
+                "eventos": self.eventos,
+                "mensajes_enviados": self.mensajes,
+                "desbordes": self.desbordes,
+            }
+
+
+difusor = Difusor()
+
+
+def mensajes_iniciales(suscripcion, desde_seq=None):
+    """Mensajes SSE con los que empieza una conexión.
+
+    Sin `desde_seq` (o si ya no se puede reanudar desde ahí) es un snapshot
+    de la cola; si no, los eventos que faltan hasta donde empieza la
+    suscripción. Deja en suscripcion.ultimo el último seq enviado.
+    """
+    conn = db.pool.acquire()
+    try:
+        if desde_seq is not None:
+            try:
+                comprobar_seq(conn, desde_seq)
+            except HistorialPerdido:
+                desde_seq = None
+        if desde_seq is None:
+            ultimo, ordenes = snapshot(conn)
+            suscripcion.ultimo = ultimo
+            yield mensaje_sse(ultimo, 'snapshot', {"seq": ultimo, "ordenes": ordenes})
+            return
+        suscripcion.ultimo = desde_seq
+        while suscripcion.ultimo < suscripcion.inicio:
+            eventos = eventos_desde(conn, suscripcion.ultimo, hasta=suscripcion.inicio)
+            if not eventos:
+                break
+            for evento in eventos:
+                yield mensaje_sse(evento["seq"], evento["tipo"], evento)
+            suscripcion.ultimo = eventos[-1]["seq"]
+    finally:
+        conn.close()
+
+
+def flujo_sse(desde_seq=None):
+    """Generador de la respuesta text/event-stream.
+
+    La suscripción se toma antes de leer la base para no perder eventos; los
+    que llegan por la cola y ya se enviaron desde la tabla se saltan por seq.
+    """
+    suscripcion = difusor.suscribir()
+    try:
+        yield b"retry: 3000\n\n"
+        yield from mensajes_iniciales(suscripcion, desde_seq)
+        while not suscripcion.desbordada:
+            try:
+                seq, mensaje = suscripcion.cola.get(timeout=PING)
+            except queue.Empty:
+                yield b": ping\n\n"
+                continue
+            if seq > suscripcion.ultimo:
+                suscripcion.ultimo = seq
+                yield mensaje
+    finally:
+        difusor.cancelar(suscripcion)
@@ -0,0 +1,74 @@
+# backend/gunicorn.conf.py
+# Configuración de producción de Gunicorn (Gunicorn la lee sola si se
+# arranca desde backend/, o con -c gunicorn.conf.py):
+#
+#   gunicorn app:app
+#
+# - preload_app: la aplicación se importa una vez en el master (migraciones,
+#   diarios de la bitácora, ANALYZE, caché de catálogos) y los workers la
+#   heredan con el fork, en vez de repetir todo en cada uno.
+# - Cada worker se calienta (arranque.calentar_worker) antes de aceptar
+#   conexiones, así el primer request no paga abrir la base ni bcrypt.
+# - Workers gthread: WEB_CONCURRENCY (2 x CPUs + 1) procesos de
+#   GUNICORN_HILOS (4) hilos; los hilos nunca superan DB_POOL_SIZE, que es
+#   lo que cada worker puede consultar a la vez.
+# - Cada conexión de /api/ordenes/enviadas/eventos (SSE) ocupa un hilo del
+#   worker mientras está abierta: se aceptan hasta GUNICORN_HILOS - 1 por
+#   worker, así siempre queda un hilo para el resto de la API. Las demás
+#   reciben 503 y pueden usar /api/ordenes/enviadas/cambios; para muchos
+#   analistas conectados a la vez está el modo ASGI (asgi.py). Con un solo
+#   hilo el SSE queda desactivado (se avisa al arrancar).
+# - Recarga sin cortar: `kill -HUP <master>` reemplaza los workers de a uno
+#   cuando terminan sus requests (graceful_timeout). Con preload_app el
+#   código no se vuelve a leer; para desplegar código nuevo sin cortar,
+#   `kill -USR2 <master>` arranca un master nuevo y después
+#   `kill -QUIT <master viejo>`.
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', str(multiprocessing.cpu_count() * 2 + 1)))
+# contrasenas.py reparte los núcleos entre los workers para el pool de
+# bcrypt; con preload_app la app se importa después de leer este archivo
+os.environ['WEB_CONCURRENCY'] = str(workers)
+threads = min(int(os.environ.get('GUNICORN_HILOS', '4')), int(os.environ.get('DB_POOL_SIZE', '8')))
+preload_app = True
+
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+# Reciclar workers de a poco acota la memoria; el jitter evita que todos
+# reinicien a la vez
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '10000'))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get('GUNICORN_ACCESSLOG')  # '-' para la salida estándar
+loglevel = os.environ.get('GUNICORN_LOGLEVEL', 'info')
+
+
+def on_starting(server):
+    # Corre en el master antes de abrir el puerto; la app ya está cargada
+    import arranque
+    segundos = arranque.preparar_master(server.app.wsgi())
+    server.log.info("Base preparada en %.2f s (ANALYZE y catálogos)", segundos)
+    if threads < 2:
+        server.log.warning("GUNICORN_HILOS=%s: con menos de 2 hilos por worker el SSE de "
+                           "/api/ordenes/enviadas/eventos queda desactivado (todas las "
+                           "conexiones reciben 503)", threads)
+
+
+def post_worker_init(worker):
+    import arranque
+    import eventos
+    # Cada conexión SSE retiene un hilo: uno queda siempre para la API
+    eventos.difusor.max_suscriptores = min(eventos.difusor.max_suscriptores, threads - 1)
+    segundos = arranque.calentar_worker(threads)
+    worker.log.info("Worker %s listo en %.2f s", worker.pid, segundos)
+
+
+def worker_exit(server, worker):
+    # Las entradas de la bitácora diferida que queden en memoria se escriben
+    # antes de salir (si no, se recuperan del diario al arrancar otro worker)
+    import auditoria
+    auditoria.escritor.vaciar(timeout=10)
@@ -0,0 +1,281 @@
+# backend/idempotencia.py
+# Claves de idempotencia para las rutas que modifican órdenes.
+#
+# El frontend reintenta cuando un request tarda; sin esto, un reintento de
+# POST /api/ordenes crea la orden dos veces y uno de /pagar deja otro
+# PAGAR_ORDEN en la bitácora (y los contadores del resumen lo cuentan). Si el
+# cliente manda el encabezado Idempotency-Key, la primera respuesta se guarda
+# y los reintentos con la misma clave la reciben de nuevo, con
+# X-Idempotencia: repetida, sin volver a ejecutar la ruta.
+#
+# - La clave vale por usuario (el del token, si hay) y por ruta: una misma
+#   clave con otro cuerpo u otra URL se rechaza con 422.
+# - Antes de ejecutar la ruta, la clave se reserva con una fila sin estado en
+#   claves_idempotencia (migración 9). Un reintento que llega mientras el
+#   original sigue en curso recibe 409 con Retry-After. Si la reserva no se
+#   completa en IDEMPOTENCIA_EN_CURSO_S segundos (el worker murió), otro
+#   request puede tomarla.
+# - Las respuestas 5xx no se guardan: la clave se libera y el reintento
+#   vuelve a ejecutar la ruta.
+# - Delante de la tabla hay una LRU por worker con las respuestas ya
+#   completas (no cambian nunca). Así un reintento suele resolverse sin ir a
+#   la base; si no, basta una lectura por clave primaria, cuyo costo no
+#   depende del tamaño de la tabla en la práctica.
+# - Un hilo por worker borra las claves vencidas (IDEMPOTENCIA_TTL_S) cada
+#   IDEMPOTENCIA_BARRIDO_S segundos, de a lotes por el índice de expira.
+#
+# La respuesta se guarda en una transacción aparte de la de la ruta: si el
+# worker muere entre las dos, la reserva queda en curso y, pasado
+# IDEMPOTENCIA_EN_CURSO_S, un reintento vuelve a ejecutar la ruta.
+import functools
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, g, jsonify, make_response, request
+
+import db
+
+ENCABEZADO = 'Idempotency-Key'
+ENCABEZADO_REPETIDA = 'X-Idempotencia'
+TTL = float(os.environ.get('IDEMPOTENCIA_TTL_S', str(24 * 3600)))
+EN_CURSO = float(os.environ.get('IDEMPOTENCIA_EN_CURSO_S', '120'))
+TAMANO_CACHE = int(os.environ.get('IDEMPOTENCIA_CACHE', '4096'))
+BARRIDO = float(os.environ.get('IDEMPOTENCIA_BARRIDO_S', '300'))
+LOTE_BARRIDO = 1000
+LARGO_MAXIMO = 255
+
+
+class CacheRespuestas:
+    """LRU de respuestas ya guardadas: clave -> (huella, estado, cuerpo, tipo, expira)."""
+
+    def __init__(self, tamano=TAMANO_CACHE):
+        self.tamano = tamano
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()
+
+    def obtener(self, clave, ahora):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return None
+            if entrada[4] <= ahora:
+                del self._entradas[clave]
+                return None
+            self._entradas.move_to_end(clave)
+            return entrada
+
+    def poner(self, clave, entrada):
+        with self._lock:
+            self._entradas[clave] = entrada
+            self._entradas.move_to_end(clave)
+            if len(self._entradas) > self.tamano:
+                self._entradas.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entradas)
+
+
+cache = CacheRespuestas()
+_contadores_lock = threading.Lock()
+contadores = {"ejecutadas": 0, "repetidas_memoria": 0, "repetidas_base": 0, "en_curso": 0,
+              "clave_reutilizada": 0, "liberadas": 0, "barridas": 0}
+
+
+def _contar(nombre, cantidad=1):
+    with _contadores_lock:
+        contadores[nombre] += cantidad
+
+
+def huella(con_cuerpo=True):
+    """Resumen de lo que identifica al request: método, URL y cuerpo.
+
+    Las rutas que leen el cuerpo como stream (importación) usan el tipo y el
+    largo del contenido en lugar del cuerpo, para no cargarlo en memoria.
+    """
+    h = hashlib.sha256()
+    h.update(f"{request.method} {request.path}?{request.query_string.decode('latin-1')}\n".encode())
+    if con_cuerpo:
+        h.update(request.get_data(cache=True))
+    else:
+        h.update(f"{request.content_type} {request.content_length}".encode())
+    return h.hexdigest()
+
+
+def _tomable(fila, ahora):
+    """Si la clave ya no vale: venció o quedó en curso de un request que no terminó."""
+    return fila['expira'] <= ahora or (fila['estado'] is None and fila['creada'] <= ahora - EN_CURSO)
+
+
+def reservar(conn, clave, huella_request, ahora):
+    """Reserva la clave para este request.
+
+    Devuelve None si quedó reservada (hay que ejecutar la ruta) o la fila
+    (huella, estado, cuerpo, tipo, expira) que ya tenía la clave. Un
+    reintento solo lee; la escritura es para las claves nuevas.
+    """
+    consulta = "SELECT huella, estado, cuerpo, tipo, creada, expira FROM claves_idempotencia WHERE clave = ?"
+    while True:
+        fila = conn.execute(consulta, (clave,)).fetchone()
+        if fila is not None and not _tomable(fila, ahora):
+            return (fila['huella'], fila['estado'], fila['cuerpo'], fila['tipo'], fila['expira'])
+        if fila is None:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO claves_idempotencia (clave, huella, creada, expira) VALUES (?, ?, ?, ?)",
+                (clave, huella_request, ahora, ahora + TTL))
+        else:
+            cursor = conn.execute(
+                """UPDATE claves_idempotencia SET huella = ?, estado = NULL, cuerpo = NULL, tipo = NULL,
+                          creada = ?, expira = ?
+                   WHERE clave = ? AND (expira <= ? OR (estado IS NULL AND creada <= ?))""",
+                (huella_request, ahora, ahora + TTL, clave, ahora, ahora - EN_CURSO))
+        conn.commit()
+        if cursor.rowcount:
+            return None
+        # Otro request la reservó (o la barrió) entre la lectura y la escritura: se lee de nuevo
+
+
+def guardar(conn, clave, respuesta, ahora):
+    entrada = (respuesta.status_code, respuesta.get_data(), respuesta.mimetype, ahora + TTL)
+    conn.execute("UPDATE claves_idempotencia SET estado = ?, cuerpo = ?, tipo = ?, expira = ? WHERE clave = ?",
+                 (*entrada, clave))
+    conn.commit()
+    return entrada
+
+
+def liberar(conn, clave):
+    conn.execute("DELETE FROM claves_idempotencia WHERE clave = ? AND estado IS NULL", (clave,))
+    conn.commit()
+
+
+def _repetir(entrada):
+    _, estado, cuerpo, tipo, _ = entrada
+    respuesta = Response(cuerpo, status=estado, mimetype=tipo)
+    respuesta.headers[ENCABEZADO_REPETIDA] = 'repetida'
+    return respuesta
+
+
+def _con_conexion(funcion, *args):
+    conn = db.pool.acquire()
+    try:
+        return funcion(conn, *args)
+    finally:
+        conn.close()
+
+
+def idempotente(vista=None, *, con_cuerpo=True):
+    """Hace que la ruta respete Idempotency-Key. Sin el encabezado no cambia nada.
+
+    Va después de @autenticado, para que la clave quede asociada al usuario
+    del token y las respuestas 401/403 no se guarden.
+    """
+    def decorador(vista):
+        @functools.wraps(vista)
+        def envoltura(*args, **kwargs):
+            clave_cliente = request.headers.get(ENCABEZADO)
+            if not clave_cliente:
+                return vista(*args, **kwargs)
+            if len(clave_cliente) > LARGO_MAXIMO:
+                return jsonify({"error": f"{ENCABEZADO} no puede superar {LARGO_MAXIMO} caracteres"}), 400
+            usuario = g.get('usuario')
+            clave = f"{usuario['id_usuario'] if usuario else '-'}:{request.endpoint}:{clave_cliente}"
+            huella_request = huella(con_cuerpo)
+            ahora = time.time()
+
+            entrada = cache.obtener(clave, ahora)
+            if entrada is not None:
+                _contar("repetidas_memoria")
+            else:
+                entrada = _con_conexion(reservar, clave, huella_request, ahora)
+                if entrada is None:
+                    return _ejecutar(vista, args, kwargs, clave, huella_request)
+                if entrada[1] is None:
+                    _contar("en_curso")
+                    respuesta = jsonify({"error": "Hay un request con la misma clave en curso"})
+                    respuesta.headers['Retry-After'] = '1'
+                    return respuesta, 409
+                _contar("repetidas_base")
+                cache.poner(clave, entrada)
+            if entrada[0] != huella_request:
+                _contar("clave_reutilizada")
+                return jsonify({"error": f"La {ENCABEZADO} ya se usó con otro request"}), 422
+            return _repetir(entrada)
+        return envoltura
+    if vista is not None:
+        return decorador(vista)
+    return decorador
+
+
+def _ejecutar(vista, args, kwargs, clave, huella_request):
+    try:
+        respuesta = make_response(vista(*args, **kwargs))
+    except Exception:
+        _con_conexion(liberar, clave)
+        _contar("liberadas")
+        raise
+    if respuesta.status_code >= 500 or respuesta.is_streamed:
+        _con_conexion(liberar, clave)
+        _contar("liberadas")
+        return respuesta
+    estado, cuerpo, tipo, expira = _con_conexion(guardar, clave, respuesta, time.time())
+    cache.poner(clave, (huella_request, estado, cuerpo, tipo, expira))
+    _contar("ejecutadas")
+    return respuesta
+
+
+def barrer(conn, ahora=None, lote=LOTE_BARRIDO):
+    """Borra las claves vencidas, de a `lote` para no tomar la escritura mucho tiempo."""
+    ahora = ahora or time.time()
+    total = 0
+    while True:
+        cursor = conn.execute(
+            "DELETE FROM claves_idempotencia WHERE clave IN "
+            "(SELECT clave FROM claves_idempotencia WHERE expira <= ? LIMIT ?)", (ahora, lote))
+        conn.commit()
+        total += cursor.rowcount
+        if cursor.rowcount < lote:
+            return total
+
+
+class Barredor:
+    """Hilo por worker que borra las claves vencidas cada `intervalo` segundos."""
+
+    def __init__(self, intervalo=BARRIDO):
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._pid = None
+        self._hilo = None
+
+    def iniciar(self):
+        if self.intervalo <= 0:
+            return
+        if self._pid == os.getpid() and self._hilo.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._hilo.is_alive():
+                return
+            self._pid = os.getpid()
+            self._hilo = threading.Thread(target=self._ciclo, name='barredor-idempotencia', daemon=True)
+            self._hilo.start()
+
+    def _ciclo(self):
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                _contar("barridas", _con_conexion(barrer))
+            except Exception as e:
+                print(f"Error al borrar claves de idempotencia vencidas: {e}")
+
+
+barredor = Barredor()
+
+
+def stats():
+    with _contadores_lock:
+        resultado = dict(contadores)
+    resultado["pid"] = os.getpid()
+    resultado["cache"] = len(cache)
+    resultado["cache_tamano"] = cache.tamano
+    return resultado
@@ -0,0 +1,175 @@
+# backend/importacion.py
+# Importación masiva de órdenes de pago (cierre de mes).
+#
+# Acepta un arreglo JSON, NDJSON (un objeto por línea) o CSV con encabezado.
+# NDJSON y CSV se leen del cuerpo del request a medida que llegan. Las filas
+# se validan contra los catálogos antes de insertar y se guardan por lotes,
+# cada lote en su propia transacción con executemany.
+import csv
+import datetime
+import io
+import json
+
+TAMANO_LOTE = 500
+
+CAMPOS_REQUERIDOS = ('id_coordinador', 'monto', 'id_moneda', 'id_tipo_pago', 'fecha_factura', 'fecha_vencimiento')
+
+
+class ErrorFormato(ValueError):
+    pass
+
+
+def leer_filas(req):
+    """Genera los diccionarios de cada fila según el Content-Type del request."""
+    tipo = (req.mimetype or '').lower()
+    if tipo in ('application/x-ndjson', 'application/ndjson'):
+        texto = io.TextIOWrapper(req.stream, encoding='utf-8')
+        for linea in texto:
+            linea = linea.strip()
+            if not linea:
+                continue
+            try:
+                yield json.loads(linea)
+            except ValueError:
+                yield ErrorFormato("Línea JSON inválida")
+    elif tipo == 'text/csv':
+        texto = io.TextIOWrapper(req.stream, encoding='utf-8-sig', newline='')
+        for fila in csv.DictReader(texto):
+            # Las celdas vacías del CSV equivalen a campos no enviados
+            yield {k: v for k, v in fila.items() if v not in (None, '')}
+    else:
+        data = req.get_json(silent=True)
+        if not isinstance(data, list):
+            raise ErrorFormato("Se esperaba un arreglo JSON de órdenes")
+        yield from data
+
+
+def fecha_iso(valor):
+    """Fecha AAAA-MM-DD normalizada; ValueError si no lo es."""
+    return datetime.date.fromisoformat(str(valor)).isoformat()
+
+
+class Validador:
+    """Valida filas contra los catálogos, leídos una sola vez al inicio."""
+
+    def __init__(self, conn, id_coordinador_defecto=None, id_coordinador_forzado=None):
+        self.monedas = {r[0] for r in conn.execute("SELECT id_moneda FROM monedas")}
+        self.tipos_pago = {r[0] for r in conn.execute("SELECT id_tipo_pago FROM tipos_pago")}
+        self.usuarios = {r[0] for r in conn.execute("SELECT id_usuario FROM usuarios WHERE activo = 1")}
+        self.id_coordinador_defecto = id_coordinador_defecto
+        self.id_coordinador_forzado = id_coordinador_forzado
+
+    def validar(self, data):
+        """Devuelve la tupla de valores para el INSERT o lanza ValueError."""
+        if isinstance(data, Exception):
+            raise data
+        if not isinstance(data, dict):
+            raise ValueError("La fila no es un objeto")
+        data = dict(data)
+        if self.id_coordinador_forzado is not None:
+            # Con token las órdenes son siempre del usuario que importa
+            data['id_coordinador'] = self.id_coordinador_forzado
+        elif data.get('id_coordinador') in (None, ''):
+            data['id_coordinador'] = self.id_coordinador_defecto
+        faltantes = [c for c in CAMPOS_REQUERIDOS if data.get(c) in (None, '')]
+        if faltantes:
+            raise ValueError("Faltan datos: " + ", ".join(faltantes))
+        try:
+            id_coordinador = int(data['id_coordinador'])
+            id_moneda = int(data['id_moneda'])
+            id_tipo_pago = int(data['id_tipo_pago'])
+            monto = float(data['monto'])
+            impuesto = float(data.get('impuesto', 0.0))
+            descuento = float(data.get('descuento', 0.0))
+            urgente = 1 if str(data.get('urgente', 0)).lower() in ('1', 'true', 'si', 'sí') else 0
+        except (TypeError, ValueError):
+            raise ValueError("Valor numérico inválido")
+        try:
+            fecha_factura = fecha_iso(data['fecha_factura'])
+            fecha_vencimiento = fecha_iso(data['fecha_vencimiento'])
+        except ValueError:
+            raise ValueError("Fecha inválida, se espera AAAA-MM-DD")
+        if monto <= 0:
+            raise ValueError("El monto debe ser mayor a cero")
+        if id_moneda not in self.monedas:
+            raise ValueError(f"Moneda {id_moneda} no existe")
+        if id_tipo_pago not in self.tipos_pago:
+            raise ValueError(f"Tipo de pago {id_tipo_pago} no existe")
+        if id_coordinador not in self.usuarios:
+            raise ValueError(f"Usuario {id_coordinador} no existe o está inactivo")
+        return (monto, id_moneda, id_tipo_pago, fecha_factura, fecha_vencimiento, id_coordinador,
+                urgente, impuesto, descuento, data.get('acreedor'), data.get('documento_compensacion'))
+
+
+def _insertar_lote(conn, lote):
+    """Inserta un lote de filas válidas y su bitácora en una transacción.
+
+    Los id_orden se asignan de forma explícita a partir del máximo actual,
+    dentro de BEGIN IMMEDIATE para que ningún otro proceso escriba en medio.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        base = conn.execute("""
+            SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'ordenes_pago'), 0),
+                       COALESCE((SELECT MAX(id_orden) FROM ordenes_pago), 0))
+        """).fetchone()[0]
+        ids = list(range(base + 1, base + 1 + len(lote)))
+        conn.executemany(
+            """INSERT INTO ordenes_pago (id_orden, monto, id_moneda, id_tipo_pago, fecha_factura, fecha_vencimiento, id_coordinador, estado, urgente, impuesto, descuento, acreedor, documento_compensacion)
+               VALUES (?, ?, ?, ?, ?, ?, ?, 'Creada', ?, ?, ?, ?, ?)""",
+            [(id_orden,) + valores for id_orden, (_, valores) in zip(ids, lote)]
+        )
+        conn.executemany(
+            "INSERT INTO bitacora (id_usuario_accion, accion, detalles, id_orden_afectada) VALUES (?, ?, ?, ?)",
+            [(valores[5], 'CREAR_ORDEN', f'Se creó la orden con monto {valores[0]} (importación)', id_orden)
+             for id_orden, (_, valores) in zip(ids, lote)]
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return ids
+
+
+def importar(conn, filas, id_coordinador_defecto=None, tamano_lote=TAMANO_LOTE, id_coordinador_forzado=None):
+    """Valida e inserta las filas por lotes.
+
+    Las filas sin id_coordinador usan `id_coordinador_defecto`; con
+    `id_coordinador_forzado` todas las filas quedan a nombre de ese usuario,
+    traigan el que traigan. Devuelve (resultados, insertadas, rechazadas);
+    cada resultado indica el número de fila (desde 1) y el id_orden creado
+    o el error.
+    """
+    validador = Validador(conn, id_coordinador_defecto, id_coordinador_forzado)
+    resultados = []
+    lote = []
+    insertadas = rechazadas = 0
+
+    def vaciar():
+        nonlocal insertadas, rechazadas
+        try:
+            ids = _insertar_lote(conn, lote)
+        except Exception as e:
+            for numero, _ in lote:
+                resultados.append({"fila": numero, "ok": False, "error": f"Error en la base de datos: {e}"})
+            rechazadas += len(lote)
+        else:
+            for id_orden, (numero, _) in zip(ids, lote):
+                resultados.append({"fila": numero, "ok": True, "id_orden": id_orden})
+            insertadas += len(lote)
+        lote.clear()
+
+    for numero, data in enumerate(filas, start=1):
+        try:
+            lote.append((numero, validador.validar(data)))
+        except ValueError as e:
+            resultados.append({"fila": numero, "ok": False, "error": str(e)})
+            rechazadas += 1
+            continue
+        if len(lote) >= tamano_lote:
+            vaciar()
+    if lote:
+        vaciar()
+
+    resultados.sort(key=lambda r: r["fila"])
+    return resultados, insertadas, rechazadas
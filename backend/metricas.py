@@ -0,0 +1,268 @@
+# backend/metricas.py
+# Instrumentación de la API en formato de texto de Prometheus (/metrics).
+#
+# Registra, por endpoint: latencia (histograma), tiempo de serialización
+# JSON y bytes enviados; por sentencia SQL: llamadas, tiempo y filas. Las
+# respuestas en streaming (CSV, SSE) se registran al cerrarse, con el tiempo
+# total y los bytes que llegaron a enviarse.
+# Las métricas son de cada worker (la etiqueta pid los distingue).
+#
+# Perfilado opcional de requests lentos (PERFIL_LENTO_MS > 0): un hilo toma
+# muestras de la pila de los requests en curso cada PERFIL_INTERVALO_MS y,
+# si un request tarda más del umbral, guarda sus pilas en formato "folded"
+# (una línea "a;b;c N" por pila) en PERFIL_DIR, listo para flamegraph.pl o
+# speedscope.
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import Response, g, has_app_context, request
+from flask.json.provider import DefaultJSONProvider
+
+import db
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PERFIL_LENTO_MS = float(os.environ.get('PERFIL_LENTO_MS', '0'))
+PERFIL_INTERVALO_MS = float(os.environ.get('PERFIL_INTERVALO_MS', '5'))
+PERFIL_DIR = os.environ.get('PERFIL_DIR', os.path.join(os.path.dirname(__file__), 'perfiles'))
+
+
+class Histograma:
+
+    def __init__(self):
+        self.conteos = [0] * len(BUCKETS)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.suma += valor
+        self.total += 1
+        for i, limite in enumerate(BUCKETS):
+            if valor <= limite:
+                self.conteos[i] += 1
+                break
+
+
+class Registro:
+    """Acumula las métricas de este proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencia = defaultdict(Histograma)          # (endpoint, método, status)
+        self.serializacion = defaultdict(lambda: [0.0, 0])  # endpoint -> [segundos, veces]
+        self.bytes_enviados = defaultdict(int)           # endpoint
+        self.sql = defaultdict(lambda: [0, 0.0, 0])      # sentencia -> [llamadas, segundos, filas]
+
+    def observar_request(self, endpoint, metodo, status, segundos, bytes_salida, serializacion):
+        with self._lock:
+            self.latencia[(endpoint, metodo, status)].observar(segundos)
+            self.bytes_enviados[endpoint] += bytes_salida
+            if serializacion:
+                datos = self.serializacion[endpoint]
+                datos[0] += serializacion
+                datos[1] += 1
+
+    def observar_sql(self, sql, segundos, filas):
+        clave = normalizar_sql(sql)
+        with self._lock:
+            datos = self.sql[clave]
+            datos[0] += 1
+            datos[1] += segundos
+            datos[2] += filas
+
+    def exportar(self):
+        """Texto en formato de exposición de Prometheus."""
+        pid = os.getpid()
+        lineas = []
+        with self._lock:
+            lineas.append("# HELP http_request_duration_seconds Latencia de los requests por endpoint.")
+            lineas.append("# TYPE http_request_duration_seconds histogram")
+            for (endpoint, metodo, status), h in sorted(self.latencia.items()):
+                etiquetas = f'endpoint="{endpoint}",method="{metodo}",status="{status}",pid="{pid}"'
+                acumulado = 0
+                for limite, conteo in zip(BUCKETS, h.conteos):
+                    acumulado += conteo
+                    lineas.append(f'http_request_duration_seconds_bucket{{{etiquetas},le="{limite}"}} {acumulado}')
+                lineas.append(f'http_request_duration_seconds_bucket{{{etiquetas},le="+Inf"}} {h.total}')
+                lineas.append(f'http_request_duration_seconds_sum{{{etiquetas}}} {h.suma:.6f}')
+                lineas.append(f'http_request_duration_seconds_count{{{etiquetas}}} {h.total}')
+
+            lineas.append("# HELP json_serialization_seconds Tiempo serializando respuestas JSON.")
+            lineas.append("# TYPE json_serialization_seconds summary")
+            for endpoint, (segundos, veces) in sorted(self.serializacion.items()):
+                lineas.append(f'json_serialization_seconds_sum{{endpoint="{endpoint}",pid="{pid}"}} {segundos:.6f}')
+                lineas.append(f'json_serialization_seconds_count{{endpoint="{endpoint}",pid="{pid}"}} {veces}')
+
+            lineas.append("# HELP http_response_bytes_total Bytes enviados en el cuerpo de las respuestas.")
+            lineas.append("# TYPE http_response_bytes_total counter")
+            for endpoint, total in sorted(self.bytes_enviados.items()):
+                lineas.append(f'http_response_bytes_total{{endpoint="{endpoint}",pid="{pid}"}} {total}')
+
+            lineas.append("# HELP sqlite_statement_seconds Tiempo en execute y fetch por sentencia.")
+            lineas.append("# TYPE sqlite_statement_seconds summary")
+            for sql, (llamadas, segundos, filas) in sorted(self.sql.items()):
+                etiquetas = f'sql="{_escapar(sql)}",pid="{pid}"'
+                lineas.append(f'sqlite_statement_seconds_sum{{{etiquetas}}} {segundos:.6f}')
+                lineas.append(f'sqlite_statement_seconds_count{{{etiquetas}}} {llamadas}')
+                lineas.append(f'sqlite_statement_rows_total{{{etiquetas}}} {filas}')
+
+        for clave, valor in db.pool.stats().items():
+            if isinstance(valor, (int, float)) and clave != 'pid':
+                lineas.append(f'sqlite_pool_{clave}{{pid="{pid}"}} {valor}')
+        return "\n".join(lineas) + "\n"
+
+
+_ESPACIOS = re.compile(r'\s+')
+
+
+def normalizar_sql(sql):
+    return _ESPACIOS.sub(' ', sql or '').strip()[:200]
+
+
+def _escapar(texto):
+    return texto.replace('\\', '\\\\').replace('"', '\\"')
+
+
+registro = Registro()
+
+
+def sumar_serializacion(segundos):
+    """Acumula tiempo de serialización JSON en el request en curso."""
+    if has_app_context():
+        g._metricas_serializacion = g.get('_metricas_serializacion', 0.0) + segundos
+
+
+class JSONProviderMedido(DefaultJSONProvider):
+    """Igual que el proveedor de Flask, pero acumula el tiempo de serialización del request."""
+
+    def response(self, *args, **kwargs):
+        inicio = time.perf_counter()
+        resultado = super().response(*args, **kwargs)
+        sumar_serializacion(time.perf_counter() - inicio)
+        return resultado
+
+
+class PerfiladorMuestreo:
+    """Toma muestras de la pila de los hilos que están atendiendo un request."""
+
+    def __init__(self, intervalo_ms=PERFIL_INTERVALO_MS):
+        self.intervalo = intervalo_ms / 1000
+        self._activos = {}
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    def _asegurar_hilo(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._hilo = threading.Thread(target=self._ciclo, name='perfilador', daemon=True)
+            self._hilo.start()
+
+    def _ciclo(self):
+        while True:
+            time.sleep(self.intervalo)
+            frames = sys._current_frames()
+            with self._lock:
+                for id_hilo, pilas in self._activos.items():
+                    frame = frames.get(id_hilo)
+                    if frame is not None:
+                        pilas[_pila(frame)] += 1
+
+    def iniciar(self):
+        with self._lock:
+            self._asegurar_hilo()
+            self._activos[threading.get_ident()] = Counter()
+
+    def terminar(self):
+        with self._lock:
+            return self._activos.pop(threading.get_ident(), Counter())
+
+
+def _pila(frame):
+    partes = []
+    while frame is not None:
+        codigo = frame.f_code
+        partes.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(partes))
+
+
+def guardar_perfil(endpoint, segundos, pilas):
+    os.makedirs(PERFIL_DIR, exist_ok=True)
+    nombre = f"{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}_{endpoint}_{int(segundos * 1000)}ms.folded"
+    with open(os.path.join(PERFIL_DIR, nombre), 'w') as f:
+        for pila, conteo in pilas.most_common():
+            f.write(f"{pila} {conteo}\n")
+
+
+perfilador = PerfiladorMuestreo() if PERFIL_LENTO_MS > 0 else None
+
+
+def _antes_del_request():
+    g._metricas_inicio = time.perf_counter()
+    if perfilador:
+        perfilador.iniciar()
+
+
+class CuerpoMedido:
+    """Envuelve el cuerpo de una respuesta en streaming y cuenta los bytes
+    que efectivamente se enviaron."""
+
+    def __init__(self, cuerpo):
+        self._cuerpo = cuerpo
+        self.bytes = 0
+
+    def __iter__(self):
+        for parte in self._cuerpo:
+            self.bytes += len(parte.encode('utf-8') if isinstance(parte, str) else parte)
+            yield parte
+
+    def close(self):
+        # El cierre llega al generador (los SSE liberan su suscripción ahí)
+        if hasattr(self._cuerpo, 'close'):
+            self._cuerpo.close()
+
+
+def _despues_del_request(response):
+    inicio = g.pop('_metricas_inicio', None)
+    if inicio is None:
+        return response
+    endpoint = request.endpoint or 'desconocido'
+    metodo, serializacion = request.method, g.pop('_metricas_serializacion', 0.0)
+    if response.is_streamed and not response.direct_passthrough:
+        # El cuerpo se genera después de este hook: la latencia y los bytes
+        # se registran cuando el servidor cierra la respuesta
+        cuerpo = CuerpoMedido(response.response)
+        response.response = cuerpo
+        response.call_on_close(lambda: registro.observar_request(
+            endpoint, metodo, response.status_code, time.perf_counter() - inicio, cuerpo.bytes, serializacion))
+    else:
+        registro.observar_request(endpoint, metodo, response.status_code, time.perf_counter() - inicio,
+                                  response.content_length or 0, serializacion)
+    segundos = time.perf_counter() - inicio
+    if perfilador:
+        pilas = perfilador.terminar()
+        if segundos * 1000 >= PERFIL_LENTO_MS and pilas:
+            guardar_perfil(endpoint, segundos, pilas)
+    return response
+
+
+def _al_terminar_request(exception=None):
+    # Si el request terminó sin pasar por after_request, liberamos sus muestras
+    if perfilador:
+        perfilador.terminar()
+
+
+def exportar_metricas():
+    return Response(registro.exportar(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    app.json = JSONProviderMedido(app)
+    app.before_request(_antes_del_request)
+    app.after_request(_despues_del_request)
+    app.teardown_request(_al_terminar_request)
+    app.add_url_rule('/metrics', 'metrics', exportar_metricas)
+    db.observador_sql = registro.observar_sql
@@ -0,0 +1,351 @@
+# backend/migraciones.py
+# Cambios de esquema versionados con PRAGMA user_version. Cada entrada se
+# aplica una sola vez, en orden, tanto en bases nuevas como existentes
+# (db.aplicar_migraciones). Nunca modificar una migración ya publicada:
+# agregar una nueva al final.
+MIGRACIONES = [
+    (1, "Índices para las consultas de órdenes, reportes y bitácora", """
+        -- Órdenes de un coordinador, de la más reciente a la más antigua
+        CREATE INDEX IF NOT EXISTS idx_ordenes_coordinador_fecha
+            ON ordenes_pago (id_coordinador, fecha_creacion);
+        -- Bandeja del analista: solo las órdenes 'Enviada', ya ordenadas
+        CREATE INDEX IF NOT EXISTS idx_ordenes_enviadas
+            ON ordenes_pago (urgente DESC, fecha_vencimiento)
+            WHERE estado = 'Enviada';
+        -- Filtros y conteos por estado (historial, total de pagadas)
+        CREATE INDEX IF NOT EXISTS idx_ordenes_estado
+            ON ordenes_pago (estado);
+        -- Reporte por tipo de pago
+        CREATE INDEX IF NOT EXISTS idx_ordenes_tipo_pago
+            ON ordenes_pago (id_tipo_pago);
+        -- Reporte de acciones por analista
+        CREATE INDEX IF NOT EXISTS idx_bitacora_usuario_accion
+            ON bitacora (id_usuario_accion, accion);
+        -- Listado de la bitácora por fecha
+        CREATE INDEX IF NOT EXISTS idx_bitacora_fecha
+            ON bitacora (fecha_accion);
+        -- Devoluciones de una orden
+        CREATE INDEX IF NOT EXISTS idx_devoluciones_orden
+            ON devoluciones (id_orden);
+    """),
+    (2, "Índice de texto completo (FTS5) para la búsqueda de órdenes", """
+        -- rowid = id_orden. remove_diacritics hace que 'nunez' encuentre 'Núñez'.
+        CREATE VIRTUAL TABLE IF NOT EXISTS ordenes_busqueda USING fts5(
+            acreedor, documento_compensacion, coordinador,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        );
+
+        INSERT INTO ordenes_busqueda (rowid, acreedor, documento_compensacion, coordinador)
+        SELECT o.id_orden, o.acreedor, o.documento_compensacion, u.nombre || ' ' || u.apellido
+        FROM ordenes_pago o
+        LEFT JOIN usuarios u ON o.id_coordinador = u.id_usuario;
+
+        -- Triggers para mantener el índice sincronizado
+        CREATE TRIGGER IF NOT EXISTS trg_ordenes_busqueda_insert AFTER INSERT ON ordenes_pago
+        BEGIN
+            INSERT INTO ordenes_busqueda (rowid, acreedor, documento_compensacion, coordinador)
+            SELECT NEW.id_orden, NEW.acreedor, NEW.documento_compensacion,
+                   (SELECT nombre || ' ' || apellido FROM usuarios WHERE id_usuario = NEW.id_coordinador);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_ordenes_busqueda_update
+        AFTER UPDATE OF acreedor, documento_compensacion, id_coordinador ON ordenes_pago
+        BEGIN
+            DELETE FROM ordenes_busqueda WHERE rowid = OLD.id_orden;
+            INSERT INTO ordenes_busqueda (rowid, acreedor, documento_compensacion, coordinador)
+            SELECT NEW.id_orden, NEW.acreedor, NEW.documento_compensacion,
+                   (SELECT nombre || ' ' || apellido FROM usuarios WHERE id_usuario = NEW.id_coordinador);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_ordenes_busqueda_delete AFTER DELETE ON ordenes_pago
+        BEGIN
+            DELETE FROM ordenes_busqueda WHERE rowid = OLD.id_orden;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_usuarios_busqueda_update AFTER UPDATE OF nombre, apellido ON usuarios
+        BEGIN
+            UPDATE ordenes_busqueda SET coordinador = NEW.nombre || ' ' || NEW.apellido
+            WHERE rowid IN (SELECT id_orden FROM ordenes_pago WHERE id_coordinador = NEW.id_usuario);
+        END;
+    """),
+    (3, "Tablas de contadores para /api/reportes/summary", """
+        -- Contadores mantenidos por triggers en la misma transacción que
+        -- modifica ordenes_pago o bitacora. Ver resumenes.py para reconstruirlos.
+        CREATE TABLE IF NOT EXISTS resumen_coordinador (
+            id_coordinador INTEGER PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS resumen_tipo_pago (
+            id_tipo_pago INTEGER PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS resumen_estado (
+            estado TEXT PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS resumen_usuario_accion (
+            id_usuario INTEGER NOT NULL,
+            accion TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (id_usuario, accion)
+        );
+
+        INSERT INTO resumen_coordinador (id_coordinador, total)
+            SELECT id_coordinador, COUNT(*) FROM ordenes_pago GROUP BY id_coordinador;
+        INSERT INTO resumen_tipo_pago (id_tipo_pago, total)
+            SELECT id_tipo_pago, COUNT(*) FROM ordenes_pago GROUP BY id_tipo_pago;
+        INSERT INTO resumen_estado (estado, total)
+            SELECT estado, COUNT(*) FROM ordenes_pago GROUP BY estado;
+        INSERT INTO resumen_usuario_accion (id_usuario, accion, total)
+            SELECT id_usuario_accion, accion, COUNT(*) FROM bitacora GROUP BY id_usuario_accion, accion;
+
+        CREATE TRIGGER IF NOT EXISTS trg_resumen_ordenes_insert AFTER INSERT ON ordenes_pago
+        BEGIN
+            INSERT INTO resumen_coordinador (id_coordinador, total) VALUES (NEW.id_coordinador, 1)
+                ON CONFLICT (id_coordinador) DO UPDATE SET total = total + 1;
+            INSERT INTO resumen_tipo_pago (id_tipo_pago, total) VALUES (NEW.id_tipo_pago, 1)
+                ON CONFLICT (id_tipo_pago) DO UPDATE SET total = total + 1;
+            INSERT INTO resumen_estado (estado, total) VALUES (NEW.estado, 1)
+                ON CONFLICT (estado) DO UPDATE SET total = total + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_resumen_ordenes_delete AFTER DELETE ON ordenes_pago
+        BEGIN
+            UPDATE resumen_coordinador SET total = total - 1 WHERE id_coordinador = OLD.id_coordinador;
+            UPDATE resumen_tipo_pago SET total = total - 1 WHERE id_tipo_pago = OLD.id_tipo_pago;
+            UPDATE resumen_estado SET total = total - 1 WHERE estado = OLD.estado;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_resumen_ordenes_coordinador AFTER UPDATE OF id_coordinador ON ordenes_pago
+        WHEN OLD.id_coordinador IS NOT NEW.id_coordinador
+        BEGIN
+            UPDATE resumen_coordinador SET total = total - 1 WHERE id_coordinador = OLD.id_coordinador;
+            INSERT INTO resumen_coordinador (id_coordinador, total) VALUES (NEW.id_coordinador, 1)
+                ON CONFLICT (id_coordinador) DO UPDATE SET total = total + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_resumen_ordenes_tipo_pago AFTER UPDATE OF id_tipo_pago ON ordenes_pago
+        WHEN OLD.id_tipo_pago IS NOT NEW.id_tipo_pago
+        BEGIN
+            UPDATE resumen_tipo_pago SET total = total - 1 WHERE id_tipo_pago = OLD.id_tipo_pago;
+            INSERT INTO resumen_tipo_pago (id_tipo_pago, total) VALUES (NEW.id_tipo_pago, 1)
+                ON CONFLICT (id_tipo_pago) DO UPDATE SET total = total + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_resumen_ordenes_estado AFTER UPDATE OF estado ON ordenes_pago
+        WHEN OLD.estado IS NOT NEW.estado
+        BEGIN
+            UPDATE resumen_estado SET total = total - 1 WHERE estado = OLD.estado;
+            INSERT INTO resumen_estado (estado, total) VALUES (NEW.estado, 1)
+                ON CONFLICT (estado) DO UPDATE SET total = total + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_resumen_bitacora_insert AFTER INSERT ON bitacora
+        BEGIN
+            INSERT INTO resumen_usuario_accion (id_usuario, accion, total) VALUES (NEW.id_usuario_accion, NEW.accion, 1)
+                ON CONFLICT (id_usuario, accion) DO UPDATE SET total = total + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_resumen_bitacora_delete AFTER DELETE ON bitacora
+        BEGIN
+            UPDATE resumen_usuario_accion SET total = total - 1
+            WHERE id_usuario = OLD.id_usuario_accion AND accion = OLD.accion;
+        END;
+    """),
+    (4, "Versión de los catálogos para la caché compartida entre workers", """
+        -- La tabla existía en la base de producción pero no en schema.sql
+        CREATE TABLE IF NOT EXISTS tipos_devolucion (
+            id_tipo_devolucion INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre_devolucion TEXT NOT NULL UNIQUE,
+            descripcion TEXT
+        );
+
+        -- Cada cambio en un catálogo sube su versión; los workers comparan
+        -- esta versión con la de su caché antes de usarla.
+        CREATE TABLE IF NOT EXISTS catalogos_version (
+            catalogo TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 1,
+            actualizado DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        INSERT OR IGNORE INTO catalogos_version (catalogo) VALUES ('monedas'), ('tipos_pago'), ('tipos_devolucion');
+
+        CREATE TRIGGER IF NOT EXISTS trg_version_monedas_insert AFTER INSERT ON monedas
+        BEGIN
+            UPDATE catalogos_version SET version = version + 1, actualizado = CURRENT_TIMESTAMP
+            WHERE catalogo = 'monedas';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_version_monedas_update AFTER UPDATE ON monedas
+        BEGIN
+            UPDATE catalogos_version SET version = version + 1, actualizado = CURRENT_TIMESTAMP
+            WHERE catalogo = 'monedas';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_version_monedas_delete AFTER DELETE ON monedas
+        BEGIN
+            UPDATE catalogos_version SET version = version + 1, actualizado = CURRENT_TIMESTAMP
+            WHERE catalogo = 'monedas';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_version_tipos_pago_insert AFTER INSERT ON tipos_pago
+        BEGIN
+            UPDATE catalogos_version SET version = version + 1, actualizado = CURRENT_TIMESTAMP
+            WHERE catalogo = 'tipos_pago';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_version_tipos_pago_update AFTER UPDATE ON tipos_pago
+        BEGIN
+            UPDATE catalogos_version SET version = version + 1, actualizado = CURRENT_TIMESTAMP
+            WHERE catalogo = 'tipos_pago';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_version_tipos_pago_delete AFTER DELETE ON tipos_pago
+        BEGIN
+            UPDATE catalogos_version SET version = version + 1, actualizado = CURRENT_TIMESTAMP
+            WHERE catalogo = 'tipos_pago';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_version_tipos_devolucion_insert AFTER INSERT ON tipos_devolucion
+        BEGIN
+            UPDATE catalogos_version SET version = version + 1, actualizado = CURRENT_TIMESTAMP
+            WHERE catalogo = 'tipos_devolucion';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_version_tipos_devolucion_update AFTER UPDATE ON tipos_devolucion
+        BEGIN
+            UPDATE catalogos_version SET version = version + 1, actualizado = CURRENT_TIMESTAMP
+            WHERE catalogo = 'tipos_devolucion';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_version_tipos_devolucion_delete AFTER DELETE ON tipos_devolucion
+        BEGIN
+            UPDATE catalogos_version SET version = version + 1, actualizado = CURRENT_TIMESTAMP
+            WHERE catalogo = 'tipos_devolucion';
+        END;
+    """),
+    (5, "Avance de los diarios de la bitácora diferida", """
+        -- Último número de secuencia de cada diario (bitacora-*.journal) que
+        -- ya está en la tabla bitacora. Se actualiza en la misma transacción
+        -- que las inserciones, así al reproducir un diario no se duplica nada.
+        CREATE TABLE IF NOT EXISTS bitacora_diario (
+            diario TEXT PRIMARY KEY,
+            ultimo_seq INTEGER NOT NULL
+        );
+    """),
+    (6, "Particiones mensuales de archivo para órdenes pagadas y bitácora", """
+        -- Meses movidos a archivo/pagos-AAAA-MM.db (ver archivo.py)
+        CREATE TABLE IF NOT EXISTS archivo_particiones (
+            mes TEXT PRIMARY KEY,
+            ordenes INTEGER NOT NULL DEFAULT 0,
+            bitacora INTEGER NOT NULL DEFAULT 0,
+            actualizado DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+
+        -- Tiene una fila solo dentro de la transacción que mueve filas al
+        -- archivo: así los borrados no descuentan de los contadores, que
+        -- siguen reflejando toda la historia.
+        CREATE TABLE IF NOT EXISTS archivo_en_curso (activo INTEGER);
+
+        DROP TRIGGER IF EXISTS trg_resumen_ordenes_delete;
+        CREATE TRIGGER trg_resumen_ordenes_delete AFTER DELETE ON ordenes_pago
+        WHEN NOT EXISTS (SELECT 1 FROM archivo_en_curso)
+        BEGIN
+            UPDATE resumen_coordinador SET total = total - 1 WHERE id_coordinador = OLD.id_coordinador;
+            UPDATE resumen_tipo_pago SET total = total - 1 WHERE id_tipo_pago = OLD.id_tipo_pago;
+            UPDATE resumen_estado SET total = total - 1 WHERE estado = OLD.estado;
+        END;
+
+        DROP TRIGGER IF EXISTS trg_resumen_bitacora_delete;
+        CREATE TRIGGER trg_resumen_bitacora_delete AFTER DELETE ON bitacora
+        WHEN NOT EXISTS (SELECT 1 FROM archivo_en_curso)
+        BEGIN
+            UPDATE resumen_usuario_accion SET total = total - 1
+            WHERE id_usuario = OLD.id_usuario_accion AND accion = OLD.accion;
+        END;
+    """),
+    (7, "Eventos de la cola de órdenes enviadas para los analistas", """
+        -- Cada orden que entra ('alta'), sale ('baja') o cambia ('cambio') en
+        -- la cola de 'Enviada', en la misma transacción que el cambio. seq es
+        -- el número de secuencia con el que los clientes reanudan (eventos.py).
+        CREATE TABLE IF NOT EXISTS eventos_enviadas (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_orden INTEGER NOT NULL,
+            tipo TEXT NOT NULL,
+            fecha DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TRIGGER IF NOT EXISTS trg_eventos_enviadas_insert AFTER INSERT ON ordenes_pago
+        WHEN NEW.estado = 'Enviada'
+        BEGIN
+            INSERT INTO eventos_enviadas (id_orden, tipo) VALUES (NEW.id_orden, 'alta');
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_eventos_enviadas_update AFTER UPDATE ON ordenes_pago
+        WHEN OLD.estado = 'Enviada' OR NEW.estado = 'Enviada'
+        BEGIN
+            INSERT INTO eventos_enviadas (id_orden, tipo) VALUES (NEW.id_orden,
+                CASE WHEN OLD.estado IS NOT 'Enviada' THEN 'alta'
+                     WHEN NEW.estado IS NOT 'Enviada' THEN 'baja'
+                     ELSE 'cambio' END);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_eventos_enviadas_delete AFTER DELETE ON ordenes_pago
+        WHEN OLD.estado = 'Enviada'
+        BEGIN
+            INSERT INTO eventos_enviadas (id_orden, tipo) VALUES (OLD.id_orden, 'baja');
+        END;
+    """),
+    (8, "Versión de los usuarios para la caché de usuarios de cada worker", """
+        -- Mismo mecanismo que los catálogos (migración 4): un cambio en los
+        -- datos que usa la autorización sube la versión y cada worker descarta
+        -- su caché de usuarios (autenticacion.py). El cambio de hash de la
+        -- contraseña no cuenta: el token no depende de él.
+        INSERT OR IGNORE INTO catalogos_version (catalogo) VALUES ('usuarios');
+
+        CREATE TRIGGER IF NOT EXISTS trg_version_usuarios_update
+        AFTER UPDATE OF nombre, apellido, email, id_rol, activo ON usuarios
+        BEGIN
+            UPDATE catalogos_version SET version = version + 1, actualizado = CURRENT_TIMESTAMP
+            WHERE catalogo = 'usuarios';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_version_usuarios_delete AFTER DELETE ON usuarios
+        BEGIN
+            UPDATE catalogos_version SET version = version + 1, actualizado = CURRENT_TIMESTAMP
+            WHERE catalogo = 'usuarios';
+        END;
+    """),
+    (9, "Claves de idempotencia de las rutas que modifican órdenes", """
+        -- Respuesta guardada de cada request con Idempotency-Key
+        -- (idempotencia.py). Mientras el request original está en curso,
+        -- estado es NULL. expira es un timestamp Unix; el índice es para el
+        -- barrido de las vencidas.
+        CREATE TABLE IF NOT EXISTS claves_idempotencia (
+            clave TEXT PRIMARY KEY,
+            huella TEXT NOT NULL,
+            estado INTEGER,
+            cuerpo BLOB,
+            tipo TEXT,
+            creada REAL NOT NULL,
+            expira REAL NOT NULL
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_claves_idempotencia_expira
+            ON claves_idempotencia (expira);
+    """),
+    (10, "Entradas confirmadas de los diarios de la bitácora diferida", """
+        -- Una fila por entrada de un diario (bitacora-*.journal) cuyo cambio
+        -- hizo commit y que todavía no está en la tabla bitacora. Se inserta
+        -- en la transacción del cambio y se borra en la misma transacción
+        -- que inserta la entrada en bitacora: al reproducir un diario se
+        -- insertan solo las entradas que tienen fila, así no se duplica nada
+        -- ni se cuelan las de transacciones que hicieron rollback.
+        -- Reemplaza al avance por diario de la migración 5.
+        CREATE TABLE IF NOT EXISTS bitacora_confirmada (
+            diario TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            PRIMARY KEY (diario, seq)
+        ) WITHOUT ROWID;
+        DROP TABLE IF EXISTS bitacora_diario;
+    """),
+]
@@ -0,0 +1,87 @@
+# backend/paginacion.py
+# Utilidades para paginar por cursor (keyset) y transmitir resultados grandes
+# sin cargarlos completos en memoria.
+import base64
+import json
+
+from flask import Response, stream_with_context
+
+from respuestas import dumps
+
+LIMITE_MAXIMO = 1000
+TAMANO_LOTE = 500
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def encode_cursor(valores):
+    """Convierte la clave de la última fila en un cursor opaco para el cliente."""
+    raw = json.dumps(valores, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (ValueError, TypeError):
+        raise CursorInvalido("Cursor inválido")
+    if not isinstance(valores, list):
+        raise CursorInvalido("Cursor inválido")
+    return valores
+
+
+def parse_limite(valor):
+    """Lee el parámetro `limite`; None si no se pidió paginación."""
+    if valor is None or valor == '':
+        return None
+    try:
+        limite = int(valor)
+    except ValueError:
+        raise CursorInvalido("El límite debe ser un número")
+    if limite < 1:
+        raise CursorInvalido("El límite debe ser mayor a cero")
+    return min(limite, LIMITE_MAXIMO)
+
+
+def stream_response(conn, cursor, formato, proyeccion):
+    """Respuesta chunked generada directamente desde el cursor.
+
+    formato='ndjson' envía un objeto JSON por línea; formato='json' envía un
+    único arreglo JSON, escrito de a un lote de filas por vez.
+    El cursor debe devolver tuplas (respuestas.consultar) y `proyeccion`
+    decide qué columnas van en cada objeto.
+    La conexión se devuelve al pool cuando termina el generador.
+    """
+    def lotes():
+        while True:
+            rows = cursor.fetchmany(TAMANO_LOTE)
+            if not rows:
+                break
+            yield proyeccion.filas(rows)
+
+    def generar_ndjson():
+        try:
+            for lote in lotes():
+                yield b''.join(dumps(fila) + b'\n' for fila in lote)
+        finally:
+            conn.close()
+
+    def generar_json():
+        try:
+            yield b'['
+            primero = True
+            for lote in lotes():
+                # Se codifica el lote como arreglo y se le quitan los corchetes
+                parte = dumps(lote)[1:-1]
+                yield parte if primero else b',' + parte
+                primero = False
+            yield b']'
+        finally:
+            conn.close()
+
+    if formato == 'ndjson':
+        return Response(stream_with_context(generar_ndjson()), mimetype='application/x-ndjson')
+    return Response(stream_with_context(generar_json()), mimetype='application/json')
@@ -0,0 +1,142 @@
+# backend/plan_consultas.py
+# Verificación de planes de consulta de los endpoints de órdenes, reportes y
+# bitácora. Genera una base grande, llama a cada endpoint con el cliente de
+# pruebas de Flask, captura el SQL que se ejecuta y revisa su EXPLAIN QUERY
+# PLAN. Falla (código de salida 1) si alguna consulta recorre una tabla
+# completa o necesita ordenar con un B-tree temporal.
+#
+# Uso:
+#   python plan_consultas.py --ordenes 200000
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+# Recorridos completos permitidos: (endpoint, alias de la tabla).
+# El historial sin filtros recorre ordenes_pago por id_orden DESC, que es el
+# orden de la clave primaria, y se corta con LIMIT.
+# El resumen recorre las tablas de contadores (r), que tienen una fila por
+# coordinador, tipo de pago o analista, no por orden.
+# Los totales sin filtro de estado suman todas las órdenes y leen el catálogo
+# de monedas completo (unas pocas filas) para los tipos de cambio.
+SCANS_PERMITIDOS = {
+    ('historial', 'o'),
+    ('resumen', 'r'),
+    ('totales', 'o'),
+    ('totales', 'monedas'),
+    ('totales_exposicion', 'monedas'),
+    ('totales_detalle', 'o'),
+    ('totales_detalle', 'monedas'),
+}
+
+# Ordenamientos temporales permitidos: en las búsquedas solo se ordenan las
+# filas que devolvió el índice de texto completo, no la tabla entera.
+ORDENAMIENTOS_PERMITIDOS = {
+    'historial_busqueda',
+    'enviadas_busqueda',
+}
+
+CONSULTAS = [
+    # (nombre, url)
+    ('ordenes_coordinador', '/api/ordenes/{coordinador}'),
+    ('ordenes_coordinador_filtros', '/api/ordenes/{coordinador}?estado=Pagada&tipo_pago=1'),
+    ('enviadas', '/api/ordenes/enviadas'),
+    ('enviadas_urgentes', '/api/ordenes/enviadas?urgente=si'),
+    ('enviadas_busqueda', '/api/ordenes/enviadas?buscar=ferre'),
+    ('enviadas_siguientes', '/api/ordenes/enviadas/siguientes?n=20'),
+    ('enviadas_por_vencer', '/api/ordenes/enviadas/por_vencer?dias=30'),
+    ('historial', '/api/ordenes/historial?limite=50'),
+    ('historial_estado', '/api/ordenes/historial?estado=Devuelta&limite=50'),
+    ('historial_busqueda', '/api/ordenes/historial?buscar=nunez%20pacif'),
+    ('bitacora', '/api/bitacora?limite=50'),
+    ('resumen', '/api/reportes/summary'),
+    ('totales', '/api/reportes/totales?agrupar=coordinador,tipo_pago'),
+    ('totales_exposicion', '/api/reportes/totales?agrupar=coordinador,vencimiento&estado=Creada,Enviada'),
+    ('totales_detalle', '/api/reportes/totales?detalle=csv'),
+    ('detalle', '/api/ordenes/detalle/1'),
+]
+
+
+def problemas_del_plan(plan, nombre):
+    """Devuelve la lista de pasos del plan que no están permitidos."""
+    problemas = []
+    for _, _, _, detalle in plan:
+        if 'USE TEMP B-TREE' in detalle:
+            if nombre not in ORDENAMIENTOS_PERMITIDOS:
+                problemas.append(detalle)
+        elif detalle.startswith('SCAN ') and ' USING ' not in detalle and 'VIRTUAL TABLE' not in detalle:
+            alias = detalle.split()[1]
+            if (nombre, alias) not in SCANS_PERMITIDOS:
+                problemas.append(detalle)
+    return problemas
+
+
+def verificar(ordenes, usuarios, verbose=False):
+    tmp = tempfile.mkdtemp()
+    os.makedirs(os.path.join(tmp, 'database'))
+    os.environ['RENDER_DISK_PATH'] = tmp
+    os.environ.setdefault('JWT_SECRETO', 'benchmark-solo-para-pruebas-locales-0000')
+    try:
+        import datos_sinteticos
+        ruta = os.path.join(tmp, 'database', 'pagos.db')
+        print(f"Generando {ordenes} órdenes en {ruta}...")
+        datos_sinteticos.generar(ruta, usuarios=usuarios, ordenes=ordenes)
+
+        import app as aplicacion
+        import db
+
+        sentencias = []
+        connect_original = db.pool._connect
+
+        def _connect_con_traza():
+            conn = connect_original()
+            conn.set_trace_callback(sentencias.append)
+            return conn
+        db.pool._connect = _connect_con_traza
+
+        coordinador = _coordinador_con_mas_ordenes(ruta)
+        cliente = aplicacion.app.test_client()
+        plan_conn = db.pool.acquire()
+        fallos = 0
+        for nombre, url in CONSULTAS:
+            del sentencias[:]
+            respuesta = cliente.get(url.format(coordinador=coordinador))
+            if respuesta.status_code >= 400:
+                print(f"[ERROR] {nombre}: HTTP {respuesta.status_code}")
+                fallos += 1
+                continue
+            # Las consultas internas de FTS5 sobre sus tablas auxiliares
+            # aparecen en la traza con el esquema entre comillas; se omiten.
+            consultas = [s for s in sentencias if s.lstrip().upper().startswith('SELECT') and "'main'." not in s]
+            for sql in consultas:
+                plan = plan_conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+                problemas = problemas_del_plan(plan, nombre)
+                if problemas:
+                    fallos += 1
+                    print(f"[FALLA] {nombre}: {'; '.join(problemas)}")
+                    print("        " + " ".join(sql.split()))
+                elif verbose:
+                    print(f"[OK] {nombre}: {'; '.join(p[3] for p in plan)}")
+        plan_conn.close()
+        print("Sin regresiones en los planes de consulta." if not fallos else f"{fallos} consultas con problemas.")
+        return fallos
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _coordinador_con_mas_ordenes(ruta):
+    conn = sqlite3.connect(ruta)
+    fila = conn.execute("SELECT id_coordinador FROM ordenes_pago GROUP BY id_coordinador ORDER BY COUNT(*) DESC LIMIT 1").fetchone()
+    conn.close()
+    return fila[0]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Revisa los planes de consulta de los endpoints.")
+    parser.add_argument('--ordenes', type=int, default=200000)
+    parser.add_argument('--usuarios', type=int, default=300)
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+    sys.exit(1 if verificar(args.ordenes, args.usuarios, args.verbose) else 0)
@@ -0,0 +1,309 @@
+# backend/planificador.py
+# Cola de pagos pendientes en memoria: las órdenes 'Enviada' en dos montículos
+# (heapq), uno por prioridad (urgente primero, después la que vence antes) y
+# otro solo por fecha de vencimiento. Con eso se responden sin ordenar la
+# cola entera:
+#   - "las próximas N a pagar"        O(N log N)
+#   - "las que vencen en X días"      O(k log k) para las k que vencen
+#
+# La cola se carga una vez desde ordenes_pago (en el master con preload_app,
+# así los workers la heredan armada) y después se actualiza de a una orden
+# siguiendo eventos_enviadas: los triggers de la migración 7 anotan ahí cada
+# orden que entra, sale o cambia en la cola, desde cualquier ruta (crear,
+# enviar, pagar, devolver, editar, lotes, importación) y cualquier worker.
+# Antes de cada consulta se leen los eventos nuevos (una lectura por clave
+# primaria si no hay ninguno).
+#
+# Las órdenes que salen o cambian no se buscan dentro del montículo: su
+# entrada queda obsoleta (no coincide con la generación vigente de la orden)
+# y se salta al recorrerlo; cuando las obsoletas superan a las vigentes se
+# reconstruyen los montículos.
+#
+# Un hilo por worker compara la cola con la base cada PLANIFICADOR_VERIFICAR_S
+# segundos (300; 0 = nunca) y corrige las diferencias que encuentre.
+import datetime
+import heapq
+import json
+import os
+import threading
+import time
+
+import db
+from eventos import ORDEN, TAMANO_LOTE, HistorialPerdido, comprobar_seq, ultimo_seq
+from respuestas import Proyeccion, consultar
+
+VERIFICAR_CADA = float(os.environ.get('PLANIFICADOR_VERIFICAR_S', '300'))
+MAXIMO = 1000  # órdenes por consulta
+# Vencimiento de las órdenes sin fecha o con una fecha que no es AAAA-MM-DD
+# (cargadas antes de que las rutas la validaran): van al final de la cola y
+# nunca aparecen por vencer
+SIN_FECHA = '9999-12-31'
+
+# Con este ORDER BY se lee solo el índice parcial idx_ordenes_enviadas (lo
+# cubre) y las filas llegan ya en el orden del montículo de prioridad
+ENVIADAS = """
+    SELECT id_orden, urgente, fecha_vencimiento FROM ordenes_pago WHERE estado = 'Enviada'
+    ORDER BY urgente DESC, fecha_vencimiento
+"""
+
+
+def _clave(urgente, fecha_vencimiento):
+    try:
+        vencimiento = datetime.date.fromisoformat(str(fecha_vencimiento)[:10]).isoformat()
+    except ValueError:
+        vencimiento = SIN_FECHA
+    return (1 if urgente else 0, vencimiento)
+
+
+class Planificador:
+
+    def __init__(self, verificar_cada=VERIFICAR_CADA):
+        self.verificar_cada = verificar_cada
+        self._lock = threading.Lock()
+        self._pid = None
+        self._hilo = None
+        # id_orden -> (clave, generación) de las órdenes en la cola
+        self._vigentes = {}
+        self._generacion = 0
+        # (-urgente, vencimiento, id_orden, generación)
+        self._prioridad = []
+        # (vencimiento, -urgente, id_orden, generación)
+        self._vencimiento = []
+        self._seq = None
+        self.cargas = self.eventos = self.reconstrucciones = 0
+        self.verificaciones = self.correcciones = 0
+        self.ultima_verificacion = None
+
+    # --- mantenimiento de los montículos (con el lock tomado) ---
+
+    def _poner(self, id_orden, clave):
+        actual = self._vigentes.get(id_orden)
+        if actual is not None and actual[0] == clave:
+            return
+        self._generacion += 1
+        self._vigentes[id_orden] = (clave, self._generacion)
+        urgente, vencimiento = clave
+        heapq.heappush(self._prioridad, (-urgente, vencimiento, id_orden, self._generacion))
+        heapq.heappush(self._vencimiento, (vencimiento, -urgente, id_orden, self._generacion))
+
+    def _quitar(self, id_orden):
+        self._vigentes.pop(id_orden, None)
+
+    def _armar(self):
+        """Montículos nuevos solo con las entradas vigentes, en O(n)."""
+        self._prioridad = [(-u, v, i, gen) for i, ((u, v), gen) in self._vigentes.items()]
+        self._vencimiento = [(v, -u, i, gen) for i, ((u, v), gen) in self._vigentes.items()]
+        heapq.heapify(self._prioridad)
+        heapq.heapify(self._vencimiento)
+
+    def _reconstruir_si_hace_falta(self):
+        if len(self._prioridad) > 2 * len(self._vigentes) + 1024:
+            self._armar()
+            self.reconstrucciones += 1
+
+    def _primeras(self, monticulo, cantidad, hasta=None):
+        """Hasta `cantidad` entradas vigentes del montículo en orden (y con
+        primer campo <= `hasta`), sin modificarlo.
+
+        Recorre el árbol con un segundo montículo de candidatos (los hijos de
+        lo ya devuelto), así obtener las k primeras cuesta O(k log k).
+        """
+        resultado = []
+        if not monticulo:
+            return resultado
+        push, pop, vigentes, total = heapq.heappush, heapq.heappop, self._vigentes, len(monticulo)
+        # Cada candidato es la entrada con su posición en el montículo al final
+        candidatos = [monticulo[0] + (0,)]
+        while candidatos and len(resultado) < cantidad:
+            entrada = pop(candidatos)
+            if hasta is not None and entrada[0] > hasta:
+                break
+            hijo = 2 * entrada[4] + 1
+            if hijo < total:
+                push(candidatos, monticulo[hijo] + (hijo,))
+                if hijo + 1 < total:
+                    push(candidatos, monticulo[hijo + 1] + (hijo + 1,))
+            actual = vigentes.get(entrada[2])
+            if actual is not None and actual[1] == entrada[3]:
+                resultado.append(entrada)
+        return resultado
+
+    # --- sincronización con la base ---
+
+    def _cargar(self, conn):
+        # seq y cola leídos en una misma transacción de lectura
+        propia = not conn.in_transaction
+        if propia:
+            conn.execute("BEGIN")
+        try:
+            seq = ultimo_seq(conn)
+            filas = conn.execute(ENVIADAS).fetchall()
+        finally:
+            if propia:
+                conn.commit()
+        self._vigentes = {}
+        for id_orden, urgente, fecha_vencimiento in filas:
+            self._generacion += 1
+            self._vigentes[id_orden] = (_clave(urgente, fecha_vencimiento), self._generacion)
+        self._armar()
+        self._seq = seq
+        self.cargas += 1
+
+    def _aplicar_eventos(self, conn):
+        try:
+            comprobar_seq(conn, self._seq)
+        except HistorialPerdido:
+            self._cargar(conn)
+            return
+        while True:
+            filas = conn.execute(
+                "SELECT seq, id_orden FROM eventos_enviadas WHERE seq > ? ORDER BY seq LIMIT ?",
+                (self._seq, TAMANO_LOTE)
+            ).fetchall()
+            if not filas:
+                return
+            # El tipo de evento no hace falta: vale el estado actual de la orden
+            ids = list({fila[1] for fila in filas})
+            actuales = {
+                fila[0]: fila for fila in conn.execute(
+                    "SELECT id_orden, estado, urgente, fecha_vencimiento FROM ordenes_pago "
+                    "WHERE id_orden IN (SELECT value FROM json_each(?))", (json.dumps(ids),))
+            }
+            for id_orden in ids:
+                fila = actuales.get(id_orden)
+                if fila is not None and fila[1] == 'Enviada':
+                    self._poner(id_orden, _clave(fila[2], fila[3]))
+                else:
+                    self._quitar(id_orden)
+            self.eventos += len(filas)
+            self._seq = filas[-1][0]
+            self._reconstruir_si_hace_falta()
+            if len(filas) < TAMANO_LOTE:
+                return
+
+    def sincronizar(self):
+        """Carga la cola la primera vez y después aplica los eventos nuevos."""
+        with self._lock:
+            conn = db.pool.acquire()
+            try:
+                if self._seq is None:
+                    self._cargar(conn)
+                else:
+                    self._aplicar_eventos(conn)
+            finally:
+                conn.close()
+
+    def verificar(self):
+        """Compara la cola con la base y corrige las diferencias. Devuelve cuántas hubo."""
+        with self._lock:
+            conn = db.pool.acquire()
+            try:
+                if self._seq is None:
+                    self._cargar(conn)
+                    return 0
+                # Los eventos pendientes primero, en la misma transacción de
+                # lectura que la cola de la base, para comparar el mismo momento
+                conn.execute("BEGIN")
+                try:
+                    self._aplicar_eventos(conn)
+                    en_base = {id_orden: _clave(urgente, fecha_vencimiento)
+                               for id_orden, urgente, fecha_vencimiento in conn.execute(ENVIADAS)}
+                finally:
+                    conn.commit()
+            finally:
+                conn.close()
+            diferencias = 0
+            for id_orden in list(self._vigentes):
+                if id_orden not in en_base:
+                    self._quitar(id_orden)
+                    diferencias += 1
+            for id_orden, clave in en_base.items():
+                actual = self._vigentes.get(id_orden)
+                if actual is None or actual[0] != clave:
+                    self._poner(id_orden, clave)
+                    diferencias += 1
+            self._reconstruir_si_hace_falta()
+            self.verificaciones += 1
+            self.correcciones += diferencias
+            self.ultima_verificacion = time.time()
+            return diferencias
+
+    # --- consultas ---
+
+    def siguientes(self, cantidad):
+        """Las `cantidad` órdenes que siguen a pagar: [(id_orden, urgente, vencimiento)]."""
+        self.sincronizar()
+        with self._lock:
+            entradas = self._primeras(self._prioridad, cantidad)
+        return [(id_orden, -menos_urgente, vencimiento) for menos_urgente, vencimiento, id_orden, _, _ in entradas]
+
+    def por_vencer(self, dias, hoy=None, cantidad=MAXIMO):
+        """Órdenes que vencen hasta `dias` días después de hoy (y las ya vencidas),
+        de la que vence antes a la que vence después."""
+        hoy = hoy or datetime.date.today()
+        limite = (hoy + datetime.timedelta(days=dias)).isoformat()
+        self.sincronizar()
+        with self._lock:
+            entradas = self._primeras(self._vencimiento, cantidad, hasta=limite)
+        return [(id_orden, -menos_urgente, vencimiento) for vencimiento, menos_urgente, id_orden, _, _ in entradas]
+
+    # --- hilo de verificación ---
+
+    def iniciar(self):
+        if self.verificar_cada <= 0:
+            return
+        if self._pid == os.getpid() and self._hilo.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._hilo.is_alive():
+                return
+            self._pid = os.getpid()
+            self._hilo = threading.Thread(target=self._ciclo, name='verificador-planificador', daemon=True)
+            self._hilo.start()
+
+    def _ciclo(self):
+        while True:
+            time.sleep(self.verificar_cada)
+            try:
+                diferencias = self.verificar()
+                if diferencias:
+                    print(f"Planificador: {diferencias} órdenes corregidas al compararlas con la base")
+            except Exception as e:
+                print(f"Error al verificar la cola de pagos: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "ordenes": len(self._vigentes),
+                "sin_fecha_valida": sum(1 for clave, _ in self._vigentes.values() if clave[1] == SIN_FECHA),
+                "entradas_prioridad": len(self._prioridad),
+                "entradas_vencimiento": len(self._vencimiento),
+                "seq": self._seq,
+                "cargas": self.cargas,
+                "eventos_aplicados": self.eventos,
+                "reconstrucciones": self.reconstrucciones,
+                "verificaciones": self.verificaciones,
+                "correcciones": self.correcciones,
+                "ultima_verificacion": self.ultima_verificacion,
+            }
+
+
+planificador = Planificador()
+
+
+def ordenes(conn, ids, campos=None, extra=None):
+    """Las órdenes de `ids` como las devuelve /api/ordenes/enviadas, en ese orden.
+
+    `extra` ({id_orden: {campo: valor}}) agrega campos calculados a cada una.
+    """
+    cursor = consultar(conn, ORDEN + " WHERE o.id_orden IN (SELECT value FROM json_each(?))", (json.dumps(ids),))
+    proyeccion = Proyeccion(cursor, campos)
+    filas = cursor.fetchall()
+    indice = proyeccion.indice('id_orden')
+    por_id = dict(zip((fila[indice] for fila in filas), proyeccion.filas(filas)))
+    for id_orden, campos_extra in (extra or {}).items():
+        if id_orden in por_id:
+            por_id[id_orden].update(campos_extra)
+    # Una orden pudo salir de la tabla (archivo, borrado) después de la consulta a la cola
+    return [por_id[id_orden] for id_orden in ids if id_orden in por_id]
@@ -0,0 +1,358 @@
+# backend/replicas.py
+# Copias de solo lectura de pagos.db para los reportes y el historial.
+#
+# Las escrituras, y las lecturas que necesitan ver lo último (las órdenes del
+# coordinador, la bandeja del analista), van a la base principal. Los
+# reportes, el historial y la bitácora pueden leer una copia. Así sus
+# recorridos largos no compiten con los coordinadores que crean órdenes, ni
+# frenan el checkpoint del WAL de la principal (un lector largo impide
+# reciclarlo y el WAL crece).
+#
+# - Las copias se hacen con la API de backup de SQLite. La copia sale de una
+#   sola transacción de lectura, así que es consistente. Se guardan en
+#   REPLICAS_DIR/replica-N-GEN.db y se publican en replicas.json.
+# - Una copia publicada no se modifica nunca, así que se abre con immutable=1
+#   (sin bloqueos). La siguiente generación es otro archivo; cada worker
+#   cambia de pool cuando ve el manifiesto nuevo.
+# - Un hilo por worker revisa cada REPLICAS_INTERVALO segundos si la
+#   principal cambió, por el tamaño y la fecha de pagos.db y de su WAL (la
+#   posición del WAL y de los checkpoints). Solo copia si hubo cambios. Un
+#   lock de archivo evita que dos procesos copien a la vez. También se puede
+#   refrescar a mano o desde cron:
+#       flask replicas refrescar
+# - Cada endpoint tiene un atraso máximo en segundos (CONSISTENCIA). Se ajusta
+#   con REPLICAS_CONSISTENCIA="get_bitacora=0,get_historial_ordenes=30".
+#   0 es consistencia estricta: siempre la principal. Si la copia está más
+#   atrasada que el máximo del endpoint, también se lee de la principal.
+# - Las respuestas de esos endpoints llevan:
+#   - X-Datos-Origen: primaria o replica;
+#   - X-Datos-Antiguedad: cuántos segundos puede estar atrasada la copia;
+#   - X-Datos-Antiguedad-Maxima: el máximo del endpoint;
+#   - X-Consistencia: estricta o puede_atrasarse.
+#
+# REPLICAS=0 (por defecto) no hace copias: todo se lee de la principal.
+import glob
+import itertools
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import click
+from flask import g, request
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin lock entre procesos
+    fcntl = None
+
+import db
+
+CANTIDAD = int(os.environ.get('REPLICAS', '0'))
+DIRECTORIO = os.environ.get('REPLICAS_DIR', os.path.join(os.path.dirname(db.DATABASE_PATH), 'replicas'))
+INTERVALO = float(os.environ.get('REPLICAS_INTERVALO', '30'))
+POOL_SIZE = int(os.environ.get('REPLICAS_POOL_SIZE', str(db.POOL_SIZE)))
+MANIFIESTO = os.path.join(DIRECTORIO, 'replicas.json')
+
+ENCABEZADOS = ('X-Datos-Origen', 'X-Datos-Antiguedad', 'X-Datos-Antiguedad-Maxima', 'X-Consistencia')
+
+_ARCHIVO_REPLICA = re.compile(r'^replica-\d+-(\d+)\.db$')
+
+
+def _consistencia(valor, por_defecto):
+    """Atraso máximo por endpoint, con los cambios de REPLICAS_CONSISTENCIA."""
+    resultado = dict(por_defecto)
+    for parte in valor.split(','):
+        if '=' in parte:
+            endpoint, segundos = parte.split('=', 1)
+            resultado[endpoint.strip()] = float(segundos)
+    return resultado
+
+
+# Endpoint -> segundos de atraso aceptados; los que no están leen de la principal
+CONSISTENCIA = _consistencia(os.environ.get('REPLICAS_CONSISTENCIA', ''), {
+    'get_report_summary': 300,
+    'get_reporte_totales': 300,
+    'get_historial_ordenes': 60,
+    'get_bitacora': 60,
+})
+
+
+def huella(ruta=None):
+    """Tamaño y fecha de la base y de su WAL: cambian con cada commit y cada checkpoint."""
+    ruta = ruta or db.DATABASE_PATH
+    partes = []
+    for archivo in (ruta, ruta + '-wal'):
+        try:
+            st = os.stat(archivo)
+            partes += [st.st_size, st.st_mtime_ns]
+        except FileNotFoundError:
+            partes += [0, 0]
+    return partes
+
+
+def leer_manifiesto():
+    try:
+        with open(MANIFIESTO, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _escribir_manifiesto(datos):
+    tmp = f"{MANIFIESTO}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(datos, f)
+    os.replace(tmp, MANIFIESTO)
+
+
+@contextmanager
+def _bloqueo():
+    """Lock de archivo entre procesos. Entrega False si otro proceso lo tiene."""
+    if fcntl is None:
+        yield True
+        return
+    with open(os.path.join(DIRECTORIO, 'replicas.lock'), 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _copiar(origen, ruta):
+    """Backup de la conexión `origen` en `ruta`, que aparece completa o no aparece."""
+    tmp = ruta + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    destino = sqlite3.connect(tmp)
+    try:
+        origen.backup(destino)
+        # La copia se abre en solo lectura: sin WAL no necesita -wal ni -shm
+        destino.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        destino.close()
+    os.replace(tmp, ruta)
+
+
+def _borrar_viejas(generacion):
+    # Se conserva la generación anterior: puede haber lecturas en curso sobre
+    # ella en workers que todavía no vieron el manifiesto nuevo
+    for ruta in glob.glob(os.path.join(DIRECTORIO, 'replica-*.db')):
+        coincide = _ARCHIVO_REPLICA.match(os.path.basename(ruta))
+        if coincide and int(coincide.group(1)) < generacion - 1:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass  # abierta en Windows; se intenta en el próximo refresco
+
+
+def refrescar(cantidad=CANTIDAD, forzar=False):
+    """Copia la base principal si cambió desde la última copia.
+
+    Devuelve 'copiada', 'sin_cambios' u 'ocupado' (otro proceso está copiando).
+    """
+    os.makedirs(DIRECTORIO, exist_ok=True)
+    with _bloqueo() as obtenido:
+        if not obtenido:
+            return 'ocupado'
+        manifiesto = leer_manifiesto()
+        # El momento y la huella se toman antes de copiar: si hay un commit
+        # durante la copia, la próxima revisión vuelve a copiar
+        inicio = time.time()
+        actual = huella()
+        if (manifiesto and not forzar and manifiesto['huella'] == actual
+                and len(manifiesto['archivos']) == cantidad):
+            manifiesto['verificada'] = inicio
+            _escribir_manifiesto(manifiesto)
+            return 'sin_cambios'
+
+        generacion = manifiesto['generacion'] + 1 if manifiesto else 1
+        archivos = [f"replica-{i}-{generacion}.db" for i in range(cantidad)]
+        rutas = [os.path.join(DIRECTORIO, nombre) for nombre in archivos]
+        origen = sqlite3.connect(db.DATABASE_PATH)
+        try:
+            _copiar(origen, rutas[0])
+        finally:
+            origen.close()
+        for ruta in rutas[1:]:
+            # Las demás se copian de la primera, que ya no cambia
+            shutil.copyfile(rutas[0], ruta + '.tmp')
+            os.replace(ruta + '.tmp', ruta)
+        _escribir_manifiesto({
+            "generacion": generacion,
+            "archivos": archivos,
+            "copiada": inicio,
+            "verificada": inicio,
+            "segundos_copia": round(time.time() - inicio, 3),
+            "huella": actual,
+        })
+        _borrar_viejas(generacion)
+        return 'copiada'
+
+
+class Enrutador:
+    """Elige de dónde lee cada request y mantiene los pools de la generación vigente."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._firma = None
+        self._manifiesto = None
+        self._pools = []
+        self._turno = itertools.count()
+        self.lecturas = Counter()
+
+    def _actualizar(self):
+        """Relee el manifiesto si cambió (un stat por request)."""
+        try:
+            st = os.stat(MANIFIESTO)
+            firma = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            firma = None
+        if firma == self._firma:
+            return
+        with self._lock:
+            if firma == self._firma:
+                return
+            manifiesto = leer_manifiesto()
+            anterior = self._manifiesto
+            if manifiesto and (anterior is None or manifiesto['generacion'] != anterior['generacion']):
+                viejos = self._pools
+                self._pools = [db.ConnectionPool(os.path.join(DIRECTORIO, nombre), size=POOL_SIZE, inmutable=True)
+                               for nombre in manifiesto['archivos']]
+                for pool in viejos:
+                    pool.cerrar()
+            self._manifiesto = manifiesto
+            self._firma = firma
+
+    def antiguedad(self):
+        """Segundos desde la última vez que la copia coincidía con la principal."""
+        if not self._manifiesto:
+            return None
+        return max(0.0, time.time() - self._manifiesto['verificada'])
+
+    def conexion(self, max_atraso):
+        """(conexión, origen, antigüedad) para una lectura que acepta `max_atraso` segundos."""
+        if CANTIDAD > 0 and max_atraso > 0:
+            self._actualizar()
+            pools = self._pools
+            antiguedad = self.antiguedad()
+            if pools and antiguedad is not None and antiguedad <= max_atraso:
+                pool = pools[next(self._turno) % len(pools)]
+                try:
+                    conn = pool.acquire()
+                    self.lecturas['replica'] += 1
+                    return conn, 'replica', antiguedad
+                except sqlite3.OperationalError as e:
+                    print(f"No se pudo leer la réplica {pool.database_path}: {e}")
+        self.lecturas['primaria'] += 1
+        return db.pool.acquire(), 'primaria', 0.0
+
+    def stats(self):
+        self._actualizar()
+        manifiesto = self._manifiesto or {}
+        antiguedad = self.antiguedad()
+        return {
+            "replicas": CANTIDAD,
+            "generacion": manifiesto.get('generacion'),
+            "antiguedad_s": None if antiguedad is None else round(antiguedad, 1),
+            "segundos_ultima_copia": manifiesto.get('segundos_copia'),
+            "lecturas": dict(self.lecturas),
+            "consistencia": CONSISTENCIA,
+            "pools": [pool.stats() for pool in self._pools],
+        }
+
+
+class Refrescador:
+    """Hilo por worker que refresca las copias cada `intervalo` segundos."""
+
+    def __init__(self, intervalo=INTERVALO):
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._pid = None
+        self._hilo = None
+
+    def iniciar(self):
+        if CANTIDAD <= 0 or self.intervalo <= 0:
+            return
+        if self._pid == os.getpid() and self._hilo.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._hilo.is_alive():
+                return
+            self._pid = os.getpid()
+            self._hilo = threading.Thread(target=self._ciclo, name='refrescador-replicas', daemon=True)
+            self._hilo.start()
+
+    def _ciclo(self):
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                refrescar()
+            except Exception as e:
+                print(f"Error al refrescar las réplicas: {e}")
+
+
+enrutador = Enrutador()
+refrescador = Refrescador()
+
+
+def conexion_lectura():
+    """Conexión para el endpoint del request: una réplica si su consistencia lo permite."""
+    limite = CONSISTENCIA.get(request.endpoint, 0)
+    conn, origen, antiguedad = enrutador.conexion(limite)
+    g.lectura_replica = (origen, antiguedad, limite)
+    return db.registrar_en_request(conn)
+
+
+def _agregar_encabezados(response):
+    lectura = g.pop('lectura_replica', None)
+    if lectura:
+        origen, antiguedad, limite = lectura
+        response.headers['X-Datos-Origen'] = origen
+        response.headers['X-Datos-Antiguedad'] = f"{antiguedad:.1f}"
+        response.headers['X-Datos-Antiguedad-Maxima'] = f"{limite:g}"
+        response.headers['X-Consistencia'] = 'puede_atrasarse' if limite > 0 else 'estricta'
+    return response
+
+
+def init_app(app):
+    app.after_request(_agregar_encabezados)
+
+
+@click.group('replicas')
+def cli():
+    """Copias de solo lectura para reportes e historial."""
+
+
+@cli.command('refrescar')
+@click.option('--forzar', is_flag=True, help="Copiar aunque la base no haya cambiado")
+@click.option('--cantidad', type=int, default=max(CANTIDAD, 1), show_default=True)
+def refrescar_command(forzar, cantidad):
+    resultado = refrescar(cantidad, forzar)
+    manifiesto = leer_manifiesto() or {}
+    click.echo(f"{resultado}: generación {manifiesto.get('generacion')}, "
+               f"{len(manifiesto.get('archivos', []))} copias en {DIRECTORIO}")
+
+
+@cli.command('estado')
+def estado_command():
+    manifiesto = leer_manifiesto()
+    if not manifiesto:
+        click.echo("No hay copias.")
+        return
+    click.echo(f"Generación {manifiesto['generacion']}: {', '.join(manifiesto['archivos'])}")
+    click.echo(f"Copiada hace {time.time() - manifiesto['copiada']:.0f} s "
+               f"(tardó {manifiesto['segundos_copia']} s), "
+               f"verificada hace {time.time() - manifiesto['verificada']:.0f} s")
+    click.echo("Sin cambios desde la copia." if manifiesto['huella'] == huella()
+               else "La base cambió desde la última copia.")
@@ -0,0 +1,609 @@
+# backend/respaldos.py
+# Respaldos en caliente de pagos.db, incrementales, con restauración a un
+# momento dado.
+#
+# Copiar el archivo mientras Gunicorn escribe no sirve (puede quedar a medio
+# commit, y lo reciente está en el WAL), y parar la aplicación para copiar
+# varios GB tarda demasiado. Acá cada respaldo es una captura consistente:
+#
+# - La captura usa la API de backup de SQLite de a RESPALDOS_PAGINAS páginas,
+#   con una pausa de RESPALDOS_PAUSA_MS entre pasos, para no acaparar el
+#   disco. La conexión de origen mantiene abierta una transacción de lectura
+#   durante toda la copia: con WAL eso no frena a los que escriben, y la API
+#   no tiene que reiniciar la copia cada vez que alguien hace commit (sin
+#   ella, con escrituras continuas no termina nunca). La captura refleja la
+#   base en el momento en que empezó.
+# - La copia se verifica con PRAGMA integrity_check antes de guardarse.
+# - Cada RESPALDOS_BASE_CADA capturas se guarda una base completa
+#   (NNNNNN-base.db, que se puede abrir con sqlite3 directamente). Las demás
+#   son incrementales (NNNNNN-inc.pag): solo las páginas que cambiaron desde
+#   la captura anterior, comparando un hash de cada página, comprimidas.
+# - Restaurar es copiar la base y escribir encima las páginas de cada
+#   incremental hasta la captura pedida, sin reejecutar SQL. El resultado
+#   se compara con el hash de la imagen guardado al capturar y se verifica
+#   con integrity_check.
+# - Las particiones mensuales de archivo.py (archivo/pagos-AAAA-MM.db) son
+#   archivos aparte: cada captura guarda, con la API de backup, una copia de
+#   las que cambiaron desde la anterior y reusa la copia ya guardada de las
+#   demás. Mientras se captura se tiene el lock de archivo.bloqueo(), así
+#   ninguna se mueve entre la copia de la base principal y la de las
+#   particiones. Al restaurar se reponen junto con la base principal, para
+#   que archivo_particiones y los archivos coincidan y ninguna orden quede a
+#   la vez en la base y en el archivo. Se copian antes al lado de las
+#   actuales y se cambian recién cuando la base principal quedó restaurada.
+# - respaldos.json lista las capturas. Se conservan las últimas
+#   RESPALDOS_CONSERVAR cadenas (una base y sus incrementales); los archivos
+#   de las demás se borran después de escribir el manifiesto.
+# - Por defecto se guardan en respaldos/ junto a la base (el volumen
+#   ./database de docker-compose o el disco de Render); para que sobrevivan
+#   a la pérdida de ese disco, RESPALDOS_DIR debería apuntar a otro.
+#
+# Uso (por ejemplo desde cron; un lock de archivo evita dos a la vez):
+#   flask respaldos crear [--completo]
+#   flask respaldos listar
+#   flask respaldos verificar [--numero N]
+#   flask respaldos restaurar --hasta "2025-03-01 18:00" --destino /tmp/pagos.db
+#   flask respaldos restaurar --en-linea      (sobre la base en uso)
+#
+# La restauración en línea escribe la captura en la base en uso con la API de
+# backup, así que los requests ven la base restaurada sin reiniciar. Las
+# cachés de cada worker (catálogos, usuarios, cola de pagos) se rearman solas
+# al ver versiones distintas, pero conviene recargar los workers con
+# `kill -HUP <master>`.
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+
+import click
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin lock entre procesos
+    fcntl = None
+
+import archivo
+import db
+
+DIRECTORIO = os.environ.get('RESPALDOS_DIR', os.path.join(os.path.dirname(db.DATABASE_PATH), 'respaldos'))
+PAGINAS_POR_PASO = int(os.environ.get('RESPALDOS_PAGINAS', '1024'))
+PAUSA = float(os.environ.get('RESPALDOS_PAUSA_MS', '5')) / 1000
+BASE_CADA = int(os.environ.get('RESPALDOS_BASE_CADA', '24'))
+CONSERVAR = int(os.environ.get('RESPALDOS_CONSERVAR', '2'))
+MANIFIESTO = os.path.join(DIRECTORIO, 'respaldos.json')
+HASHES = os.path.join(DIRECTORIO, 'paginas.hash')
+# Copias de las particiones de archivo, relativas a DIRECTORIO
+PARTICIONES = 'archivo'
+
+MAGICO = b'PAGOSINC1'
+# Encabezado de un incremental: tamaño de página y páginas de la imagen
+ENCABEZADO = struct.Struct('>II')
+REGISTRO = struct.Struct('>I')
+LARGO_HASH = 16
+
+
+class RespaldoInvalido(Exception):
+    pass
+
+
+def leer_manifiesto():
+    try:
+        with open(MANIFIESTO) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"capturas": []}
+
+
+def _escribir_manifiesto(manifiesto):
+    tmp = MANIFIESTO + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifiesto, f, indent=1)
+    os.replace(tmp, MANIFIESTO)
+
+
+@contextmanager
+def _bloqueo():
+    """Lock de archivo entre procesos. Entrega False si otro proceso lo tiene."""
+    if fcntl is None:
+        yield True
+        return
+    with open(os.path.join(DIRECTORIO, 'respaldos.lock'), 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def capturar(ruta, origen_path=None, paginas=PAGINAS_POR_PASO, pausa=PAUSA, al_avanzar=None):
+    """Copia consistente de la base en `ruta`, de a `paginas` por paso.
+
+    Devuelve (momento de la captura, pasos). `al_avanzar(restantes, total)`
+    se llama después de cada paso.
+    """
+    if os.path.exists(ruta):
+        os.remove(ruta)
+    origen = sqlite3.connect(origen_path or db.DATABASE_PATH, timeout=30)
+    destino = sqlite3.connect(ruta)
+    pasos = 0
+    try:
+        # La transacción de lectura fija la versión de la base que se copia
+        origen.execute("BEGIN")
+        origen.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        momento = time.time()
+
+        def progreso(status, restantes, total):
+            nonlocal pasos
+            pasos += 1
+            if al_avanzar is not None:
+                al_avanzar(restantes, total)
+            if restantes and pausa > 0:
+                time.sleep(pausa)
+
+        origen.backup(destino, pages=paginas, progress=progreso)
+        origen.commit()
+        # Sin WAL la captura es un solo archivo
+        destino.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        destino.close()
+        origen.close()
+    return momento, pasos
+
+
+def verificar_integridad(ruta):
+    conn = sqlite3.connect(f"file:{ruta}?mode=ro", uri=True)
+    try:
+        resultado = [fila[0] for fila in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+    if resultado != ['ok']:
+        raise RespaldoInvalido(f"integrity_check de {os.path.basename(ruta)}: {'; '.join(resultado[:5])}")
+
+
+def _tamano_pagina(ruta):
+    with open(ruta, 'rb') as f:
+        encabezado = f.read(100)
+    tamano = struct.unpack('>H', encabezado[16:18])[0]
+    return 65536 if tamano == 1 else tamano
+
+
+def _paginas(ruta, tamano):
+    with open(ruta, 'rb') as f:
+        while True:
+            pagina = f.read(tamano)
+            if not pagina:
+                return
+            yield pagina
+
+
+def _leer_hashes(numero, tamano):
+    """Hashes de las páginas de la captura `numero`, o None si no son de esa
+    captura (por ejemplo, si el proceso se cortó antes de actualizar el manifiesto)."""
+    try:
+        with open(HASHES, 'rb') as f:
+            datos = f.read()
+    except FileNotFoundError:
+        return None
+    if len(datos) < ENCABEZADO.size or ENCABEZADO.unpack_from(datos) != (numero, tamano):
+        return None
+    cuerpo = datos[ENCABEZADO.size:]
+    return [cuerpo[i:i + LARGO_HASH] for i in range(0, len(cuerpo), LARGO_HASH)]
+
+
+def _escribir_hashes(numero, tamano, hashes):
+    tmp = HASHES + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(ENCABEZADO.pack(numero, tamano))
+        f.write(b''.join(hashes))
+    os.replace(tmp, HASHES)
+
+
+def _escribir_incremental(ruta, captura, tamano, anteriores):
+    """Escribe en `ruta` las páginas de `captura` que cambiaron respecto de
+    `anteriores`. Devuelve (hashes de la captura, sha256 de la imagen, páginas escritas)."""
+    hashes = []
+    imagen = hashlib.sha256()
+    cambiadas = 0
+    compresor = zlib.compressobj(1)
+    with open(ruta + '.tmp', 'wb') as salida:
+        salida.write(MAGICO)
+        total = os.path.getsize(captura) // tamano
+        salida.write(ENCABEZADO.pack(tamano, total))
+        for numero, pagina in enumerate(_paginas(captura, tamano), start=1):
+            imagen.update(pagina)
+            resumen = hashlib.blake2b(pagina, digest_size=LARGO_HASH).digest()
+            hashes.append(resumen)
+            if numero > len(anteriores) or anteriores[numero - 1] != resumen:
+                salida.write(compresor.compress(REGISTRO.pack(numero) + pagina))
+                cambiadas += 1
+        salida.write(compresor.flush())
+    os.replace(ruta + '.tmp', ruta)
+    return hashes, imagen.hexdigest(), cambiadas
+
+
+def _resumir_base(captura, tamano):
+    hashes = []
+    imagen = hashlib.sha256()
+    for pagina in _paginas(captura, tamano):
+        imagen.update(pagina)
+        hashes.append(hashlib.blake2b(pagina, digest_size=LARGO_HASH).digest())
+    return hashes, imagen.hexdigest()
+
+
+def _aplicar_incremental(ruta_incremental, imagen):
+    """Escribe las páginas del incremental sobre el archivo abierto `imagen`."""
+    with open(ruta_incremental, 'rb') as f:
+        if f.read(len(MAGICO)) != MAGICO:
+            raise RespaldoInvalido(f"{os.path.basename(ruta_incremental)} no es un incremental")
+        tamano, total = ENCABEZADO.unpack(f.read(ENCABEZADO.size))
+        descompresor = zlib.decompressobj()
+        pendiente = b''
+        largo = REGISTRO.size + tamano
+        while True:
+            bloque = f.read(1 << 20)
+            pendiente += descompresor.decompress(bloque) if bloque else descompresor.flush()
+            vista = memoryview(pendiente)
+            posicion = 0
+            while len(pendiente) - posicion >= largo:
+                numero, = REGISTRO.unpack_from(vista, posicion)
+                imagen.seek((numero - 1) * tamano)
+                imagen.write(vista[posicion + REGISTRO.size:posicion + largo])
+                posicion += largo
+            vista.release()
+            pendiente = pendiente[posicion:]
+            if not bloque:
+                break
+    imagen.truncate(total * tamano)
+
+
+def _sha256(ruta):
+    resumen = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            resumen.update(bloque)
+    return resumen.hexdigest()
+
+
+def _capturar_particiones(imagen, anteriores, numero):
+    """Copia las particiones que lista la captura `imagen` y cambiaron desde la
+    captura anterior (`anteriores`: {mes: entrada}). Devuelve ({mes: entrada},
+    particiones copiadas). Se llama con archivo.bloqueo() tomado."""
+    conn = sqlite3.connect(f"file:{imagen}?mode=ro", uri=True)
+    try:
+        meses = [fila[0] for fila in conn.execute("SELECT mes FROM archivo_particiones ORDER BY mes")]
+    finally:
+        conn.close()
+    os.makedirs(os.path.join(DIRECTORIO, PARTICIONES), exist_ok=True)
+    particiones, copiadas = {}, 0
+    for mes in meses:
+        ruta = archivo.ruta_particion(mes)
+        if not os.path.exists(ruta):
+            print(f"Falta el archivo de la partición {mes}: {ruta}")
+            continue
+        estado = os.stat(ruta)
+        huella = [estado.st_size, estado.st_mtime_ns]
+        previa = anteriores.get(mes)
+        if previa and previa['huella'] == huella and os.path.exists(os.path.join(DIRECTORIO, previa['archivo'])):
+            particiones[mes] = previa
+            continue
+        nombre = os.path.join(PARTICIONES, f"{numero:06d}-pagos-{mes}.db")
+        copia = os.path.join(DIRECTORIO, nombre)
+        capturar(copia + '.tmp', origen_path=ruta)
+        verificar_integridad(copia + '.tmp')
+        os.replace(copia + '.tmp', copia)
+        particiones[mes] = {"archivo": nombre, "huella": huella, "sha256": _sha256(copia),
+                            "bytes": os.path.getsize(copia)}
+        copiadas += 1
+    return particiones, copiadas
+
+
+def _verificar_particiones(captura):
+    for mes, particion in captura.get('particiones', {}).items():
+        ruta = os.path.join(DIRECTORIO, particion['archivo'])
+        if not os.path.exists(ruta) or _sha256(ruta) != particion['sha256']:
+            raise RespaldoInvalido(f"La copia de la partición {mes} de la captura {captura['numero']} no coincide")
+        verificar_integridad(ruta)
+
+
+def _preparar_particiones(captura, directorio):
+    """Copia las particiones de la captura junto a su destino en `directorio`,
+    como .tmp, sin tocar las que están en uso. Devuelve las rutas de destino."""
+    os.makedirs(directorio, exist_ok=True)
+    preparadas = []
+    try:
+        for mes, particion in captura.get('particiones', {}).items():
+            ruta = archivo.ruta_particion(mes, directorio)
+            shutil.copyfile(os.path.join(DIRECTORIO, particion['archivo']), ruta + '.tmp')
+            preparadas.append(ruta)
+    except BaseException:
+        _descartar_particiones(preparadas)
+        raise
+    return preparadas
+
+
+def _descartar_particiones(preparadas):
+    for ruta in preparadas:
+        if os.path.exists(ruta + '.tmp'):
+            os.remove(ruta + '.tmp')
+
+
+def _reemplazar_particiones(captura, directorio, preparadas):
+    """Pone en su lugar las copias de _preparar_particiones. Las particiones
+    que no estaban al capturar (archivadas después) se renombran a
+    .posterior, no se borran. Devuelve sus meses."""
+    for ruta in preparadas:
+        for sufijo in ('-journal', '-wal', '-shm'):
+            if os.path.exists(ruta + sufijo):
+                os.remove(ruta + sufijo)
+        os.replace(ruta + '.tmp', ruta)
+    particiones = captura.get('particiones', {})
+    apartadas = []
+    for nombre in sorted(os.listdir(directorio)):
+        mes = nombre[len('pagos-'):-len('.db')]
+        if nombre.startswith('pagos-') and nombre.endswith('.db') and mes not in particiones:
+            ruta = os.path.join(directorio, nombre)
+            os.replace(ruta, ruta + '.posterior')
+            apartadas.append(mes)
+    return apartadas
+
+
+def _podar(manifiesto):
+    """Deja en el manifiesto las últimas CONSERVAR cadenas. Devuelve los
+    archivos que quedan sin usar; se borran después de escribir el manifiesto,
+    para que nunca liste uno que ya no existe."""
+    bases = [c['numero'] for c in manifiesto['capturas'] if c['tipo'] == 'base']
+    if len(bases) <= CONSERVAR:
+        return []
+    primera = bases[-CONSERVAR]
+    sobrantes = [c['archivo'] for c in manifiesto['capturas'] if c['numero'] < primera]
+    manifiesto['capturas'] = [c for c in manifiesto['capturas'] if c['numero'] >= primera]
+    usadas = {p['archivo'] for c in manifiesto['capturas'] for p in c.get('particiones', {}).values()}
+    directorio = os.path.join(DIRECTORIO, PARTICIONES)
+    for nombre in os.listdir(directorio) if os.path.isdir(directorio) else ():
+        if os.path.join(PARTICIONES, nombre) not in usadas:
+            sobrantes.append(os.path.join(PARTICIONES, nombre))
+    return sobrantes
+
+
+def crear(completo=False, al_avanzar=None):
+    """Toma una captura (base o incremental). Devuelve su entrada del
+    manifiesto, o None si otro proceso está respaldando."""
+    os.makedirs(DIRECTORIO, exist_ok=True)
+    with _bloqueo() as obtenido:
+        if not obtenido:
+            return None
+        inicio = time.time()
+        manifiesto = leer_manifiesto()
+        capturas = manifiesto['capturas']
+        numero = capturas[-1]['numero'] + 1 if capturas else 1
+        temporal = os.path.join(DIRECTORIO, 'captura.tmp')
+        try:
+            with archivo.bloqueo():
+                momento, pasos = capturar(temporal, al_avanzar=al_avanzar)
+                segundos_copia = time.time() - inicio
+                particiones, copiadas = _capturar_particiones(
+                    temporal, capturas[-1].get('particiones', {}) if capturas else {}, numero)
+            verificar_integridad(temporal)
+            tamano = _tamano_pagina(temporal)
+
+            anteriores = _leer_hashes(capturas[-1]['numero'], tamano) if capturas else None
+            desde_base = next((i for i, c in enumerate(reversed(capturas)) if c['tipo'] == 'base'), None)
+            if completo or anteriores is None or desde_base is None or desde_base + 1 >= BASE_CADA:
+                tipo, nombre = 'base', f"{numero:06d}-base.db"
+                hashes, imagen = _resumir_base(temporal, tamano)
+                os.replace(temporal, os.path.join(DIRECTORIO, nombre))
+                cambiadas = len(hashes)
+            else:
+                tipo, nombre = 'incremental', f"{numero:06d}-inc.pag"
+                hashes, imagen, cambiadas = _escribir_incremental(
+                    os.path.join(DIRECTORIO, nombre), temporal, tamano, anteriores)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+        entrada = {
+            "numero": numero,
+            "tipo": tipo,
+            "archivo": nombre,
+            "momento": momento,
+            "fecha": datetime.fromtimestamp(momento).isoformat(timespec='seconds'),
+            "tamano_pagina": tamano,
+            "paginas": len(hashes),
+            "paginas_guardadas": cambiadas,
+            "bytes": os.path.getsize(os.path.join(DIRECTORIO, nombre)),
+            "sha256": imagen,
+            "particiones": particiones,
+            "particiones_copiadas": copiadas,
+            "pasos": pasos,
+            "segundos_copia": round(segundos_copia, 3),
+            "segundos": round(time.time() - inicio, 3),
+            "verificado": "ok",
+        }
+        _escribir_hashes(numero, tamano, hashes)
+        capturas.append(entrada)
+        sobrantes = _podar(manifiesto)
+        _escribir_manifiesto(manifiesto)
+        for nombre in sobrantes:
+            try:
+                os.remove(os.path.join(DIRECTORIO, nombre))
+            except FileNotFoundError:
+                pass
+        return entrada
+
+
+def elegir(hasta=None, numero=None):
+    """La cadena (base e incrementales) hasta la captura pedida: la de `numero`,
+    la última anterior o igual a `hasta` (timestamp), o la más reciente."""
+    capturas = leer_manifiesto()['capturas']
+    if numero is not None:
+        elegidas = [c for c in capturas if c['numero'] <= numero]
+        if not elegidas or elegidas[-1]['numero'] != numero:
+            raise RespaldoInvalido(f"No existe la captura {numero}")
+    else:
+        elegidas = [c for c in capturas if hasta is None or c['momento'] <= hasta]
+    if not elegidas:
+        raise RespaldoInvalido("No hay capturas anteriores a ese momento")
+    base = max(i for i, c in enumerate(elegidas) if c['tipo'] == 'base')
+    return elegidas[base:]
+
+
+def reconstruir(cadena, ruta):
+    """Arma en `ruta` la imagen de la última captura de la cadena y la verifica."""
+    objetivo = cadena[-1]
+    shutil.copyfile(os.path.join(DIRECTORIO, cadena[0]['archivo']), ruta)
+    with open(ruta, 'r+b') as imagen:
+        for captura in cadena[1:]:
+            _aplicar_incremental(os.path.join(DIRECTORIO, captura['archivo']), imagen)
+    resumen = hashlib.sha256()
+    for pagina in _paginas(ruta, objetivo['tamano_pagina']):
+        resumen.update(pagina)
+    if resumen.hexdigest() != objetivo['sha256']:
+        raise RespaldoInvalido(f"La imagen reconstruida de la captura {objetivo['numero']} no coincide")
+    verificar_integridad(ruta)
+    _verificar_particiones(objetivo)
+    return objetivo
+
+
+def restaurar(destino=None, hasta=None, numero=None, en_linea=False):
+    """Restaura la captura elegida en `destino` o, con en_linea, sobre la base en uso.
+
+    Las particiones de archivo van a archivo.DIRECTORIO con en_linea y, si
+    no, a archivo/ junto a `destino`. Devuelve (captura, meses apartados).
+    """
+    cadena = elegir(hasta, numero)
+    if not en_linea:
+        directorio_archivo = os.path.join(os.path.dirname(os.path.abspath(destino)), 'archivo')
+        if directorio_archivo == os.path.abspath(archivo.DIRECTORIO):
+            raise RespaldoInvalido("Las particiones reemplazarían las de la base en uso: "
+                                   "elija un destino en otro directorio")
+    os.makedirs(DIRECTORIO, exist_ok=True)
+    temporal = os.path.join(DIRECTORIO, 'restauracion.tmp')
+    try:
+        objetivo = reconstruir(cadena, temporal)
+        # Las particiones se copian primero al lado de las actuales y se
+        # cambian solo cuando la base principal ya quedó restaurada: si falla
+        # la copia de la base, las particiones en uso siguen intactas
+        if en_linea:
+            # Con el lock, el archivo no mueve meses mientras se reemplaza todo
+            with archivo.bloqueo():
+                preparadas = _preparar_particiones(objetivo, archivo.DIRECTORIO)
+                origen = sqlite3.connect(temporal)
+                viva = sqlite3.connect(db.DATABASE_PATH, timeout=30)
+                try:
+                    origen.backup(viva)
+                    # La imagen tiene journal_mode DELETE; la base en uso sigue en WAL
+                    viva.execute("PRAGMA journal_mode = WAL")
+                except BaseException:
+                    _descartar_particiones(preparadas)
+                    raise
+                finally:
+                    viva.close()
+                    origen.close()
+                apartadas = _reemplazar_particiones(objetivo, archivo.DIRECTORIO, preparadas)
+        else:
+            preparadas = _preparar_particiones(objetivo, directorio_archivo)
+            try:
+                for sufijo in ('-wal', '-shm'):
+                    # Un WAL viejo junto al archivo restaurado lo corrompería
+                    if os.path.exists(destino + sufijo):
+                        os.remove(destino + sufijo)
+                os.replace(temporal, destino)
+            except BaseException:
+                _descartar_particiones(preparadas)
+                raise
+            apartadas = _reemplazar_particiones(objetivo, directorio_archivo, preparadas)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    return objetivo, apartadas
+
+
+def _momento(valor):
+    try:
+        return datetime.fromisoformat(valor).timestamp()
+    except ValueError:
+        raise click.BadParameter("Formato esperado: AAAA-MM-DD[ HH:MM[:SS]]")
+
+
+@click.group('respaldos')
+def cli():
+    """Respaldos en caliente e incrementales de la base."""
+
+
+@cli.command('crear')
+@click.option('--completo', is_flag=True, help="Guardar una base completa aunque toque un incremental")
+def crear_command(completo):
+    entrada = crear(completo)
+    if entrada is None:
+        click.echo("Otro proceso está respaldando.")
+        return
+    mb = entrada['paginas'] * entrada['tamano_pagina'] / 1e6
+    click.echo(f"Captura {entrada['numero']} ({entrada['tipo']}): {entrada['paginas_guardadas']} de "
+               f"{entrada['paginas']} páginas, {entrada['bytes'] / 1e6:.1f} MB en {entrada['archivo']}")
+    if entrada['particiones']:
+        click.echo(f"Particiones de archivo: {len(entrada['particiones'])}, "
+                   f"{entrada['particiones_copiadas']} copiadas por haber cambiado")
+    click.echo(f"Copia de {mb:.1f} MB en {entrada['segundos_copia']} s "
+               f"({mb / max(entrada['segundos_copia'], 0.001):.1f} MB/s, {entrada['pasos']} pasos); "
+               f"total {entrada['segundos']} s")
+
+
+@cli.command('listar')
+def listar_command():
+    capturas = leer_manifiesto()['capturas']
+    if not capturas:
+        click.echo(f"No hay capturas en {DIRECTORIO}.")
+        return
+    for c in capturas:
+        click.echo(f"{c['numero']:>6}  {c['fecha']}  {c['tipo']:<11} {c['paginas_guardadas']:>9} págs "
+                   f"{c['bytes'] / 1e6:>9.1f} MB  {c['archivo']}")
+
+
+@cli.command('verificar')
+@click.option('--numero', type=int, help="Captura a verificar (por defecto, la última)")
+def verificar_command(numero):
+    temporal = os.path.join(DIRECTORIO, 'verificacion.tmp')
+    try:
+        objetivo = reconstruir(elegir(numero=numero), temporal)
+    except RespaldoInvalido as e:
+        raise click.ClickException(str(e))
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    click.echo(f"Captura {objetivo['numero']} ({objetivo['fecha']}): imagen, "
+               f"{len(objetivo.get('particiones', {}))} particiones e integrity_check correctos.")
+
+
+@cli.command('restaurar')
+@click.option('--hasta', help="Última captura hasta este momento (AAAA-MM-DD HH:MM); por defecto, la más reciente")
+@click.option('--numero', type=int, help="Número de captura")
+@click.option('--destino', type=click.Path(dir_okay=False),
+              help="Archivo donde escribir la base restaurada (las particiones van a archivo/ junto a él)")
+@click.option('--en-linea', is_flag=True, help="Restaurar sobre la base en uso, con la aplicación andando")
+def restaurar_command(hasta, numero, destino, en_linea):
+    if bool(destino) == en_linea:
+        raise click.UsageError("Indicar --destino o --en-linea (uno de los dos)")
+    if destino and os.path.abspath(destino) == os.path.abspath(db.DATABASE_PATH):
+        raise click.UsageError("Para restaurar la base en uso, --en-linea")
+    if en_linea:
+        click.confirm(f"Se reemplazará el contenido de {db.DATABASE_PATH}. ¿Continuar?", abort=True)
+    inicio = time.time()
+    try:
+        objetivo, apartadas = restaurar(destino, _momento(hasta) if hasta else None, numero, en_linea)
+    except RespaldoInvalido as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Restaurada la captura {objetivo['numero']} ({objetivo['fecha']}) "
+               f"en {time.time() - inicio:.1f} s en {db.DATABASE_PATH if en_linea else destino}, "
+               f"con {len(objetivo.get('particiones', {}))} particiones de archivo.")
+    if apartadas:
+        click.echo(f"Particiones archivadas después de la captura, renombradas a .posterior: {', '.join(apartadas)}")
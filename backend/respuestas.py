@@ -0,0 +1,96 @@
+# backend/respuestas.py
+# Respuestas JSON armadas directamente desde las tuplas del cursor.
+#
+# Las rutas de listas hacían [dict(row) for row in cursor.fetchall()] y luego
+# jsonify: un sqlite3.Row y un dict por fila, y después el codificador volvía
+# a recorrer todo ordenando las claves. Aquí el cursor devuelve tuplas, los
+# nombres salen de cursor.description y cada fila se arma con zip, solo con
+# las columnas pedidas en ?campos= (o ?fields=). Las claves quedan en el
+# orden del SELECT.
+#
+# El JSON se genera con orjson si está instalado (pip install orjson) o con
+# el codificador en C de la biblioteca estándar. JSON_BACKEND=json obliga a
+# usar la biblioteca estándar.
+import json
+import os
+import time
+from operator import itemgetter
+
+from flask import Response
+
+import metricas
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+USAR_ORJSON = orjson is not None and os.environ.get('JSON_BACKEND', 'auto') != 'json'
+
+_codificador = json.JSONEncoder(separators=(',', ':'), check_circular=False)
+
+
+class CamposInvalidos(ValueError):
+    pass
+
+
+def consultar(conn, sql, params=()):
+    """Ejecuta la consulta con un cursor que devuelve tuplas en vez de sqlite3.Row."""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return cursor.execute(sql, params)
+
+
+def campos_pedidos(args):
+    """Lista de columnas pedidas en ?campos=a,b,c; None si se piden todas."""
+    valor = args.get('campos') or args.get('fields')
+    if not valor:
+        return None
+    return [campo.strip() for campo in valor.split(',') if campo.strip()] or None
+
+
+class Proyeccion:
+    """Convierte las tuplas de un cursor en dicts con las columnas pedidas."""
+
+    def __init__(self, cursor, campos=None):
+        self.columnas = [d[0] for d in cursor.description]
+        if not campos:
+            self.nombres = self.columnas
+            self._tomar = None
+            return
+        campos = list(dict.fromkeys(campos))
+        desconocidos = [c for c in campos if c not in self.columnas]
+        if desconocidos:
+            raise CamposInvalidos(f"Campos desconocidos: {', '.join(desconocidos)}")
+        indices = [self.columnas.index(c) for c in campos]
+        self.nombres = campos
+        if len(indices) == 1:
+            # itemgetter con un solo índice no devuelve tupla
+            indice = indices[0]
+            self._tomar = lambda fila: (fila[indice],)
+        else:
+            self._tomar = itemgetter(*indices)
+
+    def indice(self, columna):
+        return self.columnas.index(columna)
+
+    def filas(self, tuplas):
+        nombres = self.nombres
+        if self._tomar is None:
+            return [dict(zip(nombres, t)) for t in tuplas]
+        tomar = self._tomar
+        return [dict(zip(nombres, tomar(t))) for t in tuplas]
+
+
+def dumps(obj):
+    """Serializa a JSON compacto (bytes UTF-8)."""
+    if USAR_ORJSON:
+        return orjson.dumps(obj)
+    return _codificador.encode(obj).encode('utf-8')
+
+
+def respuesta_json(obj, status=200):
+    inicio = time.perf_counter()
+    cuerpo = dumps(obj)
+    metricas.sumar_serializacion(time.perf_counter() - inicio)
+    return Response(cuerpo, status=status, mimetype='application/json')
@@ -0,0 +1,172 @@
+# backend/resumenes.py
+# Reportes de /api/reportes/summary a partir de las tablas de contadores
+# (resumen_*), que mantienen los triggers de la migración 3.
+#
+# Los contadores cuentan toda la historia, también lo movido al archivo
+# mensual (archivo.py), así que el recálculo suma las particiones.
+#
+# Reconstruir o verificar los contadores:
+#   flask resumenes verificar
+#   flask resumenes reconstruir
+from collections import Counter
+
+import click
+
+import archivo
+from db import get_db_connection
+
+# Consultas completas (las que se usaban antes) para reconstruir y verificar;
+# {esquema} es '' para la base principal o el esquema de un mes archivado
+RECALCULO = {
+    'resumen_coordinador': (
+        "SELECT id_coordinador, COUNT(*) FROM {esquema}ordenes_pago GROUP BY id_coordinador",
+        "INSERT INTO resumen_coordinador (id_coordinador, total) VALUES (?, ?)",
+    ),
+    'resumen_tipo_pago': (
+        "SELECT id_tipo_pago, COUNT(*) FROM {esquema}ordenes_pago GROUP BY id_tipo_pago",
+        "INSERT INTO resumen_tipo_pago (id_tipo_pago, total) VALUES (?, ?)",
+    ),
+    'resumen_estado': (
+        "SELECT estado, COUNT(*) FROM {esquema}ordenes_pago GROUP BY estado",
+        "INSERT INTO resumen_estado (estado, total) VALUES (?, ?)",
+    ),
+    'resumen_usuario_accion': (
+        "SELECT id_usuario_accion, accion, COUNT(*) FROM {esquema}bitacora GROUP BY id_usuario_accion, accion",
+        "INSERT INTO resumen_usuario_accion (id_usuario, accion, total) VALUES (?, ?, ?)",
+    ),
+}
+
+
+def obtener_resumen(conn):
+    """Arma el resumen leyendo solo los contadores (no recorre órdenes ni bitácora)."""
+    # Reporte 1: Pagos generados por cada coordinador
+    pagos_por_coordinador = conn.execute("""
+        SELECT u.nombre || ' ' || u.apellido as coordinador, r.total as total_ordenes
+        FROM resumen_coordinador r
+        JOIN usuarios u ON r.id_coordinador = u.id_usuario
+        WHERE r.total > 0
+    """).fetchall()
+
+    # Reporte 2: Pagos revisados por cada analista (basado en la bitácora)
+    pagos_por_analista = conn.execute("""
+        SELECT u.nombre || ' ' || u.apellido as analista, SUM(r.total) as total_acciones
+        FROM resumen_usuario_accion r
+        JOIN usuarios u ON r.id_usuario = u.id_usuario
+        WHERE r.accion IN ('PAGAR_ORDEN', 'DEVOLVER_ORDEN')
+        GROUP BY r.id_usuario
+        HAVING SUM(r.total) > 0
+    """).fetchall()
+
+    # Reporte 3: Reporte por tipo de pago
+    reporte_tipo_pago = conn.execute("""
+        SELECT tp.nombre_tipo, r.total
+        FROM resumen_tipo_pago r
+        JOIN tipos_pago tp ON r.id_tipo_pago = tp.id_tipo_pago
+        WHERE r.total > 0
+    """).fetchall()
+
+    # Reporte 4: Cantidad total de pagos realizados
+    total_pagos_realizados = conn.execute(
+        "SELECT COALESCE(SUM(total), 0) as total FROM resumen_estado WHERE estado = 'Pagada'"
+    ).fetchone()
+
+    return {
+        "pagos_por_coordinador": [dict(row) for row in pagos_por_coordinador],
+        "pagos_por_analista": [dict(row) for row in pagos_por_analista],
+        "reporte_tipo_pago": [dict(row) for row in reporte_tipo_pago],
+        "total_pagos_realizados": dict(total_pagos_realizados)
+    }
+
+
+def _sumar(conn, consulta, esquema, totales):
+    for fila in conn.execute(consulta.format(esquema=esquema)).fetchall():
+        totales[tuple(fila[:-1])] += fila[-1]
+
+
+def _recalcular_archivo(conn, consulta):
+    """Ejecuta una consulta de RECALCULO en cada mes archivado y suma."""
+    totales = Counter()
+    for mes in archivo.meses_archivados(conn):
+        esquema = archivo.adjuntar(conn, mes)
+        if esquema is None:
+            continue
+        try:
+            _sumar(conn, consulta, esquema + '.', totales)
+        finally:
+            archivo.separar(conn, esquema)
+    return totales
+
+
+def _recalcular(conn, consulta):
+    """Ejecuta una consulta de RECALCULO en la base y en cada mes archivado y suma."""
+    totales = _recalcular_archivo(conn, consulta)
+    _sumar(conn, consulta, '', totales)
+    return totales
+
+
+def reconstruir(conn):
+    """Recalcula todos los contadores desde cero en una sola transacción.
+
+    ATTACH no se puede dentro de una transacción, así que los meses
+    archivados se suman antes, con archivo.bloqueo() tomado para que ninguno
+    se mueva hasta el final. La parte de la base principal se recalcula
+    dentro de la transacción que reemplaza los contadores: una orden creada
+    mientras tanto queda contada por su trigger o por el recálculo, nunca
+    por los dos ni por ninguno.
+    """
+    with archivo.bloqueo():
+        archivados = {tabla: _recalcular_archivo(conn, consulta) for tabla, (consulta, _) in RECALCULO.items()}
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for tabla, (consulta, insercion) in RECALCULO.items():
+                totales = archivados[tabla]
+                _sumar(conn, consulta, '', totales)
+                conn.execute(f"DELETE FROM {tabla}")
+                conn.executemany(insercion, [(*clave, total) for clave, total in totales.items()])
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+def verificar(conn):
+    """Compara los contadores con un recálculo completo.
+
+    Devuelve una lista de (tabla, clave, valor_guardado, valor_real) con las
+    diferencias; vacía si todo cuadra.
+    """
+    diferencias = []
+    for tabla, (consulta, _) in RECALCULO.items():
+        real = _recalcular(conn, consulta)
+        columnas = 'id_usuario, accion, total' if tabla == 'resumen_usuario_accion' else '*'
+        guardado = {tuple(fila[:-1]): fila[-1] for fila in conn.execute(f"SELECT {columnas} FROM {tabla}").fetchall()}
+        for clave in set(real) | set(guardado):
+            valor_real, valor_guardado = real.get(clave, 0), guardado.get(clave, 0)
+            if valor_real != valor_guardado:
+                diferencias.append((tabla, clave, valor_guardado, valor_real))
+    return diferencias
+
+
+@click.group('resumenes')
+def cli():
+    """Mantenimiento de los contadores del reporte resumen."""
+
+
+@cli.command('verificar')
+def verificar_command():
+    conn = get_db_connection()
+    diferencias = verificar(conn)
+    conn.close()
+    for tabla, clave, guardado, real in diferencias:
+        click.echo(f"{tabla} {clave}: guardado={guardado} real={real}")
+    if diferencias:
+        raise SystemExit(1)
+    click.echo("Los contadores coinciden con los datos.")
+
+
+@cli.command('reconstruir')
+def reconstruir_command():
+    conn = get_db_connection()
+    reconstruir(conn)
+    conn.close()
+    click.echo("Contadores reconstruidos.")
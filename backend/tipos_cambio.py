@@ -0,0 +1,236 @@
+# backend/tipos_cambio.py
+# Actualización de tipos de cambio.
+#
+# - El proveedor de tasas es intercambiable: por defecto la API de
+#   open.er-api.com, pero se puede apuntar a otra URL (un servidor local de
+#   pruebas) o a un archivo JSON con TIPOS_CAMBIO_PROVEEDOR:
+#       TIPOS_CAMBIO_PROVEEDOR=https://mi-servidor/latest/USD
+#       TIPOS_CAMBIO_PROVEEDOR=archivo:/ruta/tasas.json
+# - Las llamadas HTTP usan una sesión reutilizable con timeout y reintentos.
+# - La última tabla descargada se guarda en memoria durante TIPOS_CAMBIO_TTL
+#   segundos.
+# - Un hilo en segundo plano refresca las tasas cada TIPOS_CAMBIO_INTERVALO
+#   segundos (0 lo desactiva). Las actualizaciones corren en un único hilo
+#   de trabajo, así nunca hay dos descargas simultáneas en el mismo worker.
+# - En el modo ASGI (asgi.py) la descarga pedida por /api/exchange/update usa
+#   httpx.AsyncClient, con los mismos timeouts y reintentos.
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except ImportError:  # solo se usa en el modo ASGI
+    httpx = None
+
+from db import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+URL_POR_DEFECTO = "https://open.er-api.com/v6/latest/USD"
+TIMEOUT = (3.05, 10)  # (conexión, lectura) en segundos
+REINTENTOS = 3
+ESTADOS_REINTENTO = (429, 500, 502, 503, 504)
+TTL = int(os.environ.get('TIPOS_CAMBIO_TTL', '3600'))
+INTERVALO = int(os.environ.get('TIPOS_CAMBIO_INTERVALO', '21600'))
+
+
+class ErrorProveedor(Exception):
+    """El proveedor respondió, pero sin una tabla de tasas válida."""
+
+
+class ProveedorHTTP:
+    """Proveedor con el formato de open.er-api.com: {"result": "success", "rates": {...}}."""
+
+    def __init__(self, url=URL_POR_DEFECTO, session=None):
+        self.url = url
+        self.session = session or crear_sesion()
+        self._cliente_async = None
+
+    @staticmethod
+    def _tasas(data):
+        if data.get("result") != "success" or not isinstance(data.get("rates"), dict):
+            raise ErrorProveedor("La respuesta de la API externa no fue exitosa")
+        return data["rates"]
+
+    def obtener(self):
+        response = self.session.get(self.url, timeout=TIMEOUT)
+        response.raise_for_status()  # Lanza un error si la petición no fue exitosa (ej. 404, 500)
+        return self._tasas(response.json())
+
+    async def obtener_async(self):
+        if httpx is None:
+            return await asyncio.to_thread(self.obtener)
+        if self._cliente_async is None:
+            # El cliente queda ligado al event loop del worker que lo crea
+            self._cliente_async = httpx.AsyncClient(
+                timeout=httpx.Timeout(TIMEOUT[1], connect=TIMEOUT[0]),
+                transport=httpx.AsyncHTTPTransport(retries=REINTENTOS),  # reintenta fallas de conexión
+            )
+        for intento in range(REINTENTOS + 1):
+            response = await self._cliente_async.get(self.url)
+            if response.status_code not in ESTADOS_REINTENTO or intento == REINTENTOS:
+                break
+            await asyncio.sleep(0.5 * 2 ** intento)
+        response.raise_for_status()
+        return self._tasas(response.json())
+
+
+class ProveedorArchivo:
+    """Lee las tasas de un archivo JSON, con el mismo formato de la API o solo {"USD": 1, ...}."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+
+    def obtener(self):
+        with open(self.ruta, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data.get("rates", data)
+
+    async def obtener_async(self):
+        return await asyncio.to_thread(self.obtener)
+
+
+def crear_sesion():
+    sesion = requests.Session()
+    reintentos = Retry(total=REINTENTOS, backoff_factor=0.5, status_forcelist=ESTADOS_REINTENTO,
+                       allowed_methods=frozenset(['GET']))
+    adaptador = HTTPAdapter(max_retries=reintentos, pool_connections=1, pool_maxsize=2)
+    sesion.mount('https://', adaptador)
+    sesion.mount('http://', adaptador)
+    return sesion
+
+
+def proveedor_desde_entorno():
+    destino = os.environ.get('TIPOS_CAMBIO_PROVEEDOR', URL_POR_DEFECTO)
+    if destino.startswith('archivo:'):
+        return ProveedorArchivo(destino[len('archivo:'):])
+    return ProveedorHTTP(destino)
+
+
+def aplicar_tasas(conn, tasas):
+    """Actualiza solo las monedas que existen en la base, en un executemany.
+
+    Devuelve la cantidad de monedas actualizadas.
+    """
+    codigos = [row[0] for row in conn.execute("SELECT codigo_moneda FROM monedas").fetchall()]
+    cambios = [(tasas[codigo], codigo) for codigo in codigos if codigo in tasas]
+    conn.executemany(
+        "UPDATE monedas SET tipo_cambio = ?, ultima_actualizacion = CURRENT_TIMESTAMP WHERE codigo_moneda = ?",
+        cambios
+    )
+    conn.commit()
+    return len(cambios)
+
+
+class ActualizadorTasas:
+
+    def __init__(self, proveedor=None, ttl=TTL, al_actualizar=None):
+        self.proveedor = proveedor or proveedor_desde_entorno()
+        self.ttl = ttl
+        # Se llama después de guardar las tasas (p. ej. para invalidar cachés)
+        self.al_actualizar = al_actualizar
+        self._tasas = None
+        self._descargadas_en = 0.0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._programador = None
+        self._pid = None
+        self._descarga_async = None
+
+    def obtener_tasas(self, forzar=False):
+        """Tabla de tasas, desde la memoria si todavía no venció el TTL."""
+        with self._lock:
+            vigente = self._tasas is not None and time.monotonic() - self._descargadas_en < self.ttl
+            if vigente and not forzar:
+                return self._tasas
+        tasas = self.proveedor.obtener()
+        with self._lock:
+            self._tasas = tasas
+            self._descargadas_en = time.monotonic()
+        return tasas
+
+    async def obtener_tasas_async(self, forzar=False):
+        with self._lock:
+            vigente = self._tasas is not None and time.monotonic() - self._descargadas_en < self.ttl
+            if vigente and not forzar:
+                return self._tasas
+        # Pedidos simultáneos esperan la misma descarga
+        if self._descarga_async is None or self._descarga_async.done():
+            self._descarga_async = asyncio.ensure_future(self.proveedor.obtener_async())
+        tasas = await asyncio.shield(self._descarga_async)
+        with self._lock:
+            self._tasas = tasas
+            self._descargadas_en = time.monotonic()
+        return tasas
+
+    def guardar(self, tasas):
+        conn = get_db_connection()
+        try:
+            actualizadas = aplicar_tasas(conn, tasas)
+        finally:
+            conn.close()
+        if self.al_actualizar:
+            self.al_actualizar()
+        return actualizadas
+
+    def actualizar(self, forzar=False):
+        return self.guardar(self.obtener_tasas(forzar))
+
+    async def actualizar_async(self, ejecutar_db, forzar=False):
+        """Descarga sin bloquear el event loop; `ejecutar_db` corre el guardado en un hilo."""
+        tasas = await self.obtener_tasas_async(forzar)
+        return await ejecutar_db(self.guardar, tasas)
+
+    def _get_executor(self):
+        # Un executor por proceso: después de un fork se crea uno nuevo
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tipos-cambio')
+            self._pid = os.getpid()
+        return self._executor
+
+    def solicitar(self, forzar=False):
+        """Encola una actualización en el hilo de trabajo y devuelve su Future."""
+        return self._get_executor().submit(self.actualizar, forzar)
+
+    def _tasas_desactualizadas(self, intervalo):
+        # Con varios workers, solo descarga quien encuentre las tasas viejas.
+        # Vale la moneda más vieja: una edición manual de una sola moneda no
+        # tiene que demorar el refresco de las demás
+        conn = get_db_connection()
+        try:
+            row = conn.execute(
+                "SELECT (julianday('now') - julianday(MIN(ultima_actualizacion))) * 86400 FROM monedas"
+            ).fetchone()
+        finally:
+            conn.close()
+        return row[0] is None or row[0] >= intervalo
+
+    def iniciar_programador(self, intervalo=INTERVALO):
+        """Inicia el hilo que refresca las tasas periódicamente."""
+        if intervalo <= 0 or (self._programador is not None and self._programador.is_alive()):
+            return
+        with self._lock:
+            if self._programador is not None and self._programador.is_alive():
+                return
+            self._programador = threading.Thread(target=self._ciclo, args=(intervalo,),
+                                                 name='programador-tipos-cambio', daemon=True)
+            self._programador.start()
+
+    def _ciclo(self, intervalo):
+        while True:
+            try:
+                if self._tasas_desactualizadas(intervalo):
+                    self.solicitar().result()
+            except Exception as e:
+                logger.warning("No se pudieron actualizar los tipos de cambio: %s", e)
+            time.sleep(intervalo)
+
@@ -0,0 +1,432 @@
+# backend/totales.py
+# Totales netos a pagar (monto + impuesto - descuento) convertidos a una sola
+# moneda, para /api/reportes/totales. Se agrupan por coordinador, tipo de
+# pago, acreedor, estado, moneda de origen y tramo de vencimiento.
+#
+# Las órdenes se leen en lotes de TOTALES_LOTE filas y cada lote se procesa
+# por columnas con NumPy. La conversión es una multiplicación por el factor
+# de la moneda de origen. Las sumas por grupo son np.bincount sobre el código
+# de cada grupo, así que en Python solo se recorren los grupos distintos del
+# lote, no las filas. Sin NumPy (pip install numpy) se usa un acumulador fila
+# por fila que da el mismo resultado.
+#
+# monedas.tipo_cambio es la cantidad de esa moneda por 1 USD: un importe pasa
+# a la moneda destino multiplicado por tasa_destino / tasa_origen. Todas las
+# órdenes se convierten con las tasas vigentes al momento de la consulta.
+#
+# Con ?desde= / ?hasta= (sobre fecha_creacion) se suman también los meses
+# archivados (archivo.py), que solo tienen órdenes pagadas.
+import bisect
+import csv
+import datetime
+import io
+import json
+import math
+import os
+from operator import itemgetter
+
+from flask import Response, stream_with_context
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import archivo
+from respuestas import consultar, dumps
+
+LOTE = int(os.environ.get('TOTALES_LOTE', '50000'))
+# Hasta esta cantidad de combinaciones posibles de las dimensiones, las sumas
+# por grupo se hacen sin ordenar (un arreglo con una posición por combinación)
+COMBINACIONES_DIRECTAS = 1 << 18
+USAR_NUMPY = np is not None
+
+ESTADOS = ('Creada', 'Enviada', 'Pagada', 'Devuelta')
+
+# Dimensión de agrupación -> expresión del SELECT
+DIMENSIONES = {
+    'coordinador': "o.id_coordinador",
+    'tipo_pago': "o.id_tipo_pago",
+    'acreedor': "COALESCE(o.acreedor, '')",
+    'estado': "o.estado",
+    'moneda': "o.id_moneda",
+    'vencimiento': "julianday(o.fecha_vencimiento)",
+}
+DIMENSIONES_ENTERAS = ('coordinador', 'tipo_pago', 'moneda')
+
+# Tramos de vencimiento según los días que faltan (negativos: que pasaron)
+# desde la fecha de corte hasta fecha_vencimiento
+LIMITES_TRAMOS = (-90, -60, -30, 0, 31, 61, 91)
+TRAMOS = ('vencida_mas_90', 'vencida_61_90', 'vencida_31_60', 'vencida_1_30',
+          'vence_0_30', 'vence_31_60', 'vence_61_90', 'vence_mas_90', 'sin_fecha')
+SIN_FECHA = len(TRAMOS) - 1
+
+IMPORTES = ('monto', 'impuesto', 'descuento', 'neto')
+
+COLUMNAS_DETALLE = ('id_orden', 'fecha_creacion', 'fecha_vencimiento', 'estado', 'id_coordinador',
+                    'id_tipo_pago', 'acreedor', 'moneda_origen', 'monto', 'impuesto', 'descuento', 'neto')
+
+
+class ParametrosInvalidos(ValueError):
+    pass
+
+
+def _juliano(fecha):
+    """Día juliano de una fecha, igual que julianday('AAAA-MM-DD') de SQLite."""
+    return fecha.toordinal() + 1721424.5
+
+
+class Parametros:
+    """Parámetros del reporte leídos de la query string.
+
+    moneda (USD), agrupar=a,b (estado), estado=Creada,Enviada (todos),
+    desde / hasta (fecha_creacion) y al=AAAA-MM-DD, la fecha de corte de los
+    tramos de vencimiento (hoy).
+    """
+
+    def __init__(self, args):
+        self.moneda = (args.get('moneda') or 'USD').strip().upper()
+        agrupar = args.get('agrupar', 'estado')
+        self.agrupar = list(dict.fromkeys(d.strip() for d in agrupar.split(',') if d.strip()))
+        desconocidas = [d for d in self.agrupar if d not in DIMENSIONES]
+        if desconocidas:
+            raise ParametrosInvalidos(f"No se puede agrupar por: {', '.join(desconocidas)}")
+        estados = args.get('estado', '')
+        self.estados = list(dict.fromkeys(e.strip() for e in estados.split(',') if e.strip() and e.strip() != 'todos'))
+        invalidos = [e for e in self.estados if e not in ESTADOS]
+        if invalidos:
+            raise ParametrosInvalidos(f"Estados desconocidos: {', '.join(invalidos)}")
+        self.desde, self.hasta = archivo.rango_fechas(args)
+        try:
+            self.corte = datetime.date.fromisoformat(args['al']) if args.get('al') else datetime.date.today()
+        except ValueError:
+            raise ParametrosInvalidos("La fecha de corte debe tener el formato AAAA-MM-DD")
+
+    def sql(self, columnas, esquema, detalle=False):
+        """SELECT de `columnas` sobre ordenes_pago de `esquema` con los filtros pedidos.
+
+        Con `detalle` se agrega el código de la moneda y se ordena por id_orden.
+        """
+        where, params = [], []
+        if self.estados:
+            where.append(f"o.estado IN ({', '.join('?' * len(self.estados))})")
+            params.extend(self.estados)
+        if self.desde:
+            where.append("o.fecha_creacion >= ?")
+            params.append(self.desde)
+        if self.hasta:
+            where.append("o.fecha_creacion < ?")
+            params.append(self.hasta)
+        if esquema != 'main':
+            # Una orden que quedó en las dos bases por un archivado a medias
+            # se cuenta una sola vez, de la principal
+            where.append("NOT EXISTS (SELECT 1 FROM main.ordenes_pago p WHERE p.id_orden = o.id_orden)")
+        sql = f"SELECT {', '.join(columnas)} FROM {esquema}.ordenes_pago o"
+        if detalle:
+            sql += " LEFT JOIN main.monedas m ON m.id_moneda = o.id_moneda"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if detalle:
+            sql += " ORDER BY o.id_orden"
+        return sql, tuple(params)
+
+
+COLUMNAS_SQL_DETALLE = (
+    "o.id_orden", "o.fecha_creacion", "o.fecha_vencimiento", "o.estado", "o.id_coordinador", "o.id_tipo_pago",
+    "o.acreedor", "m.codigo_moneda", "o.id_moneda", "o.monto", "COALESCE(o.impuesto, 0)", "COALESCE(o.descuento, 0)",
+)
+
+
+def tasas(conn):
+    """{id_moneda: (codigo, tipo_cambio)} de las monedas registradas."""
+    return {fila[0]: (fila[1], fila[2])
+            for fila in conn.execute("SELECT id_moneda, codigo_moneda, tipo_cambio FROM monedas").fetchall()}
+
+
+def factores(tasas_monedas, destino):
+    """{id_moneda: factor} que convierte un importe de cada moneda a `destino`.
+
+    Las monedas sin un tipo de cambio positivo no tienen factor.
+    """
+    tasa_destino = next((tasa for codigo, tasa in tasas_monedas.values() if codigo == destino), None)
+    if not tasa_destino or tasa_destino <= 0:
+        raise ParametrosInvalidos(f"Moneda desconocida o sin tipo de cambio: {destino}")
+    return {id_moneda: tasa_destino / tasa for id_moneda, (_, tasa) in tasas_monedas.items() if tasa and tasa > 0}
+
+
+def recorrer(conn, parametros, columnas, detalle=False):
+    """Lotes de filas (tuplas) de la base principal y de los meses archivados que aplican."""
+    meses = []
+    if (parametros.desde or parametros.hasta) and (not parametros.estados or 'Pagada' in parametros.estados):
+        meses = archivo.particiones(conn, parametros.desde, parametros.hasta)
+    for mes in [None, *meses]:
+        esquema = 'main' if mes is None else archivo.adjuntar(conn, mes)
+        if esquema is None:
+            continue
+        try:
+            cursor = consultar(conn, *parametros.sql(columnas, esquema, detalle))
+            try:
+                while True:
+                    filas = cursor.fetchmany(LOTE)
+                    if not filas:
+                        break
+                    yield filas
+            finally:
+                # El cursor se cierra antes del DETACH, aunque se corte el recorrido
+                cursor.close()
+        finally:
+            if mes is not None:
+                archivo.separar(conn, esquema)
+
+
+class Acumulador:
+    """Cantidad e importes convertidos por grupo, sumados lote por lote.
+
+    Cada lote trae las columnas de las dimensiones, en el orden de
+    `dimensiones`, seguidas de id_moneda, monto, impuesto y descuento.
+    """
+
+    def __init__(self, dimensiones, factores_monedas, corte, vectorizado=USAR_NUMPY):
+        self.dimensiones = dimensiones
+        self.grupos = {}  # clave -> [cantidad, monto, impuesto, descuento, neto]
+        self.sin_tipo_cambio = 0
+        self.vectorizado = vectorizado
+        self._factores = factores_monedas
+        self._corte = _juliano(corte)
+        if vectorizado:
+            self._tabla = tabla_factores(factores_monedas)
+            # Dimensiones de texto: valor -> código, el mismo en todos los lotes
+            self._codigos_texto = {d: {} for d in dimensiones if d not in DIMENSIONES_ENTERAS}
+
+    def agregar(self, filas):
+        if self.vectorizado:
+            self._agregar_columnas(filas)
+        else:
+            self._agregar_filas(filas)
+
+    def _sumar(self, clave, cantidad, importes):
+        acumulado = self.grupos.get(clave)
+        if acumulado is None:
+            acumulado = self.grupos[clave] = [0, 0.0, 0.0, 0.0, 0.0]
+        acumulado[0] += cantidad
+        for i, importe in enumerate(importes, 1):
+            acumulado[i] += importe
+
+    def _agregar_filas(self, filas):
+        k = len(self.dimensiones)
+        for fila in filas:
+            factor = self._factores.get(fila[k])
+            if factor is None:
+                self.sin_tipo_cambio += 1
+                continue
+            clave = tuple(self._tramo(valor) if dimension == 'vencimiento' else valor
+                          for dimension, valor in zip(self.dimensiones, fila))
+            monto, impuesto, descuento = fila[k + 1] * factor, fila[k + 2] * factor, fila[k + 3] * factor
+            self._sumar(clave, 1, (monto, impuesto, descuento, monto + impuesto - descuento))
+
+    def _tramo(self, juliano):
+        if juliano is None:
+            return TRAMOS[SIN_FECHA]
+        return TRAMOS[bisect.bisect_right(LIMITES_TRAMOS, juliano - self._corte)]
+
+    def _agregar_columnas(self, filas):
+        k = len(self.dimensiones)
+        columnas = [list(map(itemgetter(j), filas)) for j in range(k + 4)]
+        factor = convertir(self._tabla, np.asarray(columnas[k], dtype=np.int64))
+        validos = ~np.isnan(factor)
+        self.sin_tipo_cambio += int(len(filas) - validos.sum())
+        importes = np.array(columnas[k + 1:k + 4], dtype=np.float64) * factor
+        importes = np.vstack([importes, importes[0] + importes[1] - importes[2]])[:, validos]
+
+        # Cada dimensión se pasa a códigos 0..n-1 y `etiquetas` traduce el código al valor
+        codigos, etiquetas = [], []
+        for dimension, columna in zip(self.dimensiones, columnas):
+            if dimension == 'vencimiento':
+                dias = np.array(columna, dtype=np.float64) - self._corte
+                codigo = np.digitize(dias, LIMITES_TRAMOS)
+                codigo[np.isnan(dias)] = SIN_FECHA
+                etiquetas.append(TRAMOS)
+            elif dimension in DIMENSIONES_ENTERAS:
+                valores, codigo = np.unique(np.asarray(columna, dtype=np.int64), return_inverse=True)
+                etiquetas.append(valores.tolist())
+            else:
+                # Los textos se codifican con un dict (por hash), más rápido que ordenarlos
+                mapa = self._codigos_texto[dimension]
+                codigo = np.fromiter((mapa.setdefault(v, len(mapa)) for v in columna),
+                                     dtype=np.int64, count=len(columna))
+                etiquetas.append(list(mapa))
+            codigos.append(codigo.ravel()[validos])
+
+        # Código único de cada grupo: los códigos de las dimensiones en base mixta.
+        # `inverso` es la posición de cada fila entre `combinaciones` y
+        # `presentes` las posiciones que aparecen en el lote.
+        tamanos = [len(e) for e in etiquetas]
+        combinaciones = math.prod(tamanos)
+        if combinaciones >= 2 ** 62:
+            grupos, inverso = np.unique(np.stack(codigos, axis=1), axis=0, return_inverse=True)
+            grupos, inverso = grupos.tolist(), inverso.ravel()
+            combinaciones = len(grupos)
+            presentes = np.arange(combinaciones)
+        else:
+            compuesto = (np.ravel_multi_index(codigos, tamanos) if codigos
+                         else np.zeros(int(validos.sum()), dtype=np.int64))
+            if combinaciones <= COMBINACIONES_DIRECTAS:
+                # Pocas combinaciones: se suma directo, sin ordenar
+                inverso = compuesto
+                presentes = claves = np.flatnonzero(np.bincount(compuesto, minlength=combinaciones))
+            else:
+                claves, inverso = np.unique(compuesto, return_inverse=True)
+                inverso = inverso.ravel()
+                combinaciones = len(claves)
+                presentes = np.arange(combinaciones)
+            grupos = list(zip(*np.unravel_index(claves, tamanos))) if codigos else [()] * len(claves)
+        cantidades = np.bincount(inverso, minlength=combinaciones)[presentes].tolist()
+        sumas = [np.bincount(inverso, weights=columna, minlength=combinaciones)[presentes].tolist()
+                 for columna in importes]
+        for g, codigo_grupo in enumerate(grupos):
+            clave = tuple(etiquetas[j][c] for j, c in enumerate(codigo_grupo))
+            self._sumar(clave, cantidades[g], [suma[g] for suma in sumas])
+
+
+def tabla_factores(factores_monedas):
+    """Arreglo indexado por id_moneda con el factor de conversión (NaN si no hay)."""
+    tabla = np.full(max(factores_monedas, default=0) + 1, np.nan)
+    for id_moneda, factor in factores_monedas.items():
+        tabla[id_moneda] = factor
+    return tabla
+
+
+def convertir(tabla, ids):
+    """Factor de cada id_moneda de `ids`; NaN para las monedas sin tipo de cambio."""
+    factor = np.full(ids.shape, np.nan)
+    dentro = (ids >= 0) & (ids < len(tabla))
+    factor[dentro] = tabla[ids[dentro]]
+    return factor
+
+
+def _nombres(conn, dimensiones, claves):
+    """Etiquetas legibles de las dimensiones que se agrupan por id (solo los ids de `claves`)."""
+    nombres = {}
+    if 'coordinador' in dimensiones:
+        posicion = dimensiones.index('coordinador')
+        ids = sorted({clave[posicion] for clave in claves})
+        nombres['coordinador'] = {fila[0]: f"{fila[1]} {fila[2]}" for fila in conn.execute(
+            "SELECT id_usuario, nombre, apellido FROM usuarios WHERE id_usuario IN (SELECT value FROM json_each(?))",
+            (json.dumps(ids),)).fetchall()}
+    if 'tipo_pago' in dimensiones:
+        nombres['tipo_pago'] = dict(conn.execute("SELECT id_tipo_pago, nombre_tipo FROM tipos_pago").fetchall())
+    return nombres
+
+
+def _campos_grupo(dimension, valor, nombres, tasas_monedas):
+    if dimension == 'coordinador':
+        return {"id_coordinador": valor, "coordinador": nombres['coordinador'].get(valor)}
+    if dimension == 'tipo_pago':
+        return {"id_tipo_pago": valor, "tipo_pago": nombres['tipo_pago'].get(valor)}
+    if dimension == 'moneda':
+        return {"moneda_origen": tasas_monedas.get(valor, (None,))[0]}
+    if dimension == 'acreedor':
+        return {"acreedor": valor or None}
+    return {dimension: valor}
+
+
+def _importes(acumulado):
+    return {"cantidad": acumulado[0], **{nombre: round(valor, 2) for nombre, valor in zip(IMPORTES, acumulado[1:])}}
+
+
+def calcular(conn, parametros, vectorizado=USAR_NUMPY):
+    """Arma el reporte de totales; ParametrosInvalidos si la moneda no existe."""
+    tasas_monedas = tasas(conn)
+    acumulador = Acumulador(parametros.agrupar, factores(tasas_monedas, parametros.moneda),
+                            parametros.corte, vectorizado)
+    columnas = [DIMENSIONES[d] for d in parametros.agrupar]
+    columnas += ["o.id_moneda", "o.monto", "COALESCE(o.impuesto, 0)", "COALESCE(o.descuento, 0)"]
+    for filas in recorrer(conn, parametros, columnas):
+        acumulador.agregar(filas)
+
+    nombres = _nombres(conn, parametros.agrupar, acumulador.grupos)
+    grupos, total = [], [0, 0.0, 0.0, 0.0, 0.0]
+    for clave, acumulado in acumulador.grupos.items():
+        grupo = {}
+        for dimension, valor in zip(parametros.agrupar, clave):
+            grupo.update(_campos_grupo(dimension, valor, nombres, tasas_monedas))
+        grupo.update(_importes(acumulado))
+        grupos.append(grupo)
+        total = [a + b for a, b in zip(total, acumulado)]
+    grupos.sort(key=lambda grupo: grupo['neto'], reverse=True)
+    return {
+        "moneda": parametros.moneda,
+        "agrupar": parametros.agrupar,
+        "corte_vencimiento": parametros.corte.isoformat(),
+        "tipos_cambio": {codigo: tasa for codigo, tasa in tasas_monedas.values()},
+        "grupos": grupos,
+        "total": _importes(total),
+        "ordenes_sin_tipo_cambio": acumulador.sin_tipo_cambio,
+    }
+
+
+def csv_grupos(reporte):
+    """Los grupos del reporte como CSV (una fila por grupo)."""
+    salida = io.StringIO()
+    encabezado = list(reporte['grupos'][0]) if reporte['grupos'] else ['cantidad', *IMPORTES]
+    escritor = csv.writer(salida)
+    escritor.writerow(encabezado)
+    escritor.writerows([grupo.get(campo) for campo in encabezado] for grupo in reporte['grupos'])
+    return salida.getvalue()
+
+
+def exportar_detalle(conn, parametros, formato):
+    """Respuesta chunked con cada orden y su neto convertido (csv o ndjson).
+
+    Se genera lote por lote, sin armar el resultado en memoria. La conexión se
+    devuelve al pool cuando termina el generador.
+    """
+    tasas_monedas = tasas(conn)
+    factores_monedas = factores(tasas_monedas, parametros.moneda)
+    tabla = tabla_factores(factores_monedas) if USAR_NUMPY else None
+    columna_convertida = f"neto_{parametros.moneda}"
+    nombres = [*COLUMNAS_DETALLE, columna_convertida]
+
+    def convertidas(filas):
+        # Filas de salida: sin id_moneda, con el neto en origen y convertido
+        if tabla is None:
+            for fila in filas:
+                neto = fila[9] + fila[10] - fila[11]
+                factor = factores_monedas.get(fila[8])
+                yield (*fila[:8], *fila[9:], round(neto, 2),
+                       None if factor is None else round(neto * factor, 2))
+            return
+        columnas = list(zip(*filas))
+        importes = np.array(columnas[9:12], dtype=np.float64)
+        neto = importes[0] + importes[1] - importes[2]
+        convertido = np.round(neto * convertir(tabla, np.asarray(columnas[8], dtype=np.int64)), 2)
+        convertido = np.where(np.isnan(convertido), None, convertido)
+        yield from zip(*columnas[:8], *columnas[9:], np.round(neto, 2).tolist(), convertido.tolist())
+
+    def generar_csv():
+        try:
+            salida = io.StringIO()
+            escritor = csv.writer(salida)
+            escritor.writerow(nombres)
+            yield salida.getvalue().encode('utf-8')
+            salida.seek(0)
+            salida.truncate()
+            for filas in recorrer(conn, parametros, COLUMNAS_SQL_DETALLE, detalle=True):
+                escritor.writerows(convertidas(filas))
+                yield salida.getvalue().encode('utf-8')
+                salida.seek(0)
+                salida.truncate()
+        finally:
+            conn.close()
+
+    def generar_ndjson():
+        try:
+            for filas in recorrer(conn, parametros, COLUMNAS_SQL_DETALLE, detalle=True):
+                yield b''.join(dumps(dict(zip(nombres, fila))) + b'\n' for fila in convertidas(filas))
+        finally:
+            conn.close()
+
+    if formato == 'ndjson':
+        return Response(stream_with_context(generar_ndjson()), mimetype='application/x-ndjson')
+    return Response(stream_with_context(generar_csv()), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename="ordenes_totales.csv"'})
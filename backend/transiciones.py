@@ -0,0 +1,75 @@
+# backend/transiciones.py
+# Cambios de estado por lote (enviar, pagar, devolver muchas órdenes a la vez).
+# Todo el lote se aplica en una transacción con un UPDATE por conjunto y las
+# inserciones de bitácora/devoluciones con executemany.
+import json
+
+# accion: (estado de origen permitido, estado destino, acción en bitácora)
+TRANSICIONES = {
+    'enviar': ('Creada', 'Enviada', 'ENVIAR_ORDEN'),
+    'pagar': ('Enviada', 'Pagada', 'PAGAR_ORDEN'),
+    'devolver': ('Enviada', 'Devuelta', 'DEVOLVER_ORDEN'),
+}
+
+MAXIMO_POR_LOTE = 5000
+
+
+def normalizar_ids(ids):
+    """Valida la lista de IDs recibida y quita duplicados conservando el orden."""
+    if not isinstance(ids, list) or not ids:
+        raise ValueError("Se requiere una lista de órdenes")
+    if len(ids) > MAXIMO_POR_LOTE:
+        raise ValueError(f"Máximo {MAXIMO_POR_LOTE} órdenes por lote")
+    try:
+        return list(dict.fromkeys(int(i) for i in ids))
+    except (TypeError, ValueError):
+        raise ValueError("Los IDs de orden deben ser números")
+
+
+def aplicar_lote(conn, accion, ids, id_usuario, motivo=None):
+    """Aplica la transición `accion` a las órdenes de `ids`.
+
+    Solo cambian las órdenes que están en el estado de origen; el resto se
+    devuelve en `omitidas` con el motivo. Devuelve (procesadas, omitidas).
+    """
+    origen, destino, accion_bitacora = TRANSICIONES[accion]
+    ids_json = json.dumps(ids)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        estados = dict(conn.execute(
+            "SELECT id_orden, estado FROM ordenes_pago WHERE id_orden IN (SELECT value FROM json_each(?))",
+            (ids_json,)
+        ).fetchall())
+        procesadas = [i for i in ids if estados.get(i) == origen]
+
+        set_extra = ", fecha_pago_real = CURRENT_DATE" if destino == 'Pagada' else ""
+        conn.execute(
+            f"""UPDATE ordenes_pago SET estado = ?{set_extra}, fecha_ultima_modificacion = CURRENT_TIMESTAMP
+                WHERE estado = ? AND id_orden IN (SELECT value FROM json_each(?))""",
+            (destino, origen, json.dumps(procesadas))
+        )
+        if destino == 'Devuelta':
+            conn.executemany(
+                "INSERT INTO devoluciones (id_orden, motivo, id_analista) VALUES (?, ?, ?)",
+                [(i, motivo, id_usuario) for i in procesadas]
+            )
+            detalles = f'Motivo: {motivo}'
+        else:
+            detalles = None
+        conn.executemany(
+            "INSERT INTO bitacora (id_usuario_accion, accion, detalles, id_orden_afectada) VALUES (?, ?, ?, ?)",
+            [(id_usuario, accion_bitacora, detalles, i) for i in procesadas]
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    omitidas = []
+    for i in ids:
+        if i not in estados:
+            omitidas.append({"id_orden": i, "motivo": "La orden no existe"})
+        elif estados[i] != origen:
+            omitidas.append({"id_orden": i, "motivo": f"La orden está en estado '{estados[i]}', se requiere '{origen}'"})
+    return procesadas, omitidas